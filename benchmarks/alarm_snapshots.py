@@ -0,0 +1,85 @@
+"""
+Compares the cost of snapshotting alarms before each processed event: a deepcopy of the alarm for every event, against the copy-on-write
+view used by the Orchestrator. Run from the repository root with the package installed:
+
+    python -m benchmarks.alarm_snapshots
+"""
+import argparse
+import timeit
+from copy import deepcopy
+from datetime import datetime, timedelta
+
+from alarm_system.src.core.snapshot import CopyOnWriteAlarm
+
+
+def make_alarm(history_size: int) -> dict:
+    """
+    an alarm carrying nested custom state, like the ones history-dependent processors keep
+    """
+    return {
+        "plant_name": "plant",
+        "event_name": "event",
+        "id_alarm": 1,
+        "last_alarm": datetime(2024, 1, 1),
+        "last_event": datetime(2024, 1, 1),
+        "flag_alarm": False,
+        "type_alarm": "threshold",
+        "threshold": 0.5,
+        "history": [{"timestamp": datetime(2024, 1, 1) + timedelta(minutes=idx), "value": idx / history_size} for idx in range(history_size)],
+        "settings": {"reminder_threshold": 60, "channels": ["email", "sms"]},
+    }
+
+
+def threshold_processor(alarm, event) -> bool:
+    """
+    reads scalar fields only, and triggers when the event value reaches the alarm threshold
+    """
+    triggered = event["value"] >= alarm["threshold"]
+    alarm["flag_alarm"] = triggered
+    alarm["last_event"] = event["timestamp"]
+    return triggered
+
+
+def run_deepcopy(alarm: dict, events: list) -> int:
+    notified = 0
+    for event in events:
+        alarm_before_event = deepcopy(alarm)
+        if threshold_processor(alarm, event):
+            notified += alarm_before_event is not None
+    return notified
+
+
+def run_copy_on_write(alarm: dict, events: list) -> int:
+    notified = 0
+    for event in events:
+        working_alarm = CopyOnWriteAlarm(alarm)
+        triggered = threshold_processor(working_alarm, event)
+        if triggered:
+            alarm_before_event = dict(alarm)
+            notified += alarm_before_event is not None
+        working_alarm.commit()
+    return notified
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10_000, help="events processed per run")
+    parser.add_argument("--history", type=int, default=50, help="entries of nested history stored in the alarm")
+    parser.add_argument("--trigger-every", type=int, default=100, help="one in this many events triggers a notification")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per strategy, the best one is reported")
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 2)
+    events = [{"timestamp": start + timedelta(seconds=idx), "value": 1.0 if idx % args.trigger_every == 0 else 0.0} for idx in range(args.events)]
+
+    results = {}
+    for name, run in [("deepcopy", run_deepcopy), ("copy-on-write", run_copy_on_write)]:
+        best = min(timeit.repeat(lambda: run(make_alarm(args.history), events), number=1, repeat=args.repeat))
+        results[name] = best
+        print(f"{name:>14}: {best * 1000:9.2f} ms  ({args.events / best:,.0f} events/s)")
+
+    print(f"{'speedup':>14}: {results['deepcopy'] / results['copy-on-write']:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
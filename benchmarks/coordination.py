@@ -0,0 +1,194 @@
+"""
+Runs several alarm system instances as separate processes against one local mongod, splitting the alarms through leases, and checks that
+every triggered event is notified once. Instances join one after the other, so partitions are rebalanced while events keep arriving:
+
+    python -m benchmarks.coordination --url mongodb://localhost:27017 --instances 3
+    python -m benchmarks.coordination --url mongodb://localhost:27017 --instances 3 --kill
+
+With --kill, one instance is killed halfway through, and the others claim its alarms once its leases expire. Events it processed after its last
+flush are processed again by the new owners, so a few duplicate notifications are expected in that case. The database is dropped first
+"""
+import argparse
+import logging
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Set, Tuple, Union
+
+from pymongo import MongoClient
+
+from alarm_system import EventProcessor, MongoDBConnector, MongoDBCoordinator, Orchestrator
+from alarm_system.interfaces import INotifier
+from alarm_system.types import Alarm, Event, Plant, PlantContacts
+
+from .scenarios import threshold_processor
+from .standins import InMemoryConnector
+from .synthetic import generate_system
+
+
+Notification = Tuple[str, str, str]
+"""
+id of the alarm, timestamp of the event and message label of a notification
+"""
+
+
+class RecordingNotifier(INotifier):
+    """
+    sends every notification to the parent process instead of delivering it
+    """
+
+    def __init__(self, instance_id: str, notifications: "multiprocessing.Queue", logger: logging.Logger) -> None:
+        self.instance_id = instance_id
+        self.notifications = notifications
+        self.logger = logger
+        self.sent: List[Notification] = []
+
+    def notify_trigger(self, alarm: Alarm, plant: Plant, contacts: PlantContacts, event: Event, message_label: Union[str, bool]) -> bool:
+        notification = (str(alarm["id_alarm"]), event["timestamp"].isoformat(), str(message_label))
+        self.sent.append(notification)
+
+        if self.notifications is not None:
+            self.notifications.put((self.instance_id, notification))
+
+        return True
+
+
+def connector_config(url: str, db_name: str):
+    return {
+        "url": url,
+        "db_name": db_name,
+        "alarm_collection": "alarms",
+        "plant_collection": "plants",
+        "event_collection": "events",
+        "contacts_collection": "contacts",
+        "poll_interval": 1,
+    }
+
+
+def run_instance(url: str, db_name: str, instance_id: str, seconds: float, lease_ttl: float, notifications: "multiprocessing.Queue") -> None:
+    """
+    run an instance continuously for the given number of seconds
+    """
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s {instance_id} %(message)s")
+    logger = logging.getLogger(instance_id)
+
+    connector = MongoDBConnector(connector_config(url, db_name), logger)
+    processor = EventProcessor(logger)
+    processor.register_processor("threshold", threshold_processor)
+
+    orchestrator = Orchestrator(connector, processor, RecordingNotifier(instance_id, notifications, logger), logger)
+    coordinator = MongoDBCoordinator(connector.client[db_name]["alarm_leases"], logger, instance_id=instance_id, partitions=16, lease_ttl=lease_ttl)
+    orchestrator.enable_coordination(coordinator)
+
+    stop = threading.Event()
+    threading.Timer(seconds, stop.set).start()
+    orchestrator.run_forever(flush_interval=1.0, stop=stop)
+
+
+def expected_notifications(system) -> Set[Notification]:
+    """
+    notifications of a single instance processing every event
+    """
+    logger = logging.getLogger("benchmarks")
+    processor = EventProcessor(logger)
+    processor.register_processor("threshold", threshold_processor)
+
+    notifier = RecordingNotifier("expected", None, logger)
+    Orchestrator(InMemoryConnector(system), processor, notifier, logger).execute()
+
+    return set(notifier.sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="alarm_system_coordination")
+    parser.add_argument("--instances", type=int, default=3)
+    parser.add_argument("--alarms", type=int, default=300)
+    parser.add_argument("--events", type=int, default=30_000)
+    parser.add_argument("--seconds", type=float, default=40.0, help="seconds every instance runs for")
+    parser.add_argument("--stagger", type=float, default=5.0, help="seconds between instance starts")
+    parser.add_argument("--lease-ttl", type=float, default=6.0)
+    parser.add_argument("--kill", action="store_true", help="kill the first instance halfway through")
+    args = parser.parse_args()
+
+    system = generate_system(args.alarms, args.events, threshold=0.95)
+    # mongodb keeps timestamps to the millisecond, so the expected notifications are computed with the same timestamps
+    for event in system.events:
+        event["timestamp"] = event["timestamp"].replace(microsecond=event["timestamp"].microsecond // 1000 * 1000)
+    events = sorted(system.events, key=lambda event: event["timestamp"])
+
+    client = MongoClient(args.url)
+    client.drop_database(args.db_name)
+    database = client[args.db_name]
+    database["alarms"].insert_many([dict(alarm) for alarm in system.alarms])
+    database["plants"].insert_many([dict(plant) for plant in system.plants])
+    database["contacts"].insert_many([dict(contact) for contact in system.contacts])
+    MongoDBConnector(connector_config(args.url, args.db_name), logging.getLogger("benchmarks")).ensure_event_index()
+
+    # half of the events are pending when the first instance starts, the rest arrive while instances join
+    half = len(events) // 2
+    database["events"].insert_many([dict(event) for event in events[:half]])
+
+    context = multiprocessing.get_context("spawn")
+    notifications = context.Queue()
+    instances = []
+    for idx in range(args.instances):
+        instance = context.Process(target=run_instance, args=(args.url, args.db_name, f"instance-{idx}", args.seconds, args.lease_ttl, notifications))
+        instances.append(instance)
+
+    started = time.monotonic()
+    arriving = events[half:]
+    chunk = max(1, len(arriving) // int(args.stagger * args.instances + 1))
+
+    for idx, instance in enumerate(instances):
+        instance.start()
+
+        # new events keep arriving until every instance has joined
+        deadline = time.monotonic() + args.stagger
+        while time.monotonic() < deadline:
+            if arriving:
+                database["events"].insert_many([dict(event) for event in arriving[:chunk]])
+                arriving = arriving[chunk:]
+            time.sleep(1)
+
+    if arriving:
+        database["events"].insert_many([dict(event) for event in arriving])
+
+    if args.kill:
+        time.sleep(max(0.0, args.seconds / 2 - (time.monotonic() - started)))
+        print("killing instance-0")
+        instances[0].kill()
+
+    received: List[Tuple[str, Notification]] = []
+    while any(instance.is_alive() for instance in instances) or not notifications.empty():
+        try:
+            received.append(notifications.get(timeout=1))
+        except queue.Empty:
+            continue
+
+    for instance in instances:
+        instance.join()
+
+    expected = expected_notifications(system)
+    counts = Counter(notification for _, notification in received)
+    duplicates = sum(count - 1 for count in counts.values())
+    missing = expected - set(counts)
+    unexpected = set(counts) - expected
+
+    for instance_id, amount in sorted(Counter(instance_id for instance_id, _ in received).items()):
+        print(f"{instance_id}: {amount} notifications")
+
+    owners = Counter(lease.get("owner") for lease in database["alarm_leases"].find({"kind": "partition"}))
+    print(f"partition owners at the end: {dict(owners)}")
+    print(f"expected {len(expected)} notifications, received {len(received)}: {len(missing)} missing, {len(unexpected)} unexpected, {duplicates} duplicated")
+
+    if missing or unexpected or (duplicates and not args.kill):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Runs Orchestrator.execute over synthetic data, with local stand-ins for mongodb, the mail server and the sms gateway, and reports
+throughput, processor and notification latency percentiles, and peak memory. Every scenario runs in its own process, so peak memory
+is not shared between scenarios. Run from the repository root with the package installed:
+
+    python -m benchmarks.scenarios --scale small
+    python -m benchmarks.scenarios --scale medium --scenario batch streaming --save-baseline baseline.json
+    python -m benchmarks.scenarios --scale medium --scenario batch streaming --compare baseline.json
+
+When comparing, the command exits with an error if any scenario is slower or uses more memory than the baseline, beyond the tolerance
+"""
+import argparse
+import json
+import logging
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+from alarm_system import EventNotifier, EventProcessor, Metrics, NotificationQueue, Orchestrator, RingBuffer, SlidingAggregate, SlidingCounter
+from alarm_system.types import Alarm, Event, Plant
+
+from .standins import InMemoryConnector, LocalMailer, LocalSFTPPool, LocalSMSGateway, LocalSMTPServer
+from .synthetic import generate_system
+
+
+SCALES = {
+    "small": (100, 100_000),
+    "medium": (1_000, 1_000_000),
+    "large": (10_000, 10_000_000),
+}
+"""
+number of alarms and events of each scale
+"""
+
+SCENARIOS = ["batch", "streaming", "parallel", "notification-queue", "attachment-cache", "smtp-pool", "windows"]
+"""
+batch: events loaded in memory, then processed. streaming: events read one alarm at a time. parallel: batch over 4 process workers.
+notification-queue: batch, with notifications delivered by 4 background workers. attachment-cache: notification-queue, with attachments
+prefetched into a local cache. smtp-pool: attachment-cache without the notification queue, with emails built and sent to a local smtp
+server over pooled connections. windows: batch, with a sliding counter, a sliding aggregate and a ring buffer kept for every alarm
+"""
+
+LATENCY_BUCKETS = tuple(1e-6 * 1.1 ** idx for idx in range(200))
+"""
+histogram buckets from 1 microsecond to about 3 minutes, 10% apart, so percentiles are estimated within 10%
+"""
+
+WINDOWS = [
+    SlidingCounter("recent", timedelta(minutes=10)),
+    SlidingAggregate("percentage", "event_percentage", timedelta(hours=1)),
+    RingBuffer("last_percentages", 10, "event_percentage"),
+]
+"""
+windows kept for every alarm in the windows scenario
+"""
+
+BenchmarkResult = Dict[str, Any]
+
+
+def threshold_processor(alarm: Alarm, event: Event, logger: logging.Logger):
+    """
+    notifies when the event percentage crosses the alarm threshold, and sends a reminder every reminder_minutes while it stays over it
+    """
+    triggered = event["event_percentage"] >= alarm["threshold"]
+    was_active = alarm["flag_alarm"]
+    alarm["flag_alarm"] = triggered
+
+    if not triggered:
+        return False
+
+    if not was_active:
+        alarm["last_alarm"] = event["timestamp"]
+        return "activation"
+
+    if (event["timestamp"] - alarm["last_alarm"]).total_seconds() >= alarm["settings"]["reminder_minutes"] * 60:
+        alarm["last_alarm"] = event["timestamp"]
+        return "reminder"
+
+    return False
+
+
+def threshold_message(alarm: Alarm, event: Event, plant: Plant, message_label, logger: logging.Logger) -> str:
+    return f"{message_label}: {alarm['event_name']} at {plant['plant_name_proper']} reached {event['event_percentage']:.2f} at {event['timestamp']}"
+
+
+def run_scenario(scenario: str, scale: str, repeat: int, skew: float, mail_latency: float, sms_latency: float, sftp_latency: float, seed: int) -> BenchmarkResult:
+    """
+    generate the data of a scale and run a scenario over it repeat times. Throughput and latencies are taken from the fastest run
+    """
+    logger = logging.getLogger("benchmarks")
+    alarms, events = SCALES[scale]
+
+    system = generate_system(alarms, events, skew=skew, seed=seed)
+    connector = InMemoryConnector(system)
+
+    runs: List[Tuple[float, Metrics, int]] = []
+
+    with LocalSMSGateway(latency=sms_latency) as gateway, LocalSMTPServer(latency=mail_latency) as smtp_server, tempfile.TemporaryDirectory() as cache_dir:
+        for _ in range(repeat):
+            metrics = Metrics(logger, buckets=LATENCY_BUCKETS)
+
+            processor = EventProcessor(logger, metrics=metrics)
+            processor.register_processor("threshold", threshold_processor, windows=WINDOWS if scenario == "windows" else None)
+
+            notifier_config = {"sender_email": "alarms@example.com", "sender_password": "", "sender_sms": "alarms", "token_sms": "", "pemfile_sms": "", "sms_url": gateway.url}
+            notifier = EventNotifier(notifier_config, logger, metrics=metrics)
+            notifier.mailer = LocalMailer(latency=mail_latency)
+            for message_label in ("activation", "reminder"):
+                notifier.register_message_builder("threshold", threshold_message, message_label=message_label)
+
+            orchestrator = Orchestrator(connector, processor, notifier, logger, metrics=metrics)
+
+            if scenario == "parallel":
+                orchestrator.enable_parallel_processing(4, executor="process")
+
+            if scenario in ("attachment-cache", "smtp-pool"):
+                # every run downloads its attachments again
+                notifier.enable_attachment_cache(tempfile.mkdtemp(dir=cache_dir))
+                notifier.attachment_cache.pools["default"] = LocalSFTPPool(latency=sftp_latency)
+
+            if scenario == "smtp-pool":
+                notifier.enable_smtp_pool("127.0.0.1", smtp_server.port, security="none")
+
+            if scenario in ("notification-queue", "attachment-cache"):
+                orchestrator.notifier = NotificationQueue(notifier, logger, workers=4, metrics=metrics)
+
+            smtp_messages = smtp_server.messages
+            start = time.perf_counter()
+            orchestrator.execute(streaming=scenario == "streaming")
+            elapsed = time.perf_counter() - start
+
+            if scenario in ("notification-queue", "attachment-cache"):
+                orchestrator.notifier.close()
+
+            if notifier.attachment_cache is not None:
+                notifier.attachment_cache.close()
+
+            if isinstance(notifier.mailer, LocalMailer):
+                runs.append((elapsed, metrics, notifier.mailer.sent))
+            else:
+                notifier.mailer.close()
+                runs.append((elapsed, metrics, smtp_server.messages - smtp_messages))
+
+    elapsed, metrics, notifications = min(runs, key=lambda run: run[0])
+
+    # ru_maxrss is in kilobytes on linux, and in bytes on macos
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+    return {
+        "scenario": scenario,
+        "scale": scale,
+        "alarms": alarms,
+        "events": events,
+        "seconds": elapsed,
+        "events_per_second": events / elapsed,
+        "processor_p50_us": metrics.quantile("processor_latency_seconds", 0.5, type_alarm="threshold") * 1e6,
+        "processor_p99_us": metrics.quantile("processor_latency_seconds", 0.99, type_alarm="threshold") * 1e6,
+        "notify_p50_us": metrics.quantile("notify_trigger_seconds", 0.5) * 1e6,
+        "notify_p99_us": metrics.quantile("notify_trigger_seconds", 0.99) * 1e6,
+        "notifications": notifications,
+        "peak_rss_mb": peak_rss / 2 ** 20,
+    }
+
+
+def compare(results: List[BenchmarkResult], baseline: Dict[str, BenchmarkResult], tolerance: float) -> List[str]:
+    """
+    :returns: a description of every scenario that is slower or uses more memory than its baseline, beyond the tolerance
+    """
+    regressions = []
+
+    for result in results:
+        key = f"{result['scenario']}/{result['scale']}"
+
+        try:
+            expected = baseline[key]
+        except KeyError:
+            print(f"{key}: no baseline")
+            continue
+
+        throughput_change = result["events_per_second"] / expected["events_per_second"] - 1
+        memory_change = result["peak_rss_mb"] / expected["peak_rss_mb"] - 1
+        print(f"{key}: throughput {throughput_change:+.1%}, peak rss {memory_change:+.1%}")
+
+        if throughput_change < -tolerance:
+            regressions.append(f"{key} throughput dropped {-throughput_change:.1%}")
+
+        if memory_change > tolerance:
+            regressions.append(f"{key} peak rss grew {memory_change:.1%}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--scenario", choices=SCENARIOS, nargs="+", default=SCENARIOS)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the fastest one is reported")
+    parser.add_argument("--skew", type=float, default=1.1, help="zipf exponent of the per-plant event distribution")
+    parser.add_argument("--mail-latency", type=float, default=0.0, help="seconds every email takes to be sent")
+    parser.add_argument("--sms-latency", type=float, default=0.0, help="seconds the sms gateway takes to answer")
+    parser.add_argument("--sftp-latency", type=float, default=0.0, help="seconds every attachment takes to be downloaded")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", metavar="PATH", help="store the results as the baseline to compare against")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results against a stored baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change allowed before a difference is reported as a regression")
+    args = parser.parse_args()
+
+    results: List[BenchmarkResult] = []
+
+    for scenario in args.scenario:
+        # a fresh process per scenario, so peak memory only accounts for that scenario
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_scenario, scenario, args.scale, args.repeat, args.skew, args.mail_latency, args.sms_latency, args.sftp_latency, args.seed).result()
+
+        results.append(result)
+        print(
+            f"{scenario:>18} {args.scale}: {result['seconds']:8.2f} s  {result['events_per_second']:12,.0f} events/s  "
+            f"processor p50/p99 {result['processor_p50_us']:7.1f}/{result['processor_p99_us']:7.1f} us  "
+            f"notify p50/p99 {result['notify_p50_us']:8.1f}/{result['notify_p99_us']:8.1f} us  "
+            f"{result['notifications']:6} emails  peak rss {result['peak_rss_mb']:7.1f} MB"
+        )
+
+    if args.save_baseline:
+        baseline: Dict[str, BenchmarkResult] = {}
+        try:
+            with open(args.save_baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            pass
+
+        # results of other scenarios and scales are kept
+        baseline.update({f"{result['scenario']}/{result['scale']}": result for result in results})
+
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+
+        if regressions:
+            print("regressions found:\n" + "\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
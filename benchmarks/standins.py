@@ -0,0 +1,288 @@
+"""
+Local stand-ins for the services the alarm system talks to: an in-memory connector instead of mongodb, and local replacements for the
+mail server, the smtp server, the sftp servers and the sms gateway. Each of them can simulate the latency of the service it replaces, so benchmarks
+measure the alarm system itself and not the network
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from alarm_system.interfaces import IStreamingConnector
+from alarm_system.types import Alarm, AlarmUpdateResult, Event, Plant, PlantContacts
+
+from .synthetic import SyntheticSystem
+
+
+class InMemoryConnector(IStreamingConnector):
+    """
+    serves a synthetic system from memory. Every run starts from the alarms as they were generated, so runs can be repeated
+    """
+
+    def __init__(self, system: SyntheticSystem, *, write_latency: float = 0.0) -> None:
+        """
+        :param write_latency: seconds every alarm update takes, to simulate the database round trips
+        """
+        self.system = system
+        self.write_latency = write_latency
+        self.updated_alarms: List[Alarm] = []
+
+        # events are indexed and sorted once, so streaming runs do not pay for what a database index would do
+        self.events_by_alarm: Dict[Tuple[str, str], List[Event]] = {}
+        for event in system.events:
+            self.events_by_alarm.setdefault((event["event_name"], event["plant_name"]), []).append(event)
+
+        for alarm_events in self.events_by_alarm.values():
+            alarm_events.sort(key=lambda event: event["timestamp"])
+
+    def load_system_metadata(self) -> Tuple[List[Alarm], List[Plant], List[PlantContacts]]:
+        return deepcopy(self.system.alarms), self.system.plants, self.system.contacts
+
+    def load_system_data(self) -> Tuple[List[Alarm], List[Plant], List[PlantContacts], List[Event]]:
+        alarms, plants, contacts = self.load_system_metadata()
+        return alarms, plants, contacts, self.system.events
+
+    def stream_alarm_events(self, alarm: Alarm) -> Iterable[Event]:
+        alarm_events = self.events_by_alarm.get((alarm["event_name"], alarm["plant_name"]), [])
+        return (event for event in alarm_events if event["timestamp"] > alarm["last_event"])
+
+    def update_system_alarms(self, alarms: List[Alarm]) -> AlarmUpdateResult:
+        if self.write_latency:
+            time.sleep(self.write_latency * len(alarms))
+
+        self.updated_alarms = alarms
+        return {"updated": len(alarms), "unchanged": 0, "failed": 0}
+
+
+class LocalMailer():
+    """
+    replaces the mailer of an EventNotifier. Emails are counted instead of sent
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """
+        :param latency: seconds every email takes to be sent
+        """
+        self.latency = latency
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send_email(self, to: List[str], subject: str, body: str, attachments: Dict[str, str]) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.sent += 1
+
+    def enable_sftp(self, host: str, sftp_user: str, sftp_pass: str, sftp_pk_path: str, label: str = "default") -> bool:
+        return True
+
+
+class LocalSFTPClient():
+    """
+    answers get calls by writing a file of a fixed size, after waiting the simulated transfer time
+    """
+
+    def __init__(self, file_size: int, latency: float) -> None:
+        self.file_size = file_size
+        self.latency = latency
+
+    def get(self, remote_path: str, local_path: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+        with open(local_path, "wb") as local_file:
+            local_file.write(os.urandom(self.file_size))
+
+
+class LocalSFTPPool():
+    """
+    replaces the sftp pool of an AttachmentCache server:
+
+        cache.pools["default"] = LocalSFTPPool()
+    """
+
+    def __init__(self, *, file_size: int = 200 * 1024, latency: float = 0.0) -> None:
+        """
+        :param file_size: size in bytes of every downloaded file
+        :param latency: seconds every download takes
+        """
+        self.client = LocalSFTPClient(file_size, latency)
+        self.downloads = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[LocalSFTPClient]:
+        with self._lock:
+            self.downloads += 1
+
+        yield self.client
+
+    def close(self) -> None:
+        pass
+
+
+class LocalSMSGateway():
+    """
+    http server accepting sms requests on localhost, so the SMSAlert session, retries and connection pool are exercised. Use as a context manager
+    and pass its url as the sms_url config key
+    """
+
+    def __init__(self, latency: float = 0.0, statuses: Iterable[int] = ()) -> None:
+        """
+        :param latency: seconds the gateway takes to answer every request
+        :param statuses: status codes of the first answers, as when the gateway is unavailable. Later requests are accepted
+        """
+        self.latency = latency
+        self.statuses = list(statuses)
+        self.requests = 0
+        self.payloads: List[Any] = []
+        self._lock = threading.Lock()
+
+        gateway = self
+
+        class GatewayHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, which stalls keep-alive connections on delayed acks otherwise
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+
+                if gateway.latency:
+                    time.sleep(gateway.latency)
+
+                with gateway._lock:
+                    gateway.requests += 1
+                    gateway.payloads.append(payload)
+                    status = gateway.statuses.pop(0) if gateway.statuses else 200
+
+                self.send_response(status)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), GatewayHandler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/rest/mtsms"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="sms-gateway", daemon=True)
+
+    def __enter__(self) -> "LocalSMSGateway":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LocalSMTPServer():
+    """
+    smtp server on localhost accepting every message, so the smtp connection pool of the notifier can be exercised without a mail provider.
+    Use as a context manager, and enable the smtp pool on its port with security="none"
+    """
+
+    def __init__(self, latency: float = 0.0, session_latency: float = 0.0) -> None:
+        """
+        :param latency: seconds the server takes to accept every message
+        :param session_latency: seconds the server takes to greet every new connection, standing in for the TLS handshake and login
+        """
+        self.latency = latency
+        self.session_latency = session_latency
+        self.sessions = 0
+        self.messages = 0
+        self.recipients = 0
+        # data of the last messages accepted, as sent by the client
+        self.received: "deque[bytes]" = deque(maxlen=100)
+        self._open_sockets: Set[socket.socket] = set()
+        self._lock = threading.Lock()
+
+        server = self
+
+        class SMTPHandler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def handle(self) -> None:
+                with server._lock:
+                    server.sessions += 1
+                    server._open_sockets.add(self.connection)
+
+                try:
+                    self._serve()
+                finally:
+                    with server._lock:
+                        server._open_sockets.discard(self.connection)
+
+            def _serve(self) -> None:
+                if server.session_latency:
+                    time.sleep(server.session_latency)
+
+                self.wfile.write(b"220 localhost ready\r\n")
+
+                for line in self.rfile:
+                    command = line[:4].upper()
+
+                    if command == b"EHLO":
+                        self.wfile.write(b"250-localhost\r\n250 8BITMIME\r\n")
+                    elif command == b"RCPT":
+                        with server._lock:
+                            server.recipients += 1
+                        self.wfile.write(b"250 ok\r\n")
+                    elif command == b"DATA":
+                        self.wfile.write(b"354 end data with <CR><LF>.<CR><LF>\r\n")
+                        data: List[bytes] = []
+                        for data_line in self.rfile:
+                            if data_line == b".\r\n":
+                                break
+                            # lines starting with a dot are sent with an extra one
+                            data.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+
+                        if server.latency:
+                            time.sleep(server.latency)
+
+                        with server._lock:
+                            server.messages += 1
+                            server.received.append(b"".join(data))
+                        self.wfile.write(b"250 ok\r\n")
+                    elif command == b"QUIT":
+                        self.wfile.write(b"221 bye\r\n")
+                        return
+                    elif command in (b"HELO", b"MAIL", b"RSET", b"NOOP"):
+                        self.wfile.write(b"250 ok\r\n")
+                    else:
+                        self.wfile.write(b"502 not implemented\r\n")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPHandler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="smtp-server", daemon=True)
+
+    def __enter__(self) -> "LocalSMTPServer":
+        self._thread.start()
+        return self
+
+    def disconnect(self) -> None:
+        """
+        close every open session, as servers do with sessions idle for too long
+        """
+        with self._lock:
+            open_sockets = list(self._open_sockets)
+
+        for open_socket in open_sockets:
+            try:
+                open_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                continue
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
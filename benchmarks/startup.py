@@ -0,0 +1,98 @@
+"""
+Measures how long the alarm system takes to start, in fresh interpreters, as scheduled runs pay it every time. Run from the repository
+root with the package installed:
+
+    python -m benchmarks.startup --repeat 20
+
+Reports the median time to start an interpreter, to import alarm_system, and to create an AlarmSystem, which imports pymongo but does not
+connect yet. Then lists the modules that take longest to import on their own, as reported by python -X importtime
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import alarm_system
+
+
+CONFIG = {
+    "url": "mongodb://localhost:27017", "db_name": "alarm_system", "alarm_collection": "alarms", "plant_collection": "plants",
+    "event_collection": "events", "contacts_collection": "contacts", "sender_email": "alarms@example.com", "sender_password": "",
+    "sender_sms": "", "token_sms": "", "pemfile_sms": "",
+}
+
+STAGES = {
+    "interpreter": "pass",
+    "import alarm_system": "import alarm_system",
+    "create AlarmSystem": f"import alarm_system; alarm_system.AlarmSystem({CONFIG!r})",
+}
+"""
+code run by every stage. Each stage includes the previous ones
+"""
+
+
+def environment() -> Dict[str, str]:
+    """
+    environment of the measured interpreters, which import the same alarm_system as this one
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(alarm_system.__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    return env
+
+
+def time_code(code: str, repeat: int) -> float:
+    """
+    median wall time, in seconds, of running code in a new interpreter
+    """
+    env = environment()
+    timings: List[float] = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=env, check=True)
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings)
+
+
+def slowest_imports(code: str, top: int) -> List[Tuple[int, int, str]]:
+    """
+    modules imported by code that take longest on their own
+    :returns: self and cumulative import time in microseconds, and name of each module
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=environment(), check=True, capture_output=True, text=True)
+
+    imports: List[Tuple[int, int, str]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(self_us), int(cumulative_us), name.strip()))
+
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports listed")
+    args = parser.parse_args()
+
+    previous = 0.0
+    for stage, code in STAGES.items():
+        elapsed = time_code(code, args.repeat)
+        print(f"{stage:>22}: {elapsed * 1000:8.1f} ms  (+{(elapsed - previous) * 1000:.1f} ms)")
+        previous = elapsed
+
+    print("\nslowest imports when creating an AlarmSystem:")
+    for self_us, cumulative_us, name in slowest_imports(STAGES["create AlarmSystem"], args.top):
+        print(f"{self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+
+if __name__ == "__main__":
+    main()
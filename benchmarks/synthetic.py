@@ -0,0 +1,141 @@
+"""
+Generates synthetic alarm system data at configurable scales: plants, contacts, alarms and events. Events are spread over plants following
+a zipf-like distribution, so a few plants record most of the events, as happens in production.
+
+    python -m benchmarks.synthetic --alarms 10000 --events 10000000
+"""
+import argparse
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Iterator, List
+
+from alarm_system.types import Alarm, Event, Plant, PlantContacts
+
+
+START = datetime(2024, 1, 1)
+"""
+timestamp of the first synthetic event. Alarms start with a last event just before it, so every event is new
+"""
+
+
+@dataclass
+class SyntheticSystem:
+    alarms: List[Alarm]
+    plants: List[Plant]
+    contacts: List[PlantContacts]
+    events: List[Event] = field(default_factory=list)
+
+
+def plant_weights(plants: int, skew: float) -> List[float]:
+    """
+    relative number of events of each plant. With skew 0 every plant gets the same share, and the higher the skew the more events
+    go to the first plants
+    """
+    return [1 / (rank ** skew) for rank in range(1, plants + 1)]
+
+
+def generate_metadata(alarms: int, plants: int, *, alarm_type: str = "threshold", threshold: float = 0.99, seed: int = 0) -> SyntheticSystem:
+    """
+    generate plants, their contacts and alarms. Alarms are split evenly over plants, and each alarm of a plant watches a different event name
+    :param threshold: event value over which threshold alarms trigger
+    """
+    rng = random.Random(seed)
+    plants = min(plants, alarms)
+
+    plant_list: List[Plant] = [
+        {"plant_name": f"plant_{idx}", "plant_name_proper": f"Plant {idx}", "events": []} for idx in range(plants)
+    ]
+    contacts: List[PlantContacts] = [
+        {"plant_name": plant["plant_name"], "email_contacts": [f"operator_{idx}@example.com"], "phone_contacts": [34600000000 + idx]}
+        for idx, plant in enumerate(plant_list)
+    ]
+
+    alarm_list: List[Alarm] = []
+    for idx in range(alarms):
+        plant = plant_list[idx % plants]
+        event_name = f"event_{idx // plants}"
+        plant["events"].append(event_name)
+
+        alarm_list.append({
+            "id_alarm": idx,
+            "plant_name": plant["plant_name"],
+            "event_name": event_name,
+            "type_alarm": alarm_type,
+            "last_alarm": START - timedelta(days=1),
+            "last_event": START - timedelta(seconds=1),
+            "flag_alarm": False,
+            "threshold": threshold,
+            # some alarms carry nested state, like the ones history-dependent processors keep
+            "settings": {"reminder_minutes": rng.choice([30, 60, 120]), "channels": ["email", "sms"]},
+        })
+
+    return SyntheticSystem(alarm_list, plant_list, contacts)
+
+
+def generate_events(system: SyntheticSystem, events: int, *, skew: float = 1.1, seconds: int = 86400, seed: int = 0) -> Iterator[Event]:
+    """
+    generate events for the alarms of a system, over the given number of seconds after START. Events are yielded in random timestamp order,
+    like a connector would return them from several queries
+    :param skew: zipf exponent of the per-plant event distribution
+    """
+    rng = random.Random(seed)
+
+    alarms_by_plant = {}
+    for alarm in system.alarms:
+        alarms_by_plant.setdefault(alarm["plant_name"], []).append(alarm)
+
+    plant_names = [plant["plant_name"] for plant in system.plants]
+    cumulative_weights = list(accumulate(plant_weights(len(plant_names), skew)))
+
+    # plants are drawn in chunks, as a single choices call is much faster than one call per event
+    chunk_size = 10_000
+    for chunk_start in range(0, events, chunk_size):
+        chunk_plants = rng.choices(plant_names, cum_weights=cumulative_weights, k=min(chunk_size, events - chunk_start))
+
+        for idx, plant_name in enumerate(chunk_plants, start=chunk_start):
+            alarm = rng.choice(alarms_by_plant[plant_name])
+
+            yield {
+                "plant_name": plant_name,
+                "event_name": alarm["event_name"],
+                "timestamp": START + timedelta(seconds=rng.random() * seconds),
+                "event_percentage": rng.random(),
+                "ftp_inference": f"/images/{plant_name}/{idx}_inference.jpg",
+                "ftp_original": f"/images/{plant_name}/{idx}_original.jpg",
+            }
+
+
+def generate_system(alarms: int, events: int, *, plants: int = 0, skew: float = 1.1, threshold: float = 0.99, seed: int = 0) -> SyntheticSystem:
+    """
+    generate a whole system, with its events held in memory
+    :param plants: number of plants. By default, one plant every 10 alarms
+    """
+    system = generate_metadata(alarms, plants or max(1, alarms // 10), threshold=threshold, seed=seed)
+    system.events = list(generate_events(system, events, skew=skew, seed=seed))
+    return system
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alarms", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--plants", type=int, default=0, help="by default, one plant every 10 alarms")
+    parser.add_argument("--skew", type=float, default=1.1, help="zipf exponent of the per-plant event distribution")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    system = generate_system(args.alarms, args.events, plants=args.plants, skew=args.skew, seed=args.seed)
+
+    events_by_plant = {}
+    for event in system.events:
+        events_by_plant[event["plant_name"]] = events_by_plant.get(event["plant_name"], 0) + 1
+
+    busiest = sorted(events_by_plant.values(), reverse=True)
+    print(f"{len(system.alarms)} alarms, {len(system.plants)} plants, {len(system.events)} events")
+    print(f"busiest plant: {busiest[0]} events, top 10% of plants: {sum(busiest[:max(1, len(busiest) // 10)]) / len(system.events):.0%} of events")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,32 @@
+import importlib
 import logging
-from typing import Dict, Literal, Union
+import threading
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Literal, Optional, Union
 
 from . import types
 
 from .src.processor.event_processor import EventProcessor
+from .src.processor.windows import RingBuffer, SlidingAggregate, SlidingCounter, Window
 
 from .src.notifier.event_notifier import EventNotifier
+from .src.notifier.notification_queue import NotificationQueue
+from .src.notifier.attachments import DEFAULT_CACHE_SIZE
+from .src.notifier.collector import CollectingNotifier
+from .src.notifier.outbox import FileOutbox, OutboxNotifier
+from .src.notifier.types import SMTPSecurity
 
-from .src.connector.mongodb_connector import MongoDBConnector
+from .src.connector.types import DEFAULT_LEASE_TTL, DEFAULT_PARTITIONS
 from .src.core.orchestrator import Orchestrator
+from .src.core.metrics import Metrics
+from .src.core.interfaces.exporter import IMetricsExporter
+from .src.core.interfaces.notifier import INotifier
+
+from .src.exporter.jsonl_exporter import JSONLinesExporter
+
+if TYPE_CHECKING:
+    from .src.connector.mongodb_connector import MongoDBConnector
+    from .src.exporter.prometheus_exporter import PrometheusFileExporter, PrometheusHTTPExporter
 
 __version__ = "0.1.0"
 
@@ -16,7 +34,26 @@ __version__ = "0.1.0"
 This module contains the alarm system default implementation, as well as interfaces to build a custom one. More information in the README file
 """
 
-AlarmSystemConfig = Dict[Literal["url", "db_name", "alarm_collection", "plant_collection", "event_collection", "contacts_collection", "sender_email", "sender_password", "sender_sms", "token_sms", "pemfile_sms"], str]
+# components whose dependencies take long to import (pymongo, http.server) are imported the first time they are used, so short runs
+# and tools that do not need them start faster
+_LAZY_EXPORTS = {
+    "MongoDBConnector": ".src.connector.mongodb_connector",
+    "MongoDBCoordinator": ".src.connector.mongodb_coordinator",
+    "PrometheusFileExporter": ".src.exporter.prometheus_exporter",
+    "PrometheusHTTPExporter": ".src.exporter.prometheus_exporter",
+}
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name = _LAZY_EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+    return getattr(importlib.import_module(module_name, __name__), name)
+
+
+AlarmSystemConfig = Dict[Literal["url", "db_name", "alarm_collection", "plant_collection", "event_collection", "contacts_collection", "stream_batch_size", "event_query_batch_size", "event_fields", "alarm_write_batch_size", "max_pool_size", "metadata_ttl", "poll_interval", "compact_events", "sender_email", "sender_password", "sender_sms", "token_sms", "pemfile_sms", "sms_url", "sms_timeout", "sms_batch_size"], Union[str, int, float, bool, List[str]]]
 
 class AlarmSystem():
     """
@@ -24,49 +61,248 @@ class AlarmSystem():
     """
     def __init__(self, config: AlarmSystemConfig, logger: logging.Logger = logging.Logger(__name__)):
         self.logger = logger
+        # every part records its metrics in the same registry
+        self.metrics = Metrics(self.logger)
 
-        processor = EventProcessor(self.logger)
+        processor = EventProcessor(self.logger, metrics=self.metrics)
 
         connector_config_keys = ["url", "db_name", "alarm_collection", "plant_collection", "event_collection", "contacts_collection"]
         connector_config = {key: config[key] for key in connector_config_keys}
-        connector = MongoDBConnector(connector_config, self.logger)
+        # optional keys are only forwarded when present, so the connector can fall back to its defaults
+        connector_optional_keys = ["stream_batch_size", "event_query_batch_size", "event_fields", "alarm_write_batch_size", "max_pool_size", "metadata_ttl", "poll_interval", "compact_events"]
+        connector_config.update({key: config[key] for key in connector_optional_keys if key in config})
+
+        from .src.connector.mongodb_connector import MongoDBConnector
+        connector = MongoDBConnector(connector_config, self.logger, metrics=self.metrics)
 
         notifier_config_keys = ["sender_email", "sender_password", "sender_sms", "token_sms", "pemfile_sms"]
         notifier_config = {key: config[key] for key in notifier_config_keys}
-        notifier = EventNotifier(notifier_config, logger)
+        notifier_optional_keys = ["sms_url", "sms_timeout", "sms_batch_size"]
+        notifier_config.update({key: config[key] for key in notifier_optional_keys if key in config})
+        notifier = EventNotifier(notifier_config, logger, metrics=self.metrics)
+        # the orchestrator notifier may be wrapped later on, so the default notifier is kept to configure it
+        self.notifier = notifier
+        # notifier that delivers notifications, wrapped by the notification queue if enabled
+        self.delivery_notifier: INotifier = notifier
 
-        self.orchestrator = Orchestrator(connector, processor, notifier, self.logger)
+        self.orchestrator = Orchestrator(connector, processor, notifier, self.logger, metrics=self.metrics)
 
         self.logger.info(f"AlarmSystem created")
 
 
-    def execute(self):
+    def execute(self, streaming: bool = False, profile: Optional[str] = None):
         """
         execute the alarm system
+        :param streaming: read and process events one alarm at a time instead of loading every event in memory first
+        :param profile: profile the run with cProfile and save the stats to this path
+        """
+        self.orchestrator.execute(streaming=streaming, profile=profile)
+
+
+    def has_new_events(self) -> bool:
         """
-        self.orchestrator.execute()
+        whether any alarm has events to process, checked without loading them. Scheduled runs can skip execute when there are none
+        """
+        return self.orchestrator.connector.has_new_events()
+
+
+    def run_forever(self, flush_interval: float = 30.0, stop: Optional[threading.Event] = None, metadata_interval: float = 300.0):
+        """
+        keep the alarm system running, notifying events as soon as they are recorded
+        :param flush_interval: seconds between alarm state updates in remote
+        :param stop: event used to stop the system from another thread. If not provided, the system runs until interrupted
+        :param metadata_interval: seconds between reloads of alarms, plants and contacts. 0 disables reloading
+        """
+        self.orchestrator.run_forever(flush_interval=flush_interval, stop=stop, metadata_interval=metadata_interval)
+
+
+    def replay(self, start: datetime, end: datetime, *, alarm_filter: Optional[Callable[[types.Alarm], bool]] = None, chunk: Optional[timedelta] = None,
+               warmup: timedelta = timedelta(0), initial_state: Optional[Dict[str, Any]] = None, workers: int = 4,
+               executor: Literal["thread", "process"] = "thread", build_messages: bool = True) -> List[types.CollectedNotification]:
+        """
+        dry run of the events recorded after start and up to end, to try new or changed processors and message builders on past events.
+        Nothing is sent and alarm state is not updated in remote
+        :param alarm_filter: function telling whether an alarm is replayed. Every alarm is replayed if None
+        :param chunk: split the history of every alarm into chunks of this length, replayed in parallel. Alarms are replayed whole if None
+        :param warmup: time before every chunk processed only to bring the alarm state up to date, without reporting its triggers
+        :param initial_state: alarm fields set before replaying, such as {"flag_alarm": False}. Alarms start from their current state otherwise
+        :param workers: number of workers replaying alarms and chunks in parallel
+        :param executor: "thread" or "process". Process workers require picklable processor functions
+        :param build_messages: build the message of every notification with the registered message builders
+        :returns: the notifications that would have been sent, sorted by event timestamp
+        """
+        sink = CollectingNotifier(self.logger, self.notifier.message_builder_dispatcher if build_messages else None)
+
+        self.orchestrator.replay(start, end, sink, alarm_filter=alarm_filter, chunk=chunk, warmup=warmup, initial_state=initial_state, workers=workers, executor=executor)
+
+        return sorted(sink.collected, key=lambda notification: notification["timestamp"])
 
 
-    def register_processor(self, alarm_type: str, processor_func: types.AlarmProcessor) -> None:
+    def enable_parallel_processing(self, workers: int, *, executor: Literal["thread", "process"] = "thread", shard_by: Literal["plant_name", "id_alarm"] = "plant_name") -> None:
+        """
+        process alarms in a pool of workers, sharded by plant or alarm. Notifications are sent in the same order as sequential execution
+        :param workers: number of workers. 0 or 1 disables parallel processing
+        :param executor: "thread" or "process". Process workers require picklable processor functions
+        :param shard_by: alarm key that decides which alarms are processed by the same worker
+        """
+        self.orchestrator.enable_parallel_processing(workers, executor=executor, shard_by=shard_by)
+
+
+    def enable_checkpoints(self, every_events: int = 0, every_seconds: float = 0.0, *, outbox_path: Optional[str] = None) -> None:
+        """
+        persist alarm state every every_events events or every_seconds seconds during a run, instead of only at the end, so a crash only
+        reprocesses the events after the last checkpoint
+        :param outbox_path: file where delivered notifications are recorded, so notifications of reprocessed events are not sent again
+        """
+        outbox = None
+        if outbox_path is not None:
+            outbox = FileOutbox(outbox_path, self.logger)
+            self.delivery_notifier = OutboxNotifier(self.notifier, outbox, self.logger, metrics=self.metrics)
+
+            if isinstance(self.orchestrator.notifier, NotificationQueue):
+                # notifications are recorded once delivered by the queue workers, not when queued
+                self.orchestrator.notifier.notifier = self.delivery_notifier
+            else:
+                self.orchestrator.notifier = self.delivery_notifier
+
+        self.orchestrator.enable_checkpoints(every_events, every_seconds, outbox=outbox)
+
+
+    def enable_coordination(self, lease_collection: str = "alarm_leases", *, partitions: int = DEFAULT_PARTITIONS, lease_ttl: float = DEFAULT_LEASE_TTL, partition_by: Literal["plant_name", "id_alarm"] = "plant_name", instance_id: Optional[str] = None) -> None:
+        """
+        split the alarms with other instances running against the same database, through leases stored in lease_collection. Each instance
+        only loads, processes and notifies the alarms of the partitions it leases
+        :param partitions: number of partitions the alarms are split into. Must be the same for every instance
+        :param lease_ttl: seconds after which the alarms of an instance that stopped without leaving are claimed by others
+        :param partition_by: alarm key hashed to find the partition of an alarm. Must be the same for every instance
+        :param instance_id: name of this instance, unique among the running ones. Generated by default
+        """
+        from .src.connector.mongodb_coordinator import MongoDBCoordinator
+
+        connector: MongoDBConnector = self.orchestrator.connector
+        lease_collection = connector.client[connector.config['db_name']][lease_collection]
+
+        coordinator = MongoDBCoordinator(lease_collection, self.logger, instance_id=instance_id, partitions=partitions, lease_ttl=lease_ttl, partition_by=partition_by, metrics=self.metrics)
+        self.orchestrator.enable_coordination(coordinator)
+
+
+    def leave(self) -> None:
+        """
+        give up the alarms owned by this instance, so other instances claim them right away instead of waiting for the leases to expire.
+        Called when run_forever stops, and after a run of the alarm-system command
+        """
+        if self.orchestrator.coordinator is not None:
+            self.orchestrator.coordinator.leave()
+
+
+    def ensure_event_index(self) -> str:
+        """
+        create the event index the connector relies on to query new events efficiently
+        """
+        connector: MongoDBConnector = self.orchestrator.connector
+        return connector.ensure_event_index()
+
+
+    def register_processor(self, alarm_type: str, processor_func: types.AlarmProcessor, fields: Optional[List[str]] = None, windows: Optional[List[Window]] = None) -> None:
         """
         register a processor function to be used for a given alarm type
+        :param fields: event fields the function reads, so the rest can be left out of compact events
+        :param windows: RingBuffer, SlidingCounter and SlidingAggregate windows kept for every alarm of the type, which the function can read
         """
         processor: EventProcessor = self.orchestrator.processor
-        processor.register_processor(alarm_type, processor_func)
+        processor.register_processor(alarm_type, processor_func, fields=fields, windows=windows)
+
+
+    def register_batch_processor(self, alarm_type: str, processor_func: types.BatchAlarmProcessor, fields: List[str]) -> None:
+        """
+        register a function that processes all pending events of an alarm at once, as numpy columns, for a given alarm type
+        :param fields: numeric event fields passed to the function, besides the timestamp
+        """
+        processor: EventProcessor = self.orchestrator.processor
+        processor.register_batch_processor(alarm_type, processor_func, fields)
 
 
     def register_message_builder(self, alarm_type: str, message_builder_func: types.MessageBuilder, *, message_label: Union[str, bool]=True) -> None:
         """
         register a message builder to be used for a given alarm type
         """
-        notifier: EventNotifier = self.orchestrator.notifier
+        notifier = self.notifier
         notifier.register_message_builder(alarm_type, message_builder_func, message_label=message_label)
 
 
     def enable_sftp(self, host: str, sftp_user: str, sftp_pass: str, sftp_pk_path: str, label: str="default") -> bool:
         """
         enables sftp connection for file attachments
+        :param label: with the attachment cache, files of alarms whose sftp_label field is label are downloaded from this server
+        """
+        notifier = self.notifier
+
+        return notifier.enable_sftp(host, sftp_user, sftp_pass, sftp_pk_path, label=label)
+
+
+    def enable_attachment_cache(self, cache_dir: str, *, max_bytes: int = DEFAULT_CACHE_SIZE, workers: int = 4, pool_size: int = 2) -> None:
+        """
+        download attachments into a size-bounded local cache. Downloads start ahead of time only when the notification queue is enabled.
+        Must be called before enable_sftp
+        """
+        self.notifier.enable_attachment_cache(cache_dir, max_bytes=max_bytes, workers=workers, pool_size=pool_size)
+
+
+    def enable_smtp_pool(self, host: str, port: int = 587, *, security: SMTPSecurity = "starttls", pool_size: int = 2, max_idle: float = 30.0) -> None:
+        """
+        send emails over a pool of persistent smtp connections instead of opening a session per email. Call after enable_attachment_cache
+        """
+        self.notifier.enable_smtp_pool(host, port, security=security, pool_size=pool_size, max_idle=max_idle)
+
+
+    def enable_notification_queue(self, workers: int = 4, max_size: int = 1000, retries: int = 3, backoff: float = 1.0, channel_limits: Optional[Dict[Literal["email", "sms"], int]] = None) -> None:
+        """
+        deliver notifications from a pool of background workers, so processing does not wait for slow mail or sms servers
+        :param workers: number of threads delivering notifications
+        :param max_size: maximum number of pending notifications. Processing blocks while the queue is full
+        :param retries: number of times a failed notification is retried, with exponential backoff starting at backoff seconds
+        :param channel_limits: maximum number of notifications sent at the same time through each channel ("email", "sms")
         """
-        notifier: EventNotifier = self.orchestrator.notifier
+        for channel, max_concurrency in (channel_limits or {}).items():
+            self.notifier.limit_channel(channel, max_concurrency)
 
-        return notifier.enable_sftp(host, sftp_user, sftp_pass, sftp_pk_path, label=label)
\ No newline at end of file
+        if isinstance(self.orchestrator.notifier, NotificationQueue):
+            self.orchestrator.notifier.close()
+
+        self.orchestrator.notifier = NotificationQueue(self.delivery_notifier, self.logger, workers=workers, max_size=max_size, retries=retries, backoff=backoff, metrics=self.metrics)
+
+
+    def coalesce_notifications(self, window: float, *, alarm_type: Optional[str] = None, plant_name: Optional[str] = None, message_label: Optional[Union[str, bool]] = None) -> None:
+        """
+        merge notifications of the same alarm triggered within window seconds into a digest. Omitted filters match any value
+        """
+        self.notifier.coalesce_notifications(window, alarm_type=alarm_type, plant_name=plant_name, message_label=message_label)
+
+
+    def rate_limit_recipients(self, max_notifications: int, per_seconds: float) -> None:
+        """
+        limit every recipient to max_notifications notifications every per_seconds seconds
+        """
+        self.notifier.rate_limit_recipients(max_notifications, per_seconds)
+
+
+    def notification_stats(self) -> types.NotificationStats:
+        """
+        number of notifications sent, merged into digests, and recipient deliveries suppressed by rate limits
+        """
+        return dict(self.notifier.stats)
+
+
+    def add_metrics_exporter(self, exporter: IMetricsExporter) -> None:
+        """
+        publish the metrics after every run, and periodically while running continuously. See PrometheusFileExporter, PrometheusHTTPExporter
+        and JSONLinesExporter
+        """
+        self.metrics.add_exporter(exporter)
+
+
+    def metrics_snapshot(self) -> types.MetricsSnapshot:
+        """
+        stage durations, processor latencies, event and trigger counts, notification results and queue depth recorded since the system was created
+        """
+        return self.metrics.snapshot()
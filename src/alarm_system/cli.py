@@ -0,0 +1,155 @@
+"""
+Command line entry point, meant for runs started by cron or another scheduler:
+
+    alarm-system --config /etc/alarm_system.json --setup my_alarms:setup
+    python -m alarm_system --config /etc/alarm_system.toml --setup my_alarms:setup --streaming
+
+Config keys are read from a json or toml file, and from ALARM_SYSTEM_<KEY> environment variables, which take precedence. The setup function
+receives the AlarmSystem before it runs, to register processors and message builders and enable optional features. When no alarm has new
+events, the run stops right after checking, without loading plants, contacts or events
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, get_args
+
+from . import AlarmSystem, AlarmSystemConfig
+
+
+ENV_PREFIX = "ALARM_SYSTEM_"
+"""
+prefix of the environment variables holding config keys, such as ALARM_SYSTEM_URL or ALARM_SYSTEM_SENDER_EMAIL
+"""
+
+CONFIG_KEYS: List[str] = list(get_args(get_args(AlarmSystemConfig)[0]))
+"""
+config keys read from the environment
+"""
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _names(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+ENV_CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    "stream_batch_size": int,
+    "event_query_batch_size": int,
+    "alarm_write_batch_size": int,
+    "max_pool_size": int,
+    "sms_batch_size": int,
+    "metadata_ttl": float,
+    "poll_interval": float,
+    "sms_timeout": float,
+    "compact_events": _flag,
+    "event_fields": _names,
+}
+"""
+conversion of the config keys that are not strings, from the value of their environment variable. Lists are comma separated
+"""
+
+
+def load_config(path: Optional[str], environ: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    """
+    read the config from a json or toml file, if any, and override it with the config keys set in the environment
+    :param path: config file. Files ending in .toml are read as toml, the rest as json
+    """
+    config: Dict[str, Any] = {}
+
+    if path is not None:
+        if path.endswith(".toml"):
+            # tomllib is part of the standard library since python 3.11, older versions need the tomli package it comes from
+            try:
+                import tomllib
+            except ImportError:
+                try:
+                    import tomli as tomllib
+                except ImportError:
+                    raise ValueError("toml config files need python 3.11 or the tomli package, install alarm_system[toml] or use a json file") from None
+
+            with open(path, "rb") as config_file:
+                config = tomllib.load(config_file)
+        else:
+            with open(path) as config_file:
+                config = json.load(config_file)
+
+    for key in CONFIG_KEYS:
+        value = environ.get(ENV_PREFIX + key.upper())
+        if value is not None:
+            config[key] = ENV_CONVERTERS.get(key, str)(value)
+
+    return config
+
+
+def load_setup(reference: str) -> Callable[[AlarmSystem], Any]:
+    """
+    find the setup function given as "module:function"
+    """
+    module_name, _, function_name = reference.partition(":")
+    if not module_name or not function_name:
+        raise ValueError(f"setup must be given as module:function, got {reference!r}")
+
+    # console scripts do not look for modules in the working directory, unlike python -m
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    started = time.perf_counter()
+
+    parser = argparse.ArgumentParser(prog="alarm-system", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default=os.environ.get(f"{ENV_PREFIX}CONFIG"), help=f"json or toml config file. Defaults to ${ENV_PREFIX}CONFIG")
+    parser.add_argument("--setup", default=os.environ.get(f"{ENV_PREFIX}SETUP"), help=f"module:function called with the AlarmSystem before running. Defaults to ${ENV_PREFIX}SETUP")
+    parser.add_argument("--streaming", action="store_true", help="read and process events one alarm at a time")
+    parser.add_argument("--force", action="store_true", help="run even if no alarm has new events")
+    parser.add_argument("--profile", help="profile the run with cProfile and save the stats to this path")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logger = logging.getLogger("alarm_system")
+
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        parser.error(f"could not read config file {args.config}: {e}")
+
+    try:
+        alarm_system = AlarmSystem(config, logger)
+    except KeyError as e:
+        key = str(e.args[0])
+        parser.error(f"missing config key {key}. Set it in the config file or as {ENV_PREFIX}{key.upper()}")
+
+    if args.setup:
+        try:
+            setup = load_setup(args.setup)
+        except (ImportError, AttributeError, ValueError) as e:
+            parser.error(f"could not load setup function {args.setup}: {e}")
+
+        setup(alarm_system)
+
+    if not args.force and not alarm_system.has_new_events():
+        logger.info(f"no new events, stopping after {time.perf_counter() - started:.3f} s")
+        return 0
+
+    try:
+        alarm_system.execute(streaming=args.streaming, profile=args.profile)
+    finally:
+        # the process exits after a single run, so its alarms are given up right away instead of staying leased until the leases expire
+        alarm_system.leave()
+
+    logger.info(f"run finished in {time.perf_counter() - started:.3f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
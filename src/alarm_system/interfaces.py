@@ -1,3 +1,6 @@
-from .src.core.interfaces.connector import IConnector
+from .src.core.interfaces.connector import IConnector, IStreamingConnector, IWatchingConnector
 from .src.core.interfaces.notifier import INotifier
-from .src.core.interfaces.processor import IProcessor
\ No newline at end of file
+from .src.core.interfaces.processor import IProcessor
+from .src.core.interfaces.exporter import IMetricsExporter
+from .src.core.interfaces.outbox import INotificationOutbox
+from .src.core.interfaces.coordinator import ICoordinator
\ No newline at end of file
@@ -0,0 +1,88 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Sequence, Tuple
+
+
+class _Missing:
+    """
+    value of the fields a document did not have. Pickled by name, so it is still the same object in worker processes
+    """
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __reduce__(self) -> str:
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+class EventSchema:
+    """
+    fields kept by compact events, shared by every event read with the same projection
+    """
+    __slots__ = ("fields", "positions")
+
+    def __init__(self, fields: Sequence[str]) -> None:
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self.positions: Dict[str, int] = {field: position for position, field in enumerate(self.fields)}
+
+    def __reduce__(self):
+        return EventSchema, (self.fields,)
+
+    def record(self, document: Dict[str, Any]) -> "CompactEvent":
+        """
+        keep the schema fields of a decoded document, dropping the rest
+        """
+        return CompactEvent(self, tuple(document.get(field, MISSING) for field in self.fields))
+
+
+class CompactEvent(Mapping):
+    """
+    Read-only event holding its values in a tuple, next to a schema shared by every event. Takes a fraction of the memory of a dict, and supports
+    the same read access processors and message builders use: event["field"], event.get("field"), "field" in event, iteration and dict(event)
+    """
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema: EventSchema, values: Tuple[Any, ...]) -> None:
+        self._schema = schema
+        self._values = values
+
+    def __reduce__(self):
+        # the schema is pickled once for every event sharing it, as pickle keeps track of the objects already written
+        return CompactEvent, (self._schema, self._values)
+
+    def __getitem__(self, field: str) -> Any:
+        try:
+            value = self._values[self._schema.positions[field]]
+        except KeyError:
+            raise KeyError(field) from None
+
+        if value is MISSING:
+            raise KeyError(field)
+
+        return value
+
+    def get(self, field: str, default: Any = None) -> Any:
+        try:
+            value = self._values[self._schema.positions[field]]
+        except KeyError:
+            return default
+
+        return default if value is MISSING else value
+
+    def __contains__(self, field: object) -> bool:
+        try:
+            return self._values[self._schema.positions[field]] is not MISSING  # type: ignore
+        except (KeyError, TypeError):
+            return False
+
+    def __iter__(self) -> Iterator[str]:
+        return (field for field, value in zip(self._schema.fields, self._values) if value is not MISSING)
+
+    def __len__(self) -> int:
+        return sum(1 for value in self._values if value is not MISSING)
+
+    def __repr__(self) -> str:
+        return f"CompactEvent({dict(self)!r})"
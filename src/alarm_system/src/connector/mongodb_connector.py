@@ -1,68 +1,575 @@
 import logging
+import threading
+import time
+from copy import deepcopy
 from datetime import datetime
-from typing import List, Tuple
-from ..core.interfaces.connector import IConnector
-from ..core.types import Alarm, Event, Plant, PlantContacts
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from ..core.interfaces.connector import IWatchingConnector
+from ..core.metrics import Metrics
+from ..core.snapshot import WINDOW_STATE_FIELD
+from ..core.types import Alarm, AlarmUpdateResult, Event, Plant, PlantContacts
+from .compact_event import EventSchema
 
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.change_stream import ChangeStream
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 
 from ..connector.types import ConnectorConfig as Config
 
 
-class MongoDBConnector(IConnector):
+DEFAULT_STREAM_BATCH_SIZE = 1000
+"""
+number of events fetched per round trip when streaming events from mongodb
+"""
+
+DEFAULT_EVENT_QUERY_BATCH_SIZE = 500
+"""
+maximum number of alarms whose events are requested in a single query when loading all new events
+"""
+
+REQUIRED_EVENT_FIELDS = ["plant_name", "event_name", "timestamp", "ftp_inference", "ftp_original"]
+"""
+event fields used by the orchestrator and the notifier. Always included when events are projected
+"""
+
+DEFAULT_ALARM_WRITE_BATCH_SIZE = 1000
+"""
+maximum number of alarm updates sent in a single bulk write
+"""
+
+DEFAULT_MAX_POOL_SIZE = 10
+"""
+maximum number of pooled connections kept by the connector client
+"""
+
+DEFAULT_METADATA_TTL = 0
+"""
+seconds plants and contacts are cached for. By default they are reloaded on every run
+"""
+
+DEFAULT_POLL_INTERVAL = 5
+"""
+seconds between event queries when watching events without change streams
+"""
+
+EVENT_INDEX_KEYS = [("event_name", ASCENDING), ("plant_name", ASCENDING), ("timestamp", ASCENDING)]
+"""
+compound index the event queries rely on
+"""
+
+
+class MongoDBConnector(IWatchingConnector):
     config: Config
+    persisted_alarms: Dict[Any, Alarm]
 
-    def __init__(self, config: Config, logger: logging.Logger) -> None:
+    def __init__(self, config: Config, logger: logging.Logger, metrics: Optional[Metrics] = None) -> None:
         self.logger = logger
         self.logger.debug(f"setting up MongoDBLoader with config: {config}")
         self.config = config
+        self.metrics = metrics or Metrics(self.logger)
+        # last known remote state of each alarm, indexed by id_alarm. Used to write only the fields that changed
+        self.persisted_alarms = {}
 
-    def load_system_data(self) -> Tuple[List[Alarm], List[Plant], List[PlantContacts], List[Event]]:
-        mongo_db = MongoClient(self.config['url'])[self.config['db_name']]
+        self._client: Optional[MongoClient] = None
+        self._client_lock = threading.Lock()
+
+        self._metadata_cache: Optional[Tuple[List[Plant], List[PlantContacts]]] = None
+        self._metadata_loaded_at = 0.0
+        self._metadata_lock = threading.Lock()
+        self._metadata_watcher: Optional[threading.Thread] = None
+        self._stop_metadata_watcher = threading.Event()
+
+        # event fields declared by the processor, and the schema of compact events built from them
+        self._processor_fields: Optional[List[str]] = None
+        self._event_schema: Optional[EventSchema] = None
+
+        # alarms processed by the caller, when it does not process every alarm
+        self._alarm_filter: Optional[Callable[[Alarm], bool]] = None
+
+        # configured event fields are enough to read compact events, even before the processor declares its own
+        if self.config.get('compact_events') and 'event_fields' in self.config:
+            self._event_schema = EventSchema(self._event_fields())  # type: ignore
+
+    @property
+    def client(self) -> MongoClient:
+        """
+        long-lived client shared by every operation of the connector. Created on first use
+        """
+        with self._client_lock:
+            if self._client is None:
+                max_pool_size = int(self.config.get('max_pool_size', DEFAULT_MAX_POOL_SIZE))
+                self.logger.debug(f"connecting to mongodb with a pool of {max_pool_size} connections")
+                self._client = MongoClient(self.config['url'], maxPoolSize=max_pool_size)
+
+            return self._client
+
+    def _database(self) -> Database:
+        return self.client[self.config['db_name']]
+
+    def close(self) -> None:
+        """
+        stop watching metadata changes and close the connections to mongodb. The connector reconnects if it is used again
+        """
+        self.stop_watching_metadata()
+
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def load_system_metadata(self) -> Tuple[List[Alarm], List[Plant], List[PlantContacts]]:
+        mongo_db = self._database()
 
         alarm_collection = mongo_db[self.config['alarm_collection']]
-        plant_collection = mongo_db[self.config['plant_collection']]
-        event_collection = mongo_db[self.config['event_collection']]
-        contacts_collection = mongo_db[self.config['contacts_collection']]
 
         self.logger.debug(f"collecting alarms from mongodb")
-        alarms: List[Alarm] = [alarm for alarm in alarm_collection.find()]
+        with self.metrics.timer("mongodb_query_seconds", collection="alarms"):
+            alarms: List[Alarm] = [alarm for alarm in alarm_collection.find()]
         self.logger.debug(f"collected alarms: {len(alarms)}")
 
-        self.logger.debug(f"collecting plants from mongodb")
-        plants: List[Plant] = [plant for plant in plant_collection.find()]
-        self.logger.debug(f"collected plants: {len(plants)}")
+        if self._alarm_filter is not None:
+            alarms = [alarm for alarm in alarms if self._alarm_filter(alarm)]
+            self.logger.debug(f"processing {len(alarms)} of the collected alarms")
 
-        self.logger.debug(f"collecting contacts from mongodb")
-        contacts: List[PlantContacts] = [contact for contact in contacts_collection.find()]
-        self.logger.debug(f"collected contacts for plants: {len(contacts)}")
+        self.persisted_alarms = {alarm['id_alarm']: deepcopy(alarm) for alarm in alarms}
 
-        events: List[Event] = []
-        # get only newer events
         for alarm in alarms:
-            self.logger.debug(f"collecting latest {alarm['event_name']} events")
-
             try:
                 alarm['last_event']
             except KeyError:
                 self.logger.warning(f"alarm {alarm['event_name']} has no recorded last event. Collecting entire collection...")
                 alarm['last_event'] = datetime.min
 
+        plants, contacts = self._load_plant_metadata()
+
+        return alarms, plants, contacts
+
+    def _load_plant_metadata(self) -> Tuple[List[Plant], List[PlantContacts]]:
+        """
+        load plants and contacts, or reuse the cached ones if they are still valid
+        """
+        ttl = float(self.config.get('metadata_ttl', DEFAULT_METADATA_TTL))
+
+        with self._metadata_lock:
+            watching = self._metadata_watcher is not None and self._metadata_watcher.is_alive()
+            # while changes are being watched, the cache stays valid until a change invalidates it
+            cache_valid = self._metadata_cache is not None and (watching or time.monotonic() - self._metadata_loaded_at < ttl)
+
+            if cache_valid:
+                self.logger.debug(f"using cached plants and contacts")
+                self.metrics.increment("metadata_cache_hits_total")
+                return self._metadata_cache
+
+        mongo_db = self._database()
+
+        plant_collection = mongo_db[self.config['plant_collection']]
+        contacts_collection = mongo_db[self.config['contacts_collection']]
+
+        self.logger.debug(f"collecting plants from mongodb")
+        with self.metrics.timer("mongodb_query_seconds", collection="plants"):
+            plants: List[Plant] = [plant for plant in plant_collection.find()]
+        self.logger.debug(f"collected plants: {len(plants)}")
+
+        self.logger.debug(f"collecting contacts from mongodb")
+        with self.metrics.timer("mongodb_query_seconds", collection="contacts"):
+            contacts: List[PlantContacts] = [contact for contact in contacts_collection.find()]
+        self.logger.debug(f"collected contacts for plants: {len(contacts)}")
+
+        with self._metadata_lock:
+            self._metadata_cache = (plants, contacts)
+            self._metadata_loaded_at = time.monotonic()
+
+        return plants, contacts
+
+    def invalidate_metadata_cache(self) -> None:
+        """
+        discard cached plants and contacts, so they are reloaded on the next run
+        """
+        self.logger.debug(f"invalidating plant and contact cache")
+        with self._metadata_lock:
+            self._metadata_cache = None
+
+    def watch_metadata(self) -> bool:
+        """
+        watch the plant and contacts collections in the background and invalidate the cache whenever they change. Requires a replica set
+        :returns: whether the watcher was started
+        """
+        if self._metadata_watcher is not None and self._metadata_watcher.is_alive():
+            return True
+
+        collections = [self.config['plant_collection'], self.config['contacts_collection']]
+        pipeline = [{"$match": {"ns.coll": {"$in": collections}}}]
+
+        try:
+            change_stream = self._database().watch(pipeline)
+        except OperationFailure as e:
+            self.logger.warning(f"could not watch plant and contact changes, cache will expire after metadata_ttl. Reason:\n{e}")
+            return False
+
+        self._stop_metadata_watcher.clear()
+        self._metadata_watcher = threading.Thread(target=self._watch_metadata_changes, args=(change_stream,), name="metadata-watcher", daemon=True)
+        self._metadata_watcher.start()
+
+        # changes made before the stream was opened would not be seen, so the cache starts from scratch
+        self.invalidate_metadata_cache()
+        return True
+
+    def stop_watching_metadata(self) -> None:
+        """
+        stop the background metadata watcher, if running
+        """
+        self._stop_metadata_watcher.set()
+
+        if self._metadata_watcher is not None:
+            self._metadata_watcher.join()
+            self._metadata_watcher = None
+
+    def _watch_metadata_changes(self, change_stream) -> None:
+        with change_stream:
+            while not self._stop_metadata_watcher.is_set():
+                try:
+                    change = change_stream.try_next()
+                except PyMongoError as e:
+                    self.logger.error(f"stopped watching plant and contact changes. Reason:\n{e}")
+                    self.invalidate_metadata_cache()
+                    return
 
-            type_events: List[Event] = [event for event in event_collection.find({"event_name": alarm['event_name'], "timestamp": {"$gt": alarm['last_event']}})]
-            self.logger.debug(f"collected {len(type_events)} {alarm['event_name']} events")
+                if change is None:
+                    continue
 
-            events.extend(type_events)
+                self.logger.debug(f"{change['ns']['coll']} changed in remote")
+                self.invalidate_metadata_cache()
+
+    def load_system_data(self) -> Tuple[List[Alarm], List[Plant], List[PlantContacts], List[Event]]:
+        mongo_db = self._database()
+
+        event_collection = mongo_db[self.config['event_collection']]
+
+        alarms, plants, contacts = self.load_system_metadata()
+        compact = self._event_compactor()
+
+        events: List[Event] = []
+        # get only newer events, for all alarms in as few round trips as possible
+        for query in self._new_events_queries(alarms):
+            self.logger.debug(f"collecting latest events for {len(query['$or'])} alarm groups")
+
+            with self.metrics.timer("mongodb_query_seconds", collection="events"):
+                batch_events: List[Event] = [compact(event) for event in event_collection.find(query, self._event_projection())]
+            self.logger.debug(f"collected {len(batch_events)} events")
+
+            events.extend(batch_events)
 
         self.logger.debug(f"collected events: {len(events)}")
+        self.metrics.increment("events_loaded_total", len(events))
 
         return alarms, plants, contacts, events
 
+    def has_new_events(self) -> bool:
+        mongo_db = self._database()
+
+        alarm_collection = mongo_db[self.config['alarm_collection']]
+        event_collection = mongo_db[self.config['event_collection']]
+
+        with self.metrics.timer("mongodb_query_seconds", collection="alarms"):
+            alarms: List[Alarm] = [alarm for alarm in alarm_collection.find()]
+
+        if self._alarm_filter is not None:
+            alarms = [alarm for alarm in alarms if self._alarm_filter(alarm)]
+
+        for alarm in alarms:
+            alarm.setdefault('last_event', datetime.min)
+
+        # a single matching event is enough, and the event index finds it without scanning the new events
+        for query in self._new_events_queries(alarms):
+            with self.metrics.timer("mongodb_query_seconds", collection="events"):
+                if event_collection.find_one(query, {"_id": 1}) is not None:
+                    return True
+
+        self.logger.debug(f"no new events for {len(alarms)} alarms")
+        return False
 
-    def update_system_alarms(self, alarms: List[Alarm]) -> bool:
-        mongo_db = MongoClient(self.config['url'])[self.config['db_name']]
+    def stream_alarm_events(self, alarm: Alarm) -> Iterable[Event]:
+        self.logger.debug(f"streaming latest {alarm['event_name']} events for plant {alarm['plant_name']}")
+
+        return self._stream_events(alarm, {"$gt": alarm['last_event']})
+
+    def stream_alarm_events_between(self, alarm: Alarm, start: datetime, end: datetime) -> Iterator[Event]:
+        self.logger.debug(f"streaming {alarm['event_name']} events for plant {alarm['plant_name']} between {start} and {end}")
+
+        return iter(self._stream_events(alarm, {"$gt": start, "$lte": end}))
+
+    def _stream_events(self, alarm: Alarm, timestamp_condition: Dict[str, Any]) -> Iterable[Event]:
+        event_collection = self._database()[self.config['event_collection']]
+        batch_size = int(self.config.get('stream_batch_size', DEFAULT_STREAM_BATCH_SIZE))
+
+        query = {"event_name": alarm['event_name'], "plant_name": alarm['plant_name'], "timestamp": timestamp_condition}
+
+        # sorting is done server side, so events can be processed in order as soon as the first batch arrives
+        cursor = event_collection.find(query, self._event_projection()).sort("timestamp", ASCENDING).batch_size(batch_size)
+
+        if self._event_schema is None:
+            return cursor
+
+        return map(self._event_compactor(), cursor)
+
+    def watch_events(self, alarms: List[Alarm], stop: threading.Event) -> Iterator[Optional[Event]]:
+        event_collection = self._database()[self.config['event_collection']]
+        poll_interval = float(self.config.get('poll_interval', DEFAULT_POLL_INTERVAL))
+
+        event_names = sorted({alarm['event_name'] for alarm in alarms})
+        pipeline: List[Dict[str, Any]] = [{"$match": {"operationType": "insert", "fullDocument.event_name": {"$in": event_names}}}]
+
+        projection = self._event_projection()
+        if projection:
+            pipeline.append({"$project": {f"fullDocument.{field}": 1 for field in projection}})
+
+        # the stream is opened right away, so events recorded from now on are not missed while the caller catches up
+        try:
+            change_stream = event_collection.watch(pipeline, max_await_time_ms=int(poll_interval * 1000))
+        except OperationFailure as e:
+            self.logger.warning(f"change streams are not available, polling for new events every {poll_interval} seconds. Reason:\n{e}")
+            return self._poll_events(event_collection, alarms, stop)
+
+        self.logger.debug(f"watching new events through a change stream")
+        return self._watch_changes(change_stream, event_collection, alarms, stop)
+
+    def _watch_changes(self, change_stream: ChangeStream, event_collection: Collection, alarms: List[Alarm], stop: threading.Event) -> Iterator[Optional[Event]]:
+        with change_stream:
+            while not stop.is_set():
+                try:
+                    change = change_stream.try_next()
+                except PyMongoError as e:
+                    self.logger.error(f"change stream closed, falling back to polling. Reason:\n{e}")
+                    yield from self._poll_events(event_collection, alarms, stop)
+                    return
+
+                if change is None:
+                    yield None
+                    continue
+
+                self.metrics.increment("events_watched_total", source="change_stream")
+                yield self._event_compactor()(change['fullDocument'])
+
+    def _poll_events(self, event_collection: Collection, alarms: List[Alarm], stop: threading.Event) -> Iterator[Optional[Event]]:
+        poll_interval = float(self.config.get('poll_interval', DEFAULT_POLL_INTERVAL))
+        batch_size = int(self.config.get('stream_batch_size', DEFAULT_STREAM_BATCH_SIZE))
+        event_names = sorted({alarm['event_name'] for alarm in alarms})
+
+        # alarms are updated by the caller while events are consumed, so the starting point is read when polling starts
+        since = min((alarm['last_event'] for alarm in alarms), default=datetime.min)
+        # ids of the events read with the since timestamp. Several events may share it, and not all of them may fit in a page or be recorded yet
+        seen_ids: List[Any] = []
+
+        while not stop.is_set():
+            if seen_ids:
+                query = {"event_name": {"$in": event_names}, "timestamp": {"$gte": since}, "_id": {"$nin": seen_ids}}
+            else:
+                query = {"event_name": {"$in": event_names}, "timestamp": {"$gt": since}}
+
+            cursor = event_collection.find(query, self._event_projection()).sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).limit(batch_size)
+            documents: List[Dict[str, Any]] = list(cursor)
+
+            if not documents:
+                yield None
+                stop.wait(poll_interval)
+                continue
+
+            if documents[-1]['timestamp'] != since:
+                since = documents[-1]['timestamp']
+                seen_ids = []
+            seen_ids.extend(document['_id'] for document in documents if document['timestamp'] == since)
+
+            compact = self._event_compactor()
+            self.metrics.increment("events_watched_total", len(documents), source="poll")
+            for document in documents:
+                yield compact(document)
+
+    def ensure_event_index(self) -> str:
+        """
+        create the compound (event_name, plant_name, timestamp) index on the event collection, if it does not exist yet
+        :returns: the name of the index
+        """
+        mongo_db = self._database()
+
+        event_collection = mongo_db[self.config['event_collection']]
+
+        self.logger.debug(f"ensuring event index {EVENT_INDEX_KEYS} exists")
+        return event_collection.create_index(EVENT_INDEX_KEYS)
+
+    def has_event_index(self) -> bool:
+        """
+        check whether the event collection has the compound (event_name, plant_name, timestamp) index the event queries rely on
+        """
+        mongo_db = self._database()
+
+        event_collection = mongo_db[self.config['event_collection']]
+
+        expected_keys = [(field, int(direction)) for field, direction in EVENT_INDEX_KEYS]
+
+        for index in event_collection.index_information().values():
+            if [(field, int(direction)) for field, direction in index['key']] == expected_keys:
+                return True
+
+        self.logger.warning(f"event collection has no {EVENT_INDEX_KEYS} index. Event queries will be slow")
+        return False
+
+    def set_alarm_filter(self, alarm_filter: Optional[Callable[[Alarm], bool]]) -> None:
+        self._alarm_filter = alarm_filter
+
+    def set_event_fields(self, fields: Optional[List[str]]) -> None:
+        self._processor_fields = fields
+
+        event_fields = self._event_fields()
+        if not self.config.get('compact_events'):
+            return
+
+        if event_fields is None:
+            self.logger.warning(f"compact events need the fields read by every processor. Reading whole events instead...")
+            self._event_schema = None
+            return
+
+        self.logger.debug(f"reading compact events with fields {event_fields}")
+        self._event_schema = EventSchema(event_fields)
+
+    def _event_fields(self) -> Optional[List[str]]:
+        """
+        fields to retrieve for each event: the configured ones and, once known, the ones declared by the processor. If no event fields are configured,
+        and compact events are disabled or the processor fields are unknown, events are retrieved whole
+        """
+        try:
+            event_fields = self.config['event_fields']
+        except KeyError:
+            if not self.config.get('compact_events') or self._processor_fields is None:
+                return None
+            event_fields = []
+
+        # duplicates are dropped keeping the order, so the projection and the schema list every field once
+        return list(dict.fromkeys([*REQUIRED_EVENT_FIELDS, *event_fields, *(self._processor_fields or [])]))
+
+    def _event_projection(self) -> Optional[Dict[str, int]]:
+        """
+        projection of the event fields to retrieve, None to retrieve events whole
+        """
+        event_fields = self._event_fields()
+
+        if event_fields is None:
+            return None
+
+        return {field: 1 for field in event_fields}
+
+    def _event_compactor(self) -> Callable[[Dict[str, Any]], Event]:
+        """
+        function turning a decoded event into the event handed to the processor: a compact event if enabled, the document itself otherwise
+        """
+        if self._event_schema is None:
+            return lambda document: document
+
+        return self._event_schema.record  # type: ignore
+
+    def _new_events_queries(self, alarms: List[Alarm]) -> List[Dict[str, Any]]:
+        """
+        build the queries that retrieve the new events of every alarm. Alarms sharing the same last event are grouped under a single
+        timestamp condition, and each query covers at most event_query_batch_size alarms
+        """
+        batch_size = int(self.config.get('event_query_batch_size', DEFAULT_EVENT_QUERY_BATCH_SIZE))
+
+        # alarms watching the same events only need to request them once, starting from the oldest last event. The orchestrator leaves out
+        # the events each alarm already processed
+        last_events: Dict[Tuple[str, str], datetime] = {}
+        for alarm in alarms:
+            key = (alarm['event_name'], alarm['plant_name'])
+            last_events[key] = min(alarm['last_event'], last_events.get(key, alarm['last_event']))
+
+        sorted_keys = sorted(last_events, key=lambda key: last_events[key])
+
+        queries = []
+        for start in range(0, len(sorted_keys), batch_size):
+            grouped_by_last_event: Dict[datetime, List[Dict[str, str]]] = {}
+            for event_name, plant_name in sorted_keys[start:start + batch_size]:
+                grouped_by_last_event.setdefault(last_events[(event_name, plant_name)], []).append({"event_name": event_name, "plant_name": plant_name})
+
+            queries.append({"$or": [{"timestamp": {"$gt": last_event}, "$or": conditions} for last_event, conditions in grouped_by_last_event.items()]})
+
+        return queries
+
+
+    def update_system_alarms(self, alarms: List[Alarm]) -> AlarmUpdateResult:
+        mongo_db = self._database()
 
         alarm_collection = mongo_db[self.config['alarm_collection']]
+        batch_size = int(self.config.get('alarm_write_batch_size', DEFAULT_ALARM_WRITE_BATCH_SIZE))
 
+        result: AlarmUpdateResult = {"updated": 0, "unchanged": 0, "failed": 0}
+
+        changed_alarms: List[Alarm] = []
+        operations: List[UpdateOne] = []
         for alarm in alarms:
-            alarm_collection.update_one({"id_alarm": alarm['id_alarm']}, {"$set": alarm})
\ No newline at end of file
+            update = self._alarm_update(alarm)
+
+            if not update:
+                result["unchanged"] += 1
+                continue
+
+            changed_alarms.append(alarm)
+            operations.append(UpdateOne({"id_alarm": alarm['id_alarm']}, update))
+
+        self.logger.debug(f"writing {len(operations)} changed alarms, {result['unchanged']} alarms unchanged")
+
+        for start in range(0, len(operations), batch_size):
+            batch_alarms = changed_alarms[start:start + batch_size]
+            failed_indexes = set()
+
+            try:
+                with self.metrics.timer("mongodb_bulk_write_seconds"):
+                    alarm_collection.bulk_write(operations[start:start + batch_size], ordered=False)
+            except BulkWriteError as e:
+                failed_indexes = {error['index'] for error in e.details['writeErrors']}
+                self.logger.error(f"could not update {len(failed_indexes)} alarms. Reason:\n{e.details['writeErrors']}")
+            except PyMongoError as e:
+                failed_indexes = set(range(len(batch_alarms)))
+                self.logger.error(f"could not update {len(failed_indexes)} alarms. Reason:\n{e}")
+
+            for idx, alarm in enumerate(batch_alarms):
+                if idx in failed_indexes:
+                    continue
+                # the remote now matches the local state, further updates only need to write newer changes
+                self.persisted_alarms[alarm['id_alarm']] = deepcopy(alarm)
+
+            result["failed"] += len(failed_indexes)
+            result["updated"] += len(batch_alarms) - len(failed_indexes)
+
+        self.logger.debug(f"alarm update result: {result}")
+        return result
+
+    def _alarm_update(self, alarm: Alarm) -> Dict[str, Dict[str, Any]]:
+        """
+        build the update document with the fields of an alarm that changed since it was loaded or last written
+        :returns: the update document, empty if the alarm did not change
+        """
+        try:
+            persisted_alarm = self.persisted_alarms[alarm['id_alarm']]
+        except KeyError:
+            # the remote state of the alarm is unknown, so it is written whole
+            return {"$set": {field: value for field, value in alarm.items() if field != '_id'}}
+
+        update: Dict[str, Dict[str, Any]] = {}
+
+        changed_fields = {field: value for field, value in alarm.items() if field != '_id' and (field not in persisted_alarm or persisted_alarm[field] != value)}
+        removed_fields = {field: "" for field in persisted_alarm if field != '_id' and field not in alarm}
+
+        windows, persisted_windows = changed_fields.get(WINDOW_STATE_FIELD), persisted_alarm.get(WINDOW_STATE_FIELD)
+        if isinstance(windows, dict) and isinstance(persisted_windows, dict):
+            # only the windows that changed are written, instead of the state of every window of the alarm
+            del changed_fields[WINDOW_STATE_FIELD]
+            changed_fields.update({f"{WINDOW_STATE_FIELD}.{name}": state for name, state in windows.items() if persisted_windows.get(name) != state})
+            removed_fields.update({f"{WINDOW_STATE_FIELD}.{name}": "" for name in persisted_windows if name not in windows})
+
+        if changed_fields:
+            update["$set"] = changed_fields
+
+        if removed_fields:
+            update["$unset"] = removed_fields
+
+        return update
@@ -0,0 +1,243 @@
+import logging
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from typing import FrozenSet, List, Optional, Set
+
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from ..core.interfaces.coordinator import ICoordinator
+from ..core.metrics import Metrics
+from ..core.parallel import ShardKey
+from ..core.types import Alarm
+from .types import DEFAULT_LEASE_TTL, DEFAULT_PARTITIONS
+
+
+def alarm_partition(alarm: Alarm, partitions: int, partition_by: ShardKey = "plant_name") -> int:
+    """
+    partition of an alarm. Stable across processes and restarts, unlike hash()
+    """
+    return zlib.crc32(str(alarm[partition_by]).encode()) % partitions
+
+
+class MongoDBCoordinator(ICoordinator):
+    """
+    Splits the alarms between instances through leases stored in a mongodb collection. Alarms are hashed into a fixed number of partitions,
+    and every instance leases an even share of them. A background thread renews the leases and the instance membership every heartbeat, claims
+    free or expired partitions when the instance owns less than its share, and marks partitions to be given up when it owns more, which
+    happens when another instance joins. Lease expiry is computed with the server clock, so instances do not need synchronized clocks.
+
+    The collection holds a document per partition, {_id: "partition-<n>", kind: "partition", partition, owner, expires_at}, and one per instance,
+    {_id: "member-<instance>", kind: "member", owner, expires_at}
+    """
+    logger: logging.Logger
+
+    def __init__(self, collection: Collection, logger: logging.Logger, *, instance_id: Optional[str] = None, partitions: int = DEFAULT_PARTITIONS,
+                 lease_ttl: float = DEFAULT_LEASE_TTL, heartbeat_interval: Optional[float] = None, partition_by: ShardKey = "plant_name",
+                 metrics: Optional[Metrics] = None) -> None:
+        """
+        :param collection: collection where leases are stored, shared by every instance
+        :param logger: a logger
+        :param instance_id: name of this instance, unique among the running ones. By default, host name, process id and a random suffix
+        :param partitions: number of partitions the alarms are split into. Must be the same for every instance
+        :param lease_ttl: seconds a lease lasts without being renewed
+        :param heartbeat_interval: seconds between lease renewals. A third of lease_ttl by default
+        :param partition_by: alarm key hashed to find the partition of an alarm, either "plant_name" or "id_alarm". Must be the same for every instance
+        :param metrics: registry where owned partitions and lease changes are recorded
+        """
+        self.logger = logger
+        self.collection = collection
+        self.instance_id = instance_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.partitions = partitions
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval or lease_ttl / 3
+        self.partition_by = partition_by
+        self.metrics = metrics or Metrics(self.logger)
+
+        self.logger.debug(f"setting up MongoDBCoordinator as instance {self.instance_id} with {partitions} partitions")
+
+        # partitions are replaced as a whole, so they can be read from other threads without locking
+        self.owned: FrozenSet[int] = frozenset()
+        self.releasing: FrozenSet[int] = frozenset()
+        # leases are only trusted until they would expire if the last renewal was the last one to succeed
+        self._valid_until = 0.0
+
+        self._changed = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def join(self) -> None:
+        if self._heartbeat_thread is not None:
+            return
+
+        self.logger.info(f"joining as instance {self.instance_id}")
+        # the first heartbeat claims a share right away, so the first run has alarms to process
+        self._heartbeat()
+
+        self._stop.clear()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="coordinator", daemon=True)
+        self._heartbeat_thread.start()
+
+    def leave(self) -> None:
+        if self._heartbeat_thread is None:
+            return
+
+        self._stop.set()
+        self._heartbeat_thread.join()
+        self._heartbeat_thread = None
+
+        with self._lock:
+            try:
+                self.collection.update_many({"kind": "partition", "owner": self.instance_id}, {"$set": {"owner": None}})
+                self.collection.delete_one({"_id": f"member-{self.instance_id}"})
+            except PyMongoError as e:
+                self.logger.error(f"could not release leases, other instances will claim them once expired. Reason:\n{e}")
+
+            self.metrics.increment("partition_leases_total", len(self.owned), result="released")
+            self.owned = frozenset()
+            self.releasing = frozenset()
+            self.metrics.set_gauge("owned_partitions", 0)
+
+        self.logger.info(f"instance {self.instance_id} left")
+
+    def owns(self, alarm: Alarm) -> bool:
+        if time.monotonic() > self._valid_until:
+            return False
+
+        return alarm_partition(alarm, self.partitions, self.partition_by) in self.owned
+
+    def ownership_changed(self) -> bool:
+        return self._changed.is_set()
+
+    def rebalance(self) -> None:
+        with self._lock:
+            self._changed.clear()
+
+            if not self.releasing:
+                return
+
+            self.logger.info(f"releasing partitions {sorted(self.releasing)}")
+            try:
+                self.collection.update_many(
+                    {"kind": "partition", "owner": self.instance_id, "partition": {"$in": sorted(self.releasing)}},
+                    {"$set": {"owner": None}},
+                )
+            except PyMongoError as e:
+                # the partitions are not processed anymore either way, and other instances claim them once their leases expire
+                self.logger.error(f"could not release partitions. Reason:\n{e}")
+
+            self.metrics.increment("partition_leases_total", len(self.releasing), result="released")
+            self.owned = self.owned - self.releasing
+            self.releasing = frozenset()
+            self.metrics.set_gauge("owned_partitions", len(self.owned))
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            self._heartbeat()
+
+    def _heartbeat(self) -> None:
+        """
+        renew membership and leases, then claim or give up partitions to get closer to an even share
+        """
+        started = time.monotonic()
+
+        with self._lock:
+            try:
+                self._renew()
+                members = self.collection.count_documents({"kind": "member", "$expr": {"$gt": ["$expires_at", "$$NOW"]}})
+                share = math.ceil(self.partitions / max(members, 1))
+
+                kept = self.owned - self.releasing
+                if len(kept) > share:
+                    self._give_up(kept, len(kept) - share)
+                elif len(kept) < share and not self.releasing:
+                    self._claim(share - len(kept))
+            except PyMongoError as e:
+                self.metrics.increment("coordinator_heartbeat_failures_total")
+                self.logger.error(f"could not renew leases. Reason:\n{e}")
+                return
+
+            self._valid_until = started + self.lease_ttl
+            self.metrics.set_gauge("owned_partitions", len(self.owned))
+
+    def _expiry(self):
+        return {"$add": ["$$NOW", int(self.lease_ttl * 1000)]}
+
+    def _renew(self) -> None:
+        self.collection.update_one(
+            {"_id": f"member-{self.instance_id}"},
+            [{"$set": {"kind": "member", "owner": self.instance_id, "expires_at": self._expiry()}}],
+            upsert=True,
+        )
+        self.collection.update_many({"kind": "partition", "owner": self.instance_id}, [{"$set": {"expires_at": self._expiry()}}])
+
+        # leases that expired and were claimed by another instance are not renewed, and are lost
+        leased = frozenset(document["partition"] for document in self.collection.find({"kind": "partition", "owner": self.instance_id}, {"partition": 1}))
+        lost = self.owned - leased
+
+        if lost:
+            self.logger.warning(f"lost the leases of partitions {sorted(lost)}")
+            self.metrics.increment("partition_leases_total", len(lost), result="lost")
+            self._changed.set()
+
+        self.owned = leased
+        self.releasing = self.releasing & leased
+
+    def _give_up(self, kept: FrozenSet[int], amount: int) -> None:
+        """
+        mark partitions to be released once their alarms are persisted
+        """
+        releasing = frozenset(sorted(kept, reverse=True)[:amount])
+        self.logger.info(f"giving up partitions {sorted(releasing)} to other instances")
+
+        self.releasing = self.releasing | releasing
+        self._changed.set()
+
+    def _claim(self, amount: int) -> None:
+        """
+        lease up to amount partitions that have no owner, or whose lease expired
+        """
+        taken: Set[int] = set()
+        for document in self.collection.find(
+            {"kind": "partition", "owner": {"$ne": None}, "$expr": {"$gt": ["$expires_at", "$$NOW"]}}, {"partition": 1}
+        ):
+            taken.add(document["partition"])
+
+        # every instance starts looking at a different partition, so instances joining at once do not compete for the same ones
+        start = zlib.crc32(self.instance_id.encode()) % self.partitions
+        candidates: List[int] = [
+            partition for partition in ((start + offset) % self.partitions for offset in range(self.partitions))
+            if partition not in taken and partition not in self.owned
+        ]
+
+        claimed: Set[int] = set()
+        for partition in candidates:
+            if len(claimed) == amount:
+                break
+
+            try:
+                # the filter only matches free or expired leases, so a lease held by another instance makes the upsert fail on the _id
+                self.collection.update_one(
+                    {
+                        "_id": f"partition-{partition}",
+                        "$or": [{"owner": None}, {"owner": self.instance_id}, {"$expr": {"$lte": ["$expires_at", "$$NOW"]}}],
+                    },
+                    [{"$set": {"kind": "partition", "partition": partition, "owner": self.instance_id, "expires_at": self._expiry()}}],
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                continue
+
+            claimed.add(partition)
+
+        if claimed:
+            self.logger.info(f"claimed partitions {sorted(claimed)}")
+            self.metrics.increment("partition_leases_total", len(claimed), result="acquired")
+            self.owned = self.owned | claimed
+            self._changed.set()
@@ -1,6 +1,26 @@
-from typing import Dict, Literal
+from typing import Dict, List, Literal, Union
 
-ConnectorConfig = Dict[Literal["url", "db_name", "alarm_collection", "plant_collection", "event_collection", "contacts_collection"], str]
+
+DEFAULT_PARTITIONS = 64
+"""
+number of partitions the alarms are split into. Instances claim whole partitions, so it bounds the number of instances that get work
+"""
+
+DEFAULT_LEASE_TTL = 30.0
+"""
+seconds a lease lasts without being renewed. Alarms of an instance that stops without leaving are picked up by others after this long
+"""
+
+
+ConnectorConfig = Dict[Literal["url", "db_name", "alarm_collection", "plant_collection", "event_collection", "contacts_collection", "stream_batch_size", "event_query_batch_size", "event_fields", "alarm_write_batch_size", "max_pool_size", "metadata_ttl", "poll_interval", "compact_events"], Union[str, int, float, bool, List[str]]]
 """
 mongodb_loader must get a dictionary with at least these keys to operate correctly
+:key stream_batch_size: optional, number of events fetched per round trip when streaming events
+:key event_query_batch_size: optional, maximum number of alarms covered by a single query when loading new events
+:key alarm_write_batch_size: optional, maximum number of alarm updates sent in a single bulk write
+:key max_pool_size: optional, maximum number of pooled connections to mongodb
+:key metadata_ttl: optional, seconds that plants and contacts are cached for between runs
+:key poll_interval: optional, seconds to wait for new events when watching them, before polling again
+:key event_fields: optional, list of extra event fields used by processors and message builders. If set, only these fields and the ones required by the system are retrieved
+:key compact_events: optional, if True events are returned as read-only compact records holding only the required fields, event_fields and the fields declared by processors
 """
\ No newline at end of file
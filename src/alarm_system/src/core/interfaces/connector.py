@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
+from datetime import datetime
 import logging
-from typing import List, Tuple
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
-from ..types import Alarm, Plant, Event, PlantContacts
+from ..types import Alarm, AlarmUpdateResult, Plant, Event, PlantContacts
 
 class IConnector(ABC):
     """
@@ -17,9 +19,80 @@ class IConnector(ABC):
         """
 
     @abstractmethod
-    def update_system_alarms(self, alarms: List[Alarm]) -> bool:
+    def update_system_alarms(self, alarms: List[Alarm]) -> AlarmUpdateResult:
         """
         update list of alarms for future reuse
         :param alarms: the alarms to update in a remote database
-        :returns: bool whether the update was successful or not
+        :returns: how many alarms were updated, had no changes, or failed to update. Returning whether every alarm was updated, as a bool,
+        is still accepted, in which case a failed update counts every alarm as failed
+        """
+
+    def has_new_events(self) -> bool:
+        """
+        quick check of whether any alarm has events newer than its last event, so runs with nothing to process can stop early.
+        Connectors that cannot tell without loading the events return True, which is the default
+        """
+        return True
+
+    def set_event_fields(self, fields: Optional[List[str]]) -> None:
+        """
+        hint of the event fields the processor reads, so connectors can leave the rest out of the events they return. Ignored by default
+        :param fields: event fields besides the ones required by the system, or None if every field may be read
+        """
+
+    def set_alarm_filter(self, alarm_filter: Optional[Callable[[Alarm], bool]]) -> None:
+        """
+        hint of the alarms the caller will process, so connectors can skip loading the events of the rest. Ignored by default
+        :param alarm_filter: function telling whether an alarm is processed, or None to process every alarm
+        """
+
+
+class IStreamingConnector(IConnector):
+    """
+    This interface extends IConnector with methods to read events lazily, one alarm at a time, instead of loading them all in memory
+    """
+
+    @abstractmethod
+    def load_system_metadata(self) -> Tuple[List[Alarm], List[Plant], List[PlantContacts]]:
+        """
+        loads alarm, plant and contact data for the alarm system, without any events
+        """
+
+    @abstractmethod
+    def stream_alarm_events(self, alarm: Alarm) -> Iterable[Event]:
+        """
+        lazily iterate over the new events of a given alarm
+        :param alarm: the alarm whose events should be read. Only events of the same plant and newer than alarm['last_event'] are returned
+        :returns: an iterable of events, sorted by timestamp in ascending order
+        """
+
+    def stream_alarm_events_between(self, alarm: Alarm, start: datetime, end: datetime) -> Iterator[Event]:
+        """
+        lazily iterate over the events of a given alarm recorded after start and up to end, regardless of its last event. Used to replay past
+        events. By default, the new events are streamed from start and the stream is closed past end, so connectors should override it with a bounded query
+        :param alarm: the alarm whose events should be read. Only events of the same plant are returned
+        :returns: an iterator of events, sorted by timestamp in ascending order
+        """
+        replayed_alarm = dict(alarm)
+        replayed_alarm["last_event"] = start
+
+        for event in self.stream_alarm_events(replayed_alarm):
+            if event["timestamp"] > end:
+                return
+
+            yield event
+
+
+class IWatchingConnector(IStreamingConnector):
+    """
+    This interface extends IStreamingConnector with a method to follow new events as they are recorded, for long-running systems
+    """
+
+    @abstractmethod
+    def watch_events(self, alarms: List[Alarm], stop: threading.Event) -> Iterable[Optional[Event]]:
+        """
+        follow the events related to the given alarms as they are recorded, until stop is set
+        :param alarms: the alarms whose events should be followed. Events may be repeated or older than alarm['last_event'], so callers are expected to skip those
+        :param stop: event used to stop watching
+        :returns: an iterable of events in arrival order. None is yielded whenever no event arrived for a while, so callers can do periodic work
         """
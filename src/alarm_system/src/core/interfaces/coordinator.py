@@ -0,0 +1,41 @@
+from abc import ABC, abstractmethod
+import logging
+from ..types import Alarm
+
+
+class ICoordinator(ABC):
+    """
+    This interface splits the alarms between several instances of the alarm system sharing the same database, so every alarm is processed
+    and notified by a single instance
+    """
+    logger: logging.Logger
+
+    @abstractmethod
+    def join(self) -> None:
+        """
+        start taking part in the split, claiming a share of the alarms. Does nothing if already joined
+        """
+
+    @abstractmethod
+    def leave(self) -> None:
+        """
+        give up every alarm owned and stop taking part in the split, so other instances can claim them right away
+        """
+
+    @abstractmethod
+    def owns(self, alarm: Alarm) -> bool:
+        """
+        whether the alarm currently belongs to this instance. Alarms that are about to be given up still belong to it until rebalance is called
+        """
+
+    @abstractmethod
+    def ownership_changed(self) -> bool:
+        """
+        whether alarms were claimed, lost, or are waiting to be given up since the last call to rebalance
+        """
+
+    @abstractmethod
+    def rebalance(self) -> None:
+        """
+        give up the alarms waiting to be given up. Must only be called when the state of those alarms is persisted and no longer held in memory
+        """
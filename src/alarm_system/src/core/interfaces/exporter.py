@@ -0,0 +1,15 @@
+from abc import ABC, abstractmethod
+from ..types import MetricsSnapshot
+
+
+class IMetricsExporter(ABC):
+    """
+    This interface publishes the metrics recorded by the alarm system somewhere they can be read, such as a file or an http endpoint
+    """
+
+    @abstractmethod
+    def export(self, snapshot: MetricsSnapshot) -> None:
+        """
+        publish a snapshot of the metrics. Called at the end of every run, and periodically while running continuously
+        :param snapshot: the metrics recorded since the system started
+        """
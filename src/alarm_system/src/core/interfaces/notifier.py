@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 import logging
-from typing import Union
+from typing import Callable, Union
 from ..types import Alarm, Plant, Event, PlantContacts
 
 
@@ -20,3 +20,32 @@ class INotifier(ABC):
         :param event: the event that triggered the alarm
         :param message_label: some use cases require an alarm to dispatch different messages given different conditions (e.g, when first triggered and then when no longer active). This label is used to identify the type of message to return
         """
+
+    def flush(self) -> None:
+        """
+        wait until every pending notification is delivered. Notifiers that deliver notifications as soon as they are triggered do not need to override this
+        """
+
+    def prefetch(self, alarm: Alarm, event: Event) -> None:
+        """
+        hint that an event that triggered an alarm is about to be notified, so resources it needs can be prepared ahead of time. Only called
+        by notifiers that deliver notifications later, such as NotificationQueue. Does nothing by default
+        """
+
+    def retry_deliveries(self, retries: int, backoff: float) -> bool:
+        """
+        retry every delivery channel on its own when it raises an error, so channels that already delivered a notification do not send it again
+        :param retries: number of times a failed delivery is retried
+        :param backoff: seconds to wait before the first retry. The wait doubles with every retry
+        :returns: whether the notifier retries its deliveries. Notifiers that do not are retried as a whole by the caller, which is the default
+        """
+        return False
+
+    def on_delivered(self, callback: Callable[[Alarm, Event, Union[str, bool]], None]) -> bool:
+        """
+        call callback with the alarm, event and message label of every trigger once its notification is actually sent, which may be later
+        than notify_trigger returns, as when it is held to be merged in a digest
+        :returns: whether the notifier calls back. Notifiers that do not are considered to deliver notifications when notify_trigger returns
+        True, which is the default
+        """
+        return False
@@ -0,0 +1,28 @@
+from abc import ABC, abstractmethod
+from typing import List
+from ..types import Alarm, OutboxKey
+
+
+class INotificationOutbox(ABC):
+    """
+    This interface keeps track of the notifications already delivered, so events processed again after a crash are not notified twice
+    """
+
+    @abstractmethod
+    def contains(self, key: OutboxKey) -> bool:
+        """
+        whether the notification was already delivered
+        """
+
+    @abstractmethod
+    def add(self, key: OutboxKey) -> None:
+        """
+        record a delivered notification. Must be durable once it returns
+        """
+
+    @abstractmethod
+    def prune(self, alarms: List[Alarm]) -> None:
+        """
+        forget the notifications of events up to the last event of each alarm, as they will not be processed again once the alarms are
+        persisted
+        """
@@ -1,17 +1,55 @@
 from abc import ABC, abstractmethod
 import logging
-from typing import Dict, List, Union
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, Union
+from ..snapshot import CopyOnWriteAlarm
 from ..types import Alarm, Plant, Event
 
+if TYPE_CHECKING:
+    from ..metrics import Metrics
+
 
 class IProcessor(ABC):
     """
     This interface manages processing the bulk of the data
     """
     logger: logging.Logger
+    # registry where the processor records its metrics, if any. Metrics recorded in process workers are merged into it
+    metrics: Optional["Metrics"] = None
 
     @abstractmethod
     def process_event(self, alarm: Alarm, plant: Plant, event: Event) -> Union[str, None]:
         """
         process an event and immediately return the result
         """
+
+    def supports_batch_processing(self, alarm: Alarm) -> bool:
+        """
+        whether the events of an alarm can be processed all at once with process_event_batch. False by default
+        """
+        return False
+
+    def process_event_batch(self, alarm: Alarm, plant: Plant, events: Sequence[Event]) -> List[Tuple[int, Union[str, bool], Alarm]]:
+        """
+        process several events of an alarm, sorted by timestamp, in a single call. The alarm is left in its state after the last event. By
+        default, the events are handed to process_event one at a time
+        :returns: one (event index, result, alarm state before the event) tuple for each event that should be notified
+        """
+        triggers: List[Tuple[int, Union[str, bool], Alarm]] = []
+
+        for index, event in enumerate(events):
+            # the alarm is only copied for the events that must be notified
+            working_alarm = CopyOnWriteAlarm(alarm)
+            event_result = self.process_event(working_alarm, plant, event)
+
+            if event_result:
+                triggers.append((index, event_result, working_alarm.snapshot()))
+
+            working_alarm.commit()
+
+        return triggers
+
+    def event_fields(self) -> Optional[List[str]]:
+        """
+        event fields read by the processor, besides the ones required by the system. None if unknown, in which case events must be read whole
+        """
+        return None
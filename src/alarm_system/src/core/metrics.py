@@ -0,0 +1,293 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .interfaces.exporter import IMetricsExporter
+from .types import MetricsSnapshot
+
+
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0,
+)
+"""
+upper bounds in seconds of the histogram buckets. They cover from the latency of a single process_event call to a whole run
+"""
+
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+"""
+a metric name along with its labels, sorted by label name
+"""
+
+
+def bucket_quantile(buckets: List[Tuple[float, int]], count: int, q: float) -> Optional[float]:
+    """
+    estimate a quantile of a histogram as the upper bound of the bucket it falls in
+    :param buckets: [upper bound, count] pairs, not cumulative
+    :param count: total number of observations, including the ones over the largest upper bound
+    :returns: the estimate, or None if the quantile falls over the largest upper bound
+    """
+    if not count:
+        return 0.0
+
+    rank = q * count
+    cumulative = 0
+    for upper_bound, bucket_count in buckets:
+        cumulative += bucket_count
+        if cumulative >= rank:
+            return upper_bound
+
+    return None
+
+
+class Counter():
+    """
+    a value that only goes up, such as the number of processed events
+    """
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def increment(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self.value = 0.0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"value": self.value}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.value = state["value"]
+        self._lock = threading.Lock()
+
+
+class Gauge():
+    """
+    a value that can go up and down, such as the number of queued notifications
+    """
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram():
+    """
+    distribution of observed values over fixed buckets, plus their sum and count
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # the last entry counts values over the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect_left(self.buckets, value)
+
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.sum = 0.0
+            self.count = 0
+
+    def merge(self, other: "Histogram") -> None:
+        with self._lock:
+            for idx, count in enumerate(other.counts):
+                self.counts[idx] += count
+
+            self.sum += other.sum
+            self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        estimate = bucket_quantile(list(zip(self.buckets, self.counts)), self.count, q)
+        return float("inf") if estimate is None else estimate
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"buckets": self.buckets, "counts": self.counts, "sum": self.sum, "count": self.count}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class Metrics():
+    """
+    Thread-safe registry of counters, gauges and histograms recorded by the alarm system parts. Metrics are identified by a name and a set of labels,
+    and can be read with snapshot or pushed to the registered exporters with export.
+
+    Code recording a metric very often, such as once per event, should keep the object returned by counter, gauge or histogram instead of
+    looking it up by name every time
+    """
+    logger: logging.Logger
+    exporters: List[IMetricsExporter]
+
+    def __init__(self, logger: logging.Logger = logging.getLogger(__name__), *, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.logger = logger
+        self.buckets = buckets
+        self.exporters = []
+
+        self._counters: Dict[MetricKey, Counter] = {}
+        self._gauges: Dict[MetricKey, Gauge] = {}
+        self._histograms: Dict[MetricKey, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, **labels: Any) -> Counter:
+        key = self._key(name, labels)
+
+        try:
+            return self._counters[key]
+        except KeyError:
+            with self._lock:
+                return self._counters.setdefault(key, Counter())
+
+    def gauge(self, name: str, **labels: Any) -> Gauge:
+        key = self._key(name, labels)
+
+        try:
+            return self._gauges[key]
+        except KeyError:
+            with self._lock:
+                return self._gauges.setdefault(key, Gauge())
+
+    def histogram(self, name: str, **labels: Any) -> Histogram:
+        key = self._key(name, labels)
+
+        try:
+            return self._histograms[key]
+        except KeyError:
+            with self._lock:
+                return self._histograms.setdefault(key, Histogram(self.buckets))
+
+    def increment(self, name: str, amount: float = 1, **labels: Any) -> None:
+        self.counter(name, **labels).increment(amount)
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        self.gauge(name, **labels).set(value)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """
+        observe the seconds spent in the block in the given histogram, even if it raises an error
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage: str) -> Any:
+        """
+        time a stage of the pipeline, such as loading data or updating alarms
+        """
+        return self.timer("stage_duration_seconds", stage=stage)
+
+    def quantile(self, name: str, q: float, **labels: Any) -> float:
+        """
+        estimate a quantile of a histogram, as the upper bound of the bucket it falls in
+        """
+        return self.histogram(name, **labels).quantile(q)
+
+    def snapshot(self) -> MetricsSnapshot:
+        with self._lock:
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+            histograms = list(self._histograms.items())
+
+        return {
+            "timestamp": time.time(),
+            "counters": [{"name": name, "labels": dict(labels), "value": counter.value} for (name, labels), counter in counters],
+            "gauges": [{"name": name, "labels": dict(labels), "value": gauge.value} for (name, labels), gauge in gauges],
+            "histograms": [
+                {"name": name, "labels": dict(labels), "buckets": list(zip(histogram.buckets, histogram.counts)), "sum": histogram.sum, "count": histogram.count}
+                for (name, labels), histogram in histograms
+            ],
+        }
+
+    def merge(self, other: "Metrics") -> None:
+        """
+        add the metrics recorded by another registry, such as the one of a worker process. Gauges take the value of the other registry
+        """
+        with other._lock:
+            counters = list(other._counters.items())
+            gauges = list(other._gauges.items())
+            histograms = list(other._histograms.items())
+
+        for (name, labels), counter in counters:
+            self.counter(name, **dict(labels)).increment(counter.value)
+
+        for (name, labels), gauge in gauges:
+            self.gauge(name, **dict(labels)).set(gauge.value)
+
+        for (name, labels), histogram in histograms:
+            self.histogram(name, **dict(labels)).merge(histogram)
+
+    def reset(self) -> None:
+        """
+        set counters and histograms back to zero. Gauges keep their value, as they describe the current state of the system
+        """
+        with self._lock:
+            counters = list(self._counters.values())
+            histograms = list(self._histograms.values())
+
+        for counter in counters:
+            counter.reset()
+
+        for histogram in histograms:
+            histogram.reset()
+
+    def add_exporter(self, exporter: IMetricsExporter) -> None:
+        self.logger.debug(f"registered metrics exporter {type(exporter).__name__}")
+        self.exporters.append(exporter)
+
+    def export(self) -> None:
+        """
+        push a snapshot to every registered exporter. Exporters that fail are logged and skipped
+        """
+        if not self.exporters:
+            return
+
+        snapshot = self.snapshot()
+
+        for exporter in self.exporters:
+            try:
+                exporter.export(snapshot)
+            except Exception as e:
+                self.logger.error(f"could not export metrics with {type(exporter).__name__}. Reason:\n{e}")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # registries are sent to worker processes along with the processor. Locks and exporters stay in the parent process
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["exporters"] = []
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> MetricKey:
+        if not labels:
+            return name, ()
+
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
@@ -1,10 +1,21 @@
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from copy import deepcopy
+from datetime import datetime, timedelta
 import logging
-from .interfaces.connector import IConnector
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
+from .interfaces.connector import IConnector, IStreamingConnector, IWatchingConnector
+from .interfaces.coordinator import ICoordinator
 from .interfaces.notifier import INotifier
+from .interfaces.outbox import INotificationOutbox
 from .interfaces.processor import IProcessor
-
-# TODO not thread safe, not urgent but keep in mind until perfect solution is found
-from copy import deepcopy
+from .metrics import Metrics
+from .parallel import AlarmJob, AlarmResult, ShardKey, alarm_triggers, init_shard_worker, process_shard, process_shard_in_worker, shard_alarm_jobs
+from .profiling import profiled
+from .replay import ReplayWindow, replay_windows
+from .types import Alarm, Event, Plant, PlantContacts
 
 
 class Orchestrator:
@@ -13,17 +24,244 @@ class Orchestrator:
     """
     logger: logging.Logger
 
-    def __init__(self, connector: IConnector, processor: IProcessor, notifier: INotifier, logger: logging.Logger) -> None:
+    def __init__(self, connector: IConnector, processor: IProcessor, notifier: INotifier, logger: logging.Logger, metrics: Optional[Metrics] = None) -> None:
         self.logger = logger
         self.logger.debug(f"setting up Orchestrator")
 
         self.connector = connector
         self.processor = processor
         self.notifier = notifier
+        self.metrics = metrics or Metrics(self.logger)
+
+        # alarms are processed sequentially unless parallel processing is enabled
+        self.workers = 0
+        self.executor_type: Literal["thread", "process"] = "thread"
+        self.shard_by: ShardKey = "plant_name"
+
+        # alarm state is only persisted at the end of a run unless checkpoints are enabled
+        self.checkpoint_events = 0
+        self.checkpoint_seconds = 0.0
+        self._events_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+        # outbox of the delivered notifications, pruned once the alarms they belong to are persisted
+        self.outbox: Optional[INotificationOutbox] = None
+
+        # every alarm is processed unless the alarms are split with other instances
+        self.coordinator: Optional[ICoordinator] = None
+
+    def enable_coordination(self, coordinator: ICoordinator):
+        """
+        only process the alarms owned by this instance, as decided by a coordinator shared with other instances running against the same database
+        """
+        self.logger.debug(f"splitting alarms with other instances through {type(coordinator).__name__}")
+        self.coordinator = coordinator
+
+    def enable_checkpoints(self, every_events: int = 0, every_seconds: float = 0.0, outbox: Optional[INotificationOutbox] = None):
+        """
+        persist the state of the alarms while a run is in progress, so a crash does not force every event of the run to be processed again.
+        Pending notifications are flushed before every checkpoint, which sends coalesced digests early
+        :param every_events: events processed between checkpoints. 0 disables event based checkpoints
+        :param every_seconds: seconds between checkpoints. 0 disables time based checkpoints
+        :param outbox: outbox the notifier records delivered notifications in, if any. Its entries are pruned once persisted
+        """
+        self.logger.debug(f"checkpointing alarms every {every_events or '-'} events, {every_seconds or '-'} seconds")
+        self.checkpoint_events = every_events
+        self.checkpoint_seconds = every_seconds
+        self.outbox = outbox
+
+    def enable_parallel_processing(self, workers: int, *, executor: Literal["thread", "process"] = "thread", shard_by: ShardKey = "plant_name"):
+        """
+        process the alarms of execute in a pool of workers. Alarms are split into shards sharing the same shard key, and the events of each shard
+        are processed in timestamp order by a single worker. Notifications are sent once every shard is done, in the same order as sequential execution
+        :param workers: number of workers. 0 or 1 disables parallel processing
+        :param executor: "thread" for processors that release the GIL (numpy, image libraries, io), "process" for pure python processors.
+        Process pools require the processor and its registered functions to be picklable, and are not used with streaming execution
+        :param shard_by: alarm key used to split alarms into shards, either "plant_name" or "id_alarm"
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError(f"unknown executor {executor}. Expected 'thread' or 'process'")
+
+        self.logger.debug(f"processing alarms with {workers} {executor} workers, sharded by {shard_by}")
+        self.workers = workers
+        self.executor_type = executor
+        self.shard_by = shard_by
+
+    def execute(self, streaming: bool = False, profile: Optional[str] = None):
+        """
+        run the alarm system once, then export the metrics. Alarms owned through a coordinator stay owned for the next run, unless the run fails
+        :param streaming: if True and the connector supports it, events are read lazily per alarm and notified as they arrive, keeping memory usage bounded
+        :param profile: if provided, the run is profiled with cProfile and the stats are saved to this path
+        """
+        self._events_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+        self.connector.set_event_fields(self.processor.event_fields())
+        self._claim_alarms()
+
+        try:
+            with profiled(profile, self.logger), self.metrics.stage("execute"):
+                if streaming and isinstance(self.connector, IStreamingConnector):
+                    self._execute_streaming(self.connector)
+                else:
+                    if streaming:
+                        self.logger.warning(f"connector {type(self.connector).__name__} does not support streaming. Falling back to batch execution...")
+
+                    self._execute_batch()
+        except BaseException:
+            # the alarms of a failed run are given up, so other instances do not wait for the leases to expire to process them
+            if self.coordinator is not None:
+                self.coordinator.leave()
+            raise
+
+        if self.coordinator is not None:
+            # alarms given up during the run are persisted by now
+            self.coordinator.rebalance()
+
+        self.metrics.export()
+
+    def replay(self, start: datetime, end: datetime, sink: INotifier, *, alarm_filter: Optional[Callable[[Alarm], bool]] = None,
+               chunk: Optional[timedelta] = None, warmup: timedelta = timedelta(0), initial_state: Optional[Dict[str, Any]] = None,
+               workers: int = 4, executor: Literal["thread", "process"] = "thread"):
+        """
+        process the events recorded after start and up to end again, handing the events that trigger an alarm to sink instead of the notifier.
+        Alarms are copied before being replayed, so neither the alarms nor their state in remote are changed. Every alarm starts the replay with
+        its current state, and its history is split into chunks processed in parallel, each chunk starting from that same state
+        :param sink: notifier receiving the triggered events, in alarm order and in timestamp order within each alarm
+        :param alarm_filter: function telling whether an alarm is replayed. Every alarm is replayed if None
+        :param chunk: length of the time chunks. Alarms are replayed whole if None, which gives the same triggers as a sequential run
+        :param warmup: time before every chunk whose events are processed without reporting their triggers, so the alarm state of every chunk
+        is close to the one a sequential run would reach. Should cover the time the processors keep state for
+        :param initial_state: alarm fields set on every alarm before each chunk, such as {"flag_alarm": False}
+        :param workers: number of workers. 0 or 1 replays the chunks one after the other
+        :param executor: "thread" or "process", as in enable_parallel_processing. Process workers receive the events of their chunk loaded in memory
+        """
+        if not isinstance(self.connector, IStreamingConnector):
+            raise TypeError(f"connector {type(self.connector).__name__} does not support streaming events")
+
+        if executor not in ("thread", "process"):
+            raise ValueError(f"unknown executor {executor}. Expected 'thread' or 'process'")
+
+        connector = self.connector
+        windows = replay_windows(start, end, chunk)
+
+        with self.metrics.stage("replay"):
+            connector.set_event_fields(self.processor.event_fields())
+            connector.set_alarm_filter(alarm_filter)
+            try:
+                alarms, plants, contacts = connector.load_system_metadata()
+            finally:
+                # the alarms of a coordinator, if any, are claimed again on the next run
+                connector.set_alarm_filter(None)
+
+            if alarm_filter is not None:
+                alarms = [alarm for alarm in alarms if alarm_filter(alarm)]
+
+            contacts_indexed = {contact["plant_name"]: contact for contact in contacts}
+            plants_indexed = {str(plant["plant_name"]): plant for plant in plants}
+
+            self.logger.info(f"replaying {len(alarms)} alarms from {start} to {end} in {len(windows)} chunks with {workers} {executor} workers")
+
+            pool: Optional[Executor] = None
+            if workers > 1 and executor == "process":
+                from concurrent.futures import ProcessPoolExecutor
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=init_shard_worker, initargs=(self.processor,))
+            elif workers > 1:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay")
+
+            # process workers send their metrics back along with the results
+            in_processes = pool is not None and executor == "process"
+
+            # chunks are submitted as results are delivered, so only the events of a few chunks are held in memory at once
+            pending: Deque[Tuple[ReplayWindow, Plant, Future]] = deque()
+            try:
+                for alarm in alarms:
+                    plant = plants_indexed[alarm["plant_name"]]
+
+                    for window in windows:
+                        replayed_alarm = deepcopy(alarm)
+                        replayed_alarm.update(initial_state or {})
+                        replayed_alarm["last_event"] = window[0] - warmup
+
+                        alarm_events: Iterable[Event] = connector.stream_alarm_events_between(replayed_alarm, replayed_alarm["last_event"], window[1])
+                        pending.append((window, plant, self._submit_replayed_chunk(pool, in_processes, (replayed_alarm, plant, alarm_events))))
 
-    def execute(self):
+                        while len(pending) > 2 * max(workers, 1):
+                            self._deliver_replayed_chunk(*pending.popleft(), in_processes, contacts_indexed, sink)
+
+                while pending:
+                    self._deliver_replayed_chunk(*pending.popleft(), in_processes, contacts_indexed, sink)
+            finally:
+                if pool is not None:
+                    # chunks not started yet are dropped if the replay failed. shutdown only cancels them itself from python 3.9
+                    for _, _, future in pending:
+                        future.cancel()
+                    pool.shutdown()
+
+            sink.flush()
+
+    def _submit_replayed_chunk(self, pool: Optional[Executor], in_processes: bool, job: AlarmJob) -> Future:
+        """
+        process a chunk of a replayed alarm in the pool, or right away if there is no pool
+        """
+        if pool is None:
+            future: Future = Future()
+            future.set_result(process_shard(self.processor, [job]))
+            return future
+
+        if in_processes:
+            alarm, plant, alarm_events = job
+            # event cursors cannot be sent to another process
+            return pool.submit(process_shard_in_worker, [(alarm, plant, list(alarm_events))])
+
+        return pool.submit(process_shard, self.processor, [job])
+
+    def _deliver_replayed_chunk(self, window: ReplayWindow, plant: Plant, future: Future, in_processes: bool, contacts_indexed: Dict[str, PlantContacts],
+                                sink: INotifier):
+        """
+        hand the triggers of a replayed chunk to the sink, leaving out the ones of its warmup
+        """
+        if in_processes:
+            result, worker_metrics = future.result()
+            if worker_metrics is not None and self.processor.metrics is not None:
+                self.processor.metrics.merge(worker_metrics)
+        else:
+            result = future.result()
+
+        [(_, triggers, _)] = result
+        for alarm_before_event, event, event_result in triggers:
+            if event["timestamp"] <= window[0]:
+                continue
+
+            sink.notify_trigger(alarm_before_event, plant, contacts_indexed[plant["plant_name"]], event, event_result)
+
+    def _claim_alarms(self):
+        """
+        join the coordinator, if any, and give up the alarms waiting to be given up. Must be called while no alarm is held in memory
+        """
+        if self.coordinator is None:
+            return
+
+        self.coordinator.join()
+        self.coordinator.rebalance()
+        self.connector.set_alarm_filter(self.coordinator.owns)
+
+    def _owned_alarms(self, alarms: List[Alarm]) -> List[Alarm]:
+        """
+        keep the alarms owned by this instance. Connectors may already leave out the rest
+        """
+        if self.coordinator is None:
+            return alarms
+
+        return [alarm for alarm in alarms if self.coordinator.owns(alarm)]
+
+    def _execute_batch(self):
+        """
+        run the alarm system loading every new event in memory first
+        """
         self.logger.debug(f"collecting system data")
-        alarms, plants, contacts, events = self.connector.load_system_data()
+        with self.metrics.stage("load_system_data"):
+            alarms, plants, contacts, events = self.connector.load_system_data()
+        alarms = self._owned_alarms(alarms)
 
         # str() deberia ser redundante, pero así el pylance se entera que tiene que ser str por la fuerza
         alarms_indexed = {str(alarm["event_name"]): alarm for alarm in alarms}
@@ -34,25 +272,341 @@ class Orchestrator:
         self.logger.debug(f"indexing plants...")
         plants_indexed = {str(plant["plant_name"]): plant for plant in plants}
 
-        self.logger.debug(f"sorting events over timestamp...")
-        events = sorted(events, key= lambda event: event["timestamp"])
+        with self.metrics.stage("index_events"):
+            self.logger.debug(f"sorting events over timestamp...")
+            events = sorted(events, key= lambda event: event["timestamp"])
+
+            self.logger.debug(f"indexing events based on alarms...")
+            # a single pass over the events, which keeps their timestamp order within each alarm
+            indexed_events_by_alarm: Dict[Tuple[str, str], List[Event]] = {(str(alarm["event_name"]), str(alarm["plant_name"])): [] for alarm in alarms}
+            for event in events:
+                try:
+                    indexed_events_by_alarm[(str(event["event_name"]), str(event["plant_name"]))].append(event)
+                except KeyError:
+                    # events not related to any alarm are ignored
+                    continue
 
-        self.logger.debug(f"indexing events based on alarms...")
-        indexed_events_by_alarm = {str(alarm["event_name"]): [event for event in events if str(event["event_name"]) == alarm["event_name"] and str(event["plant_name"]) == alarm["plant_name"]] for alarm in alarms}
+        # events are loaded from the oldest last event of the alarms sharing their event and plant names, so every alarm skips the ones it
+        # already processed
+        jobs: List[AlarmJob] = [
+            (alarm, plants_indexed[alarm["plant_name"]], self._events_after_last_event(alarm, indexed_events_by_alarm[(str(alarm["event_name"]), str(alarm["plant_name"]))]))
+            for alarm in alarms
+        ]
 
-        for alarm in alarms:
-            plant = plants_indexed[alarm["plant_name"]]
-            plant_contacts = contacts_indexed[alarm["plant_name"]]
-            alarm_events = indexed_events_by_alarm[alarm["event_name"]]
+        with self.metrics.stage("process_events"):
+            self._process_alarm_jobs(jobs, contacts_indexed)
 
-            for event in alarm_events:
-                alarm_before_event = deepcopy(alarm)
-                event_result = self.processor.process_event(alarm, plant, event)
+        self.logger.debug(f"updating alarm information in remote...")
+        self._update_system_alarms(self.connector, alarms)
 
-                if not event_result:
-                    continue
+    @staticmethod
+    def _events_after_last_event(alarm: Alarm, alarm_events: List[Event]) -> List[Event]:
+        """
+        events of an alarm, sorted by timestamp, recorded after its last event
+        """
+        if not alarm_events or alarm_events[0]["timestamp"] > alarm["last_event"]:
+            return alarm_events
+
+        return [event for event in alarm_events if event["timestamp"] > alarm["last_event"]]
+
+    def _execute_streaming(self, connector: IStreamingConnector):
+        """
+        run the alarm system reading events one alarm at a time. Only the events of a single batch are held in memory
+        """
+        self.logger.debug(f"collecting system metadata")
+        with self.metrics.stage("load_system_metadata"):
+            alarms, plants, contacts = connector.load_system_metadata()
+        alarms = self._owned_alarms(alarms)
+
+        self.logger.debug(f"indexing contacts...")
+        contacts_indexed = {contact["plant_name"]: contact for contact in contacts}
+
+        self.logger.debug(f"indexing plants...")
+        plants_indexed = {str(plant["plant_name"]): plant for plant in plants}
+
+        # events are sorted by timestamp by the connector, and only read once the alarm is processed
+        jobs: List[AlarmJob] = [(alarm, plants_indexed[alarm["plant_name"]], connector.stream_alarm_events(alarm)) for alarm in alarms]
+
+        with self.metrics.stage("process_events"):
+            self._process_alarm_jobs(jobs, contacts_indexed, streaming=True)
 
-                self.notifier.notify_trigger(alarm_before_event, plant, plant_contacts, event, event_result)
-        
         self.logger.debug(f"updating alarm information in remote...")
-        self.connector.update_system_alarms(alarms)
+        self._update_system_alarms(connector, alarms)
+
+    def run_forever(self, flush_interval: float = 30.0, stop: Optional[threading.Event] = None, metadata_interval: float = 300.0):
+        """
+        keep the alarm system running, processing and notifying events as soon as they are recorded. Alarm state is kept in memory and
+        persisted periodically, and once more when the system stops
+        :param flush_interval: seconds between alarm updates in remote
+        :param stop: event used to stop the system from another thread. If not provided, the system runs until interrupted
+        :param metadata_interval: seconds between reloads of alarms, plants and contacts, checked after every alarm update. Plants and contacts
+        are replaced right away, while added or removed alarms start a new session. 0 disables reloading
+        """
+        if not isinstance(self.connector, IWatchingConnector):
+            raise TypeError(f"connector {type(self.connector).__name__} does not support watching events")
+
+        stop = stop or threading.Event()
+
+        try:
+            # a new session starts whenever the alarms processed by this instance change
+            while self._run_session(self.connector, flush_interval, metadata_interval, stop):
+                self.logger.info(f"alarms changed, reloading alarms...")
+        finally:
+            stop.set()
+            if self.coordinator is not None:
+                self.coordinator.leave()
+
+    def _run_session(self, connector: IWatchingConnector, flush_interval: float, metadata_interval: float, stop: threading.Event) -> bool:
+        """
+        load the alarms owned by this instance, catch up with their pending events, then process new events until stopped or until the
+        alarms to process change, because their owner changed or alarms were added or removed
+        :returns: whether the alarms to process changed, and a new session must start
+        """
+        connector.set_event_fields(self.processor.event_fields())
+        self._claim_alarms()
+
+        self.logger.debug(f"collecting system metadata")
+        with self.metrics.stage("load_system_metadata"):
+            alarms, plants, contacts = connector.load_system_metadata()
+        alarms = self._owned_alarms(alarms)
+
+        self.logger.debug(f"indexing contacts...")
+        contacts_indexed = {contact["plant_name"]: contact for contact in contacts}
+
+        self.logger.debug(f"indexing plants...")
+        plants_indexed = {str(plant["plant_name"]): plant for plant in plants}
+
+        self.logger.debug(f"indexing alarms...")
+        alarms_indexed: Dict[Tuple[str, str], List[Alarm]] = {}
+        for alarm in alarms:
+            alarms_indexed.setdefault((str(alarm["event_name"]), str(alarm["plant_name"])), []).append(alarm)
+
+        # start watching before catching up, so events recorded in the meantime are not lost. Watching stops with the session
+        session_stop = threading.Event()
+        watched_events = connector.watch_events(alarms, session_stop)
+        alarms_changed = False
+
+        try:
+            self.logger.debug(f"processing pending events...")
+            with self.metrics.stage("process_events"):
+                for alarm in alarms:
+                    alarm_events = self._checkpointing(connector.stream_alarm_events(alarm), alarms)
+                    self._process_alarm_events(alarm, plants_indexed[alarm["plant_name"]], contacts_indexed[alarm["plant_name"]], alarm_events)
+
+            self._update_system_alarms(connector, alarms)
+            self.metrics.export()
+            last_flush = last_reload = time.monotonic()
+
+            self.logger.info(f"watching new events of {len(alarms)} alarms")
+            for event in watched_events:
+                if stop.is_set():
+                    break
+
+                if event is not None:
+                    for alarm in alarms_indexed.get((str(event["event_name"]), str(event["plant_name"])), []):
+                        # events already processed during catch up may be received again
+                        if event["timestamp"] <= alarm["last_event"]:
+                            continue
+
+                        self._process_alarm_events(alarm, plants_indexed[alarm["plant_name"]], contacts_indexed[alarm["plant_name"]], [event])
+
+                if time.monotonic() - last_flush >= flush_interval:
+                    self.logger.debug(f"updating alarm information in remote...")
+                    self._update_system_alarms(connector, alarms)
+                    self.metrics.export()
+                    last_flush = time.monotonic()
+
+                    if self.coordinator is not None and self.coordinator.ownership_changed():
+                        alarms_changed = True
+                        break
+
+                    # alarm state was just persisted, so the alarms can be reloaded without losing changes
+                    if metadata_interval and time.monotonic() - last_reload >= metadata_interval:
+                        last_reload = time.monotonic()
+                        if self._reload_metadata(connector, alarms, plants_indexed, contacts_indexed):
+                            alarms_changed = True
+                            break
+        except KeyboardInterrupt:
+            self.logger.info(f"interrupted, stopping...")
+            stop.set()
+        finally:
+            session_stop.set()
+            # closing the watcher right away releases its change stream or cursor
+            close = getattr(watched_events, "close", None)
+            if close is not None:
+                close()
+
+            self.logger.debug(f"updating alarm information in remote...")
+            self._update_system_alarms(connector, alarms)
+            self.metrics.export()
+
+        return alarms_changed and not stop.is_set()
+
+    def _reload_metadata(self, connector: IStreamingConnector, alarms: List[Alarm], plants_indexed: Dict[str, Plant],
+                         contacts_indexed: Dict[str, PlantContacts]) -> bool:
+        """
+        load alarms, plants and contacts again while watching events. Plants and contacts replace the indexed ones in place
+        :returns: whether alarms were added or removed, in which case a new session must start to process them
+        """
+        self.logger.debug(f"reloading system metadata")
+        with self.metrics.stage("load_system_metadata"):
+            reloaded_alarms, plants, contacts = connector.load_system_metadata()
+        reloaded_alarms = self._owned_alarms(reloaded_alarms)
+
+        plants_indexed.clear()
+        plants_indexed.update({str(plant["plant_name"]): plant for plant in plants})
+        contacts_indexed.clear()
+        contacts_indexed.update({contact["plant_name"]: contact for contact in contacts})
+
+        return {alarm["id_alarm"] for alarm in reloaded_alarms} != {alarm["id_alarm"] for alarm in alarms}
+
+    def _process_alarm_jobs(self, jobs: List[AlarmJob], contacts_indexed: Dict[str, PlantContacts], streaming: bool = False):
+        """
+        process the events of every alarm, sequentially or in parallel if enabled
+        """
+        if self.workers <= 1:
+            alarms = [alarm for alarm, _, _ in jobs]
+            for alarm, plant, alarm_events in jobs:
+                self._process_alarm_events(alarm, plant, contacts_indexed[alarm["plant_name"]], self._checkpointing(alarm_events, alarms))
+            return
+
+        executor_type = self.executor_type
+        if streaming and executor_type == "process":
+            # event cursors cannot be sent to another process
+            self.logger.warning(f"process workers cannot read streamed events. Falling back to thread workers...")
+            executor_type = "thread"
+
+        self._process_alarm_jobs_in_parallel(jobs, contacts_indexed, executor_type)
+
+    def _process_alarm_jobs_in_parallel(self, jobs: List[AlarmJob], contacts_indexed: Dict[str, PlantContacts], executor_type: Literal["thread", "process"]):
+        """
+        process shards of alarm jobs in a pool of workers, then merge the results back in the order of the jobs and notify the triggered events
+        """
+        shards = shard_alarm_jobs(jobs, self.shard_by)
+        self.logger.debug(f"processing {len(jobs)} alarms in {len(shards)} shards with {self.workers} {executor_type} workers")
+
+        executor: Executor
+        if executor_type == "process":
+            # multiprocessing takes a while to import, so it is only imported once process workers are used
+            from concurrent.futures import ProcessPoolExecutor
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_shard_worker, initargs=(self.processor,))
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="processor")
+
+        with executor:
+            if executor_type == "process":
+                futures = [executor.submit(process_shard_in_worker, [jobs[position] for position in shard]) for shard in shards]
+            else:
+                futures = [executor.submit(process_shard, self.processor, [jobs[position] for position in shard]) for shard in shards]
+
+            results: List[AlarmResult] = [None] * len(jobs)  # type: ignore
+            for shard, future in zip(shards, futures):
+                if executor_type == "process":
+                    shard_results, worker_metrics = future.result()
+                    # metrics recorded by the processor in the worker process are added to the ones of this process
+                    if worker_metrics is not None and self.processor.metrics is not None:
+                        self.processor.metrics.merge(worker_metrics)
+                else:
+                    shard_results = future.result()
+
+                for position, result in zip(shard, shard_results):
+                    results[position] = result
+
+        for position, ((alarm, plant, _), (processed_alarm, triggers, processed_events)) in enumerate(zip(jobs, results)):
+            # alarms processed in another process come back as copies, which replace the state of the original alarm
+            if processed_alarm is not alarm:
+                alarm.clear()
+                alarm.update(processed_alarm)
+
+            for alarm_before_event, event, event_result in triggers:
+                self._notify(alarm_before_event, plant, contacts_indexed[alarm["plant_name"]], event, event_result)
+
+            # workers already left every alarm in its final state, so only alarms whose triggers were notified can be persisted
+            self._events_since_checkpoint += processed_events
+            if self._checkpoint_due():
+                self._checkpoint([job[0] for job in jobs[:position + 1]])
+
+    def _checkpointing(self, alarm_events: Iterable[Event], alarms: List[Alarm]) -> Iterator[Event]:
+        """
+        pass the events of an alarm through, checkpointing the alarms when due. Checkpoints are taken before handing over the next event,
+        when every event handed over so far is processed and its trigger notified
+        """
+        if not self.checkpoint_events and not self.checkpoint_seconds:
+            yield from alarm_events
+            return
+
+        for event in alarm_events:
+            if self._checkpoint_due():
+                self._checkpoint(alarms)
+
+            self._events_since_checkpoint += 1
+            yield event
+
+    def _checkpoint_due(self) -> bool:
+        if self.checkpoint_events and self._events_since_checkpoint >= self.checkpoint_events:
+            return True
+
+        return bool(self.checkpoint_seconds) and time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds
+
+    def _checkpoint(self, alarms: List[Alarm]):
+        """
+        persist the state of the alarms in the middle of a run. Alarms not processed yet are unchanged, so connectors that only write changed
+        alarms do not write them
+        """
+        self.logger.debug(f"checkpointing alarms after {self._events_since_checkpoint} events...")
+
+        with self.metrics.stage("checkpoint"):
+            self._update_system_alarms(self.connector, alarms)
+
+        self.metrics.increment("checkpoints_total")
+        self._events_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+    def _process_alarm_events(self, alarm: Alarm, plant: Plant, plant_contacts: PlantContacts, alarm_events: Iterable[Event]):
+        """
+        process the events of an alarm in order, notifying the ones that trigger it
+        """
+        for alarm_before_event, event, event_result in alarm_triggers(self.processor, alarm, plant, alarm_events):
+            self._notify(alarm_before_event, plant, plant_contacts, event, event_result)
+
+    def _notify(self, alarm: Alarm, plant: Plant, plant_contacts: PlantContacts, event: Event, event_result: Union[str, bool]):
+        self.metrics.increment("triggers_total", type_alarm=alarm["type_alarm"])
+
+        with self.metrics.timer("notify_trigger_seconds"):
+            notified = self.notifier.notify_trigger(alarm, plant, plant_contacts, event, event_result)
+
+        if not notified:
+            self.metrics.increment("notifications_failed_total", type_alarm=alarm["type_alarm"])
+
+    def _update_system_alarms(self, connector: IConnector, alarms: List[Alarm]):
+        """
+        persist the alarm state and report alarms that could not be updated
+        """
+        # alarm state must not be persisted before the notifications it accounts for are delivered
+        self.logger.debug(f"waiting for pending notifications...")
+        with self.metrics.stage("flush_notifications"):
+            self.notifier.flush()
+
+        if self.coordinator is not None:
+            owned_alarms = self._owned_alarms(alarms)
+            if len(owned_alarms) < len(alarms):
+                # another instance may be processing them already, and its state must not be overwritten
+                self.logger.warning(f"{len(alarms) - len(owned_alarms)} alarms are no longer owned by this instance, skipping their update")
+            alarms = owned_alarms
+
+        with self.metrics.stage("update_system_alarms"):
+            result = connector.update_system_alarms(alarms)
+
+        if isinstance(result, bool):
+            # connectors written before update results were introduced only tell whether every alarm was updated
+            result = {"updated": len(alarms), "unchanged": 0, "failed": 0} if result else {"updated": 0, "unchanged": 0, "failed": len(alarms)}
+
+        for outcome, amount in result.items():
+            self.metrics.increment("alarm_updates_total", amount, result=outcome)
+
+        self.logger.debug(f"alarm update result: {result}")
+        if result["failed"]:
+            self.logger.error(f"{result['failed']} alarms could not be updated in remote. Their events will be processed again on the next run")
+        elif self.outbox is not None:
+            # events up to the persisted last event of each alarm are not processed again, so their notifications can be forgotten
+            self.outbox.prune(alarms)
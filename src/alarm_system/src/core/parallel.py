@@ -0,0 +1,132 @@
+from itertools import count, islice
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional, Tuple, Union
+from .interfaces.processor import IProcessor
+from .metrics import Metrics
+from .snapshot import CopyOnWriteAlarm
+from .types import Alarm, Event, Plant
+
+
+PROCESSING_BATCH_SIZE = 100_000
+"""
+maximum number of events of an alarm handed to the processor at once, for alarms processed in batch
+"""
+
+
+Trigger = Tuple[Alarm, Event, Union[str, bool]]
+"""
+an event that must be notified, along with the alarm state before the event and the processor result
+"""
+
+
+AlarmJob = Tuple[Alarm, Plant, Iterable[Event]]
+"""
+an alarm along with its plant and its events, sorted by timestamp
+"""
+
+
+AlarmResult = Tuple[Alarm, List[Trigger], int]
+"""
+the state of an alarm after processing its events, the events that triggered it, and the number of events processed
+"""
+
+
+ShardKey = Literal["plant_name", "id_alarm"]
+"""
+alarm key used to split alarms into shards processed by the same worker
+"""
+
+
+def alarm_triggers(processor: IProcessor, alarm: Alarm, plant: Plant, alarm_events: Iterable[Event]) -> Iterator[Trigger]:
+    """
+    process the events of an alarm in order, leaving the alarm in its state after the last event
+    :returns: the events that trigger the alarm, as they are found
+    """
+    if processor.supports_batch_processing(alarm):
+        yield from _batch_alarm_triggers(processor, alarm, plant, alarm_events)
+        return
+
+    for event in alarm_events:
+        # changes made by the processor are kept apart until the event is processed, so the alarm is only copied if it must be notified
+        working_alarm = CopyOnWriteAlarm(alarm)
+        event_result = processor.process_event(working_alarm, plant, event)
+
+        if not event_result:
+            working_alarm.commit()
+            continue
+
+        # committing replaces the changed values of the alarm instead of modifying them, so only window states need copying
+        alarm_before_event = working_alarm.snapshot()
+        working_alarm.commit()
+
+        yield alarm_before_event, event, event_result
+
+
+def _batch_alarm_triggers(processor: IProcessor, alarm: Alarm, plant: Plant, alarm_events: Iterable[Event]) -> Iterator[Trigger]:
+    """
+    process the events of an alarm in batches, so a batch processor handles up to PROCESSING_BATCH_SIZE events in a single call
+    """
+    alarm_events = iter(alarm_events)
+
+    while True:
+        batch = list(islice(alarm_events, PROCESSING_BATCH_SIZE))
+
+        if not batch:
+            return
+
+        for index, event_result, alarm_before_event in processor.process_event_batch(alarm, plant, batch):
+            yield alarm_before_event, batch[index], event_result
+
+
+def shard_alarm_jobs(jobs: List[AlarmJob], shard_by: ShardKey) -> List[List[int]]:
+    """
+    group alarm jobs that share the same shard key, keeping the order of the jobs within each shard
+    :returns: the positions of the jobs of each shard, in order of first appearance
+    """
+    shards: Dict[Any, List[int]] = {}
+
+    for position, (alarm, _, _) in enumerate(jobs):
+        shards.setdefault(alarm[shard_by], []).append(position)
+
+    return list(shards.values())
+
+
+def process_shard(processor: IProcessor, jobs: List[AlarmJob]) -> List[AlarmResult]:
+    """
+    process the alarm jobs of a shard one after the other
+    :returns: the result of each alarm job
+    """
+    results: List[AlarmResult] = []
+
+    for alarm, plant, alarm_events in jobs:
+        # events may be streamed, so they are counted as they are processed. The counter only moves forward once an event is handed over
+        counter = count()
+        triggers = list(alarm_triggers(processor, alarm, plant, (event for event, _ in zip(alarm_events, counter))))
+        results.append((alarm, triggers, next(counter)))
+
+    return results
+
+
+# processor of the current worker process, set once when the pool starts instead of being sent along with every shard
+_worker_processor: Optional[IProcessor] = None
+
+
+def init_shard_worker(processor: IProcessor) -> None:
+    global _worker_processor
+    _worker_processor = processor
+
+
+def process_shard_in_worker(jobs: List[AlarmJob]) -> Tuple[List[AlarmResult], Optional[Metrics]]:
+    """
+    process_shard for process pools, using the processor the worker was initialized with
+    :returns: the results of process_shard, and the metrics recorded by the processor while processing the shard, if it records any
+    """
+    if _worker_processor is None:
+        raise RuntimeError(f"shard worker was not initialized with a processor")
+
+    metrics = _worker_processor.metrics
+    if not isinstance(metrics, Metrics):
+        return process_shard(_worker_processor, jobs), None
+
+    # the worker keeps its registry between shards, so only the metrics of this shard are sent back
+    metrics.reset()
+    return process_shard(_worker_processor, jobs), metrics
@@ -0,0 +1,34 @@
+from contextlib import contextmanager
+import io
+import logging
+from typing import Iterator, Optional
+
+
+@contextmanager
+def profiled(path: Optional[str], logger: logging.Logger, top: int = 20) -> Iterator[None]:
+    """
+    profile the block with cProfile, saving the stats to path and logging the functions with the highest cumulative time.
+    Does nothing if path is None
+    :param path: file the stats are saved to, readable with pstats or snakeviz
+    :param top: number of functions logged
+    """
+    if path is None:
+        yield
+        return
+
+    # the profiler modules are only imported by profiled runs
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        logger.info(f"profile saved to {path}")
+        logger.debug(f"profile summary:\n{summary.getvalue()}")
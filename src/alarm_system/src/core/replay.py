@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+
+ReplayWindow = Tuple[datetime, datetime]
+"""
+a time range of a replay. Triggers of events recorded after the first timestamp and up to the second are reported
+"""
+
+
+def replay_windows(start: datetime, end: datetime, chunk: Optional[timedelta] = None) -> List[ReplayWindow]:
+    """
+    split the time range of a replay into consecutive windows of chunk length, the last one possibly shorter
+    :param chunk: length of every window. The range is not split if None
+    """
+    if chunk is None:
+        return [(start, end)]
+
+    if chunk <= timedelta(0):
+        raise ValueError(f"replay chunks must be longer than 0, got {chunk}")
+
+    windows: List[ReplayWindow] = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + chunk, end)
+        windows.append((window_start, window_end))
+        window_start = window_end
+
+    return windows
@@ -0,0 +1,139 @@
+from copy import deepcopy
+from datetime import date, datetime, time, timedelta
+from collections.abc import ItemsView, ValuesView
+from typing import Any, Callable, List, Set, Tuple
+
+from .types import Alarm
+
+
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None), datetime, date, time, timedelta, tuple, frozenset)
+"""
+alarm values of these types can be handed out without copying them, as they cannot be modified in place
+"""
+
+
+WINDOW_STATE_FIELD = "windows"
+"""
+alarm field holding the state of the windows kept by the processor, by window name
+"""
+
+
+class WindowState(dict):
+    """
+    State of the windows of an alarm, by window name, updated in place by the processor with every event, even through a CopyOnWriteAlarm.
+    Stored alarms hold it as a plain dictionary
+    """
+
+    def copy(self) -> "WindowState":
+        # window states are lists of values and lists of values, which windows replace instead of modifying, so copying the lists is enough
+        return WindowState((name, [list(item) if isinstance(item, list) else item for item in state]) for name, state in self.items())
+
+
+class CopyOnWriteAlarm(dict):
+    """
+    A copy of an alarm whose changes are kept apart from the alarm until commit is called. It starts as a shallow copy, and mutable values
+    (lists, dicts...) are copied the first time they are read, so changes made in place never reach the underlying alarm either.
+
+    Window states are the exception: copying them with every event would make processing cost grow with their size, so they are handed out
+    as they are and updated in place by the processor, which records how to undo each update. snapshot, taken before commit, is an exact copy
+    of the previous state of the underlying alarm, windows included. Being a dict, processors can check its type or serialize it. Code reading
+    it without going through its methods, such as json.dumps, sees the values not read yet as they are in the underlying alarm
+    """
+    alarm: Alarm
+    # (window name, rollback function, checkpoint) of the window states updated in place since the last commit
+    _window_updates: List[Tuple[str, Callable[[List[Any], Any], None], Any]]
+
+    def __init__(self, alarm: Alarm) -> None:
+        super().__init__(alarm)
+        self.alarm = alarm
+        # keys whose value belongs to this copy, because it was copied or set
+        self._owned: Set[Any] = set()
+        self._window_updates = []
+
+    def __getitem__(self, key: Any) -> Any:
+        value = super().__getitem__(key)
+
+        if key in self._owned or isinstance(value, (IMMUTABLE_TYPES, WindowState)):
+            return value
+
+        # the caller may modify the value in place, so it gets its own copy
+        value = deepcopy(value)
+        self[key] = value
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        self._owned.add(key)
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self._owned.discard(key)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key not in self:
+            return super().pop(key, *default)
+
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self) -> Tuple[Any, Any]:
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def values(self) -> ValuesView:  # type: ignore[override]
+        return ValuesView(self)
+
+    def items(self) -> ItemsView:  # type: ignore[override]
+        return ItemsView(self)
+
+    def copy(self) -> Alarm:
+        return dict(self.items())
+
+    def track_window_update(self, name: str, rollback: Callable[[List[Any], Any], None], checkpoint: Any) -> None:
+        """
+        record an update made in place to a window state shared with the underlying alarm
+        :param rollback: function undoing the update on a copy of the window state, given the checkpoint
+        :param checkpoint: what rollback needs, taken before the update
+        """
+        self._window_updates.append((name, rollback, checkpoint))
+
+    def snapshot(self) -> Alarm:
+        """
+        shallow copy of the underlying alarm as it was before the changes, to be taken before commit. Window states updated in place are only
+        copied here, and their updates rolled back on the copy
+        """
+        snapshot = dict(self.alarm)
+
+        if self._window_updates:
+            windows = snapshot[WINDOW_STATE_FIELD] = snapshot[WINDOW_STATE_FIELD].copy()
+            for name, rollback, checkpoint in reversed(self._window_updates):
+                rollback(windows[name], checkpoint)
+
+        return snapshot
+
+    def commit(self) -> None:
+        """
+        apply the changes to the underlying alarm. Changed values replace the previous ones instead of modifying them
+        """
+        for key in [key for key in self.alarm if key not in self]:
+            del self.alarm[key]
+
+        self.alarm.update(super().items())
+        self._owned = set(self)
+        self._window_updates = []
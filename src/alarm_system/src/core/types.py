@@ -1,6 +1,6 @@
 
 from datetime import datetime
-from typing import Dict, List, Literal, Union
+from typing import Any, Dict, List, Literal, Tuple, Union
 
 Alarm = Dict[Literal["plant_name", "event_name", "id_alarm", "last_alarm", "last_event", "flag_alarm", "type_alarm"], Union[str, int, float, datetime, bool]]
 """
@@ -12,6 +12,8 @@ An alarm is a dictionary that represents a trigger condition which should be not
 :key last_event: the timestamp of the latest processed event
 :key flag_alarm: whether the alarm is currently triggered or not
 :key type_alarm: the type of alarm. Should be used to dispatch the correct processing method for the alarm
+Optional keys read by the alarm system:
+:key sftp_label: label of the sftp server the attachment cache downloads the event files of the alarm from, as given to enable_sftp. "default" if missing
 """
 
 
@@ -40,3 +42,30 @@ This object represents the contacting information of a given plant name. Should
 :key email_contacts: a list of email contacts (as strings) that should be notified when an event occurs in the given plant
 :key phone_contacts: a list of phone contacts as integer numbers (prefix included) that should be notified when an event occurs in the given plant
 """
+
+
+AlarmUpdateResult = Dict[Literal["updated", "unchanged", "failed"], int]
+"""
+Summary of an alarm update in the remote data source. Has the following keys:
+:key updated: number of alarms whose changes were written successfully
+:key unchanged: number of alarms that had no changes to write
+:key failed: number of alarms whose changes could not be written
+"""
+
+
+MetricsSnapshot = Dict[Literal["timestamp", "counters", "gauges", "histograms"], Union[float, List[Dict[str, Any]]]]
+"""
+The metrics recorded by the alarm system at a given time. Has the following keys:
+:key timestamp: unix time the snapshot was taken at
+:key counters: list of {"name", "labels", "value"} dictionaries, with the total value of each counter
+:key gauges: list of {"name", "labels", "value"} dictionaries, with the last value of each gauge
+:key histograms: list of {"name", "labels", "buckets", "sum", "count"} dictionaries. Buckets are [upper bound, count] pairs, not cumulative.
+Observations over the largest upper bound are only accounted for in count
+"""
+
+
+OutboxKey = Tuple[str, Union[datetime, int, float, str], str]
+"""
+Identifies a notification in the notification outbox: the alarm id, the timestamp of the event that triggered it and the message label,
+with the id and the label as strings
+"""
@@ -0,0 +1,35 @@
+import json
+from typing import Any, Dict, Sequence
+from ..core.interfaces.exporter import IMetricsExporter
+from ..core.metrics import bucket_quantile
+from ..core.types import MetricsSnapshot
+
+
+class JSONLinesExporter(IMetricsExporter):
+    """
+    appends every snapshot to a file as a single json line, so runs can be compared over time
+    """
+
+    def __init__(self, path: str, percentiles: Sequence[float] = (0.5, 0.9, 0.99)) -> None:
+        """
+        :param path: file the snapshots are appended to
+        :param percentiles: percentiles estimated from every histogram and included along with its buckets
+        """
+        self.path = path
+        self.percentiles = percentiles
+
+    def export(self, snapshot: MetricsSnapshot) -> None:
+        record = dict(snapshot)
+        record["histograms"] = [self._with_percentiles(histogram) for histogram in snapshot["histograms"]]
+
+        with open(self.path, "a") as metrics_file:
+            metrics_file.write(json.dumps(record, default=str) + "\n")
+
+    def _with_percentiles(self, histogram: Dict[str, Any]) -> Dict[str, Any]:
+        histogram = dict(histogram)
+
+        for percentile in self.percentiles:
+            # None when the percentile falls over the largest bucket
+            histogram[f"p{round(percentile * 100)}"] = bucket_quantile(histogram["buckets"], histogram["count"], percentile)
+
+        return histogram
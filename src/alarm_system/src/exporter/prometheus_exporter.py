@@ -0,0 +1,114 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from ..core.interfaces.exporter import IMetricsExporter
+from ..core.types import MetricsSnapshot
+
+
+def prometheus_text(snapshot: MetricsSnapshot, prefix: str = "alarm_system_") -> str:
+    """
+    format a snapshot in the prometheus text exposition format
+    """
+    lines: List[str] = []
+
+    for metric_type, entries in [("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])]:
+        for name, group in _group_by_name(entries).items():
+            lines.append(f"# TYPE {prefix}{name} {metric_type}")
+            lines.extend(f"{prefix}{name}{_labels(entry['labels'])} {entry['value']}" for entry in group)
+
+    for name, group in _group_by_name(snapshot["histograms"]).items():
+        lines.append(f"# TYPE {prefix}{name} histogram")
+
+        for entry in group:
+            cumulative = 0
+            for upper_bound, count in entry["buckets"]:
+                cumulative += count
+                lines.append(f"{prefix}{name}_bucket{_labels(entry['labels'], le=upper_bound)} {cumulative}")
+
+            lines.append(f"{prefix}{name}_bucket{_labels(entry['labels'], le='+Inf')} {entry['count']}")
+            lines.append(f"{prefix}{name}_sum{_labels(entry['labels'])} {entry['sum']}")
+            lines.append(f"{prefix}{name}_count{_labels(entry['labels'])} {entry['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _group_by_name(entries: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+
+    for entry in entries:
+        groups.setdefault(entry["name"], []).append(entry)
+
+    return groups
+
+
+def _labels(labels: Dict[str, str], **extra_labels: Any) -> str:
+    labels = {**labels, **{label: str(value) for label, value in extra_labels.items()}}
+
+    if not labels:
+        return ""
+
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{label}="{value}"' for label, value in zip(labels, escaped)) + "}"
+
+
+class PrometheusFileExporter(IMetricsExporter):
+    """
+    writes the metrics to a file in the prometheus text format, to be collected by the node exporter textfile collector
+    """
+
+    def __init__(self, path: str, prefix: str = "alarm_system_") -> None:
+        self.path = path
+        self.prefix = prefix
+
+    def export(self, snapshot: MetricsSnapshot) -> None:
+        # the file is replaced at once, so the collector never reads it half written
+        partial_path = f"{self.path}.part"
+
+        with open(partial_path, "w") as metrics_file:
+            metrics_file.write(prometheus_text(snapshot, self.prefix))
+
+        os.replace(partial_path, self.path)
+
+
+class PrometheusHTTPExporter(IMetricsExporter):
+    """
+    serves the last exported metrics in the prometheus text format at http://host:port/metrics, from a background thread
+    """
+    logger: logging.Logger
+
+    def __init__(self, port: int, logger: logging.Logger, host: str = "", prefix: str = "alarm_system_") -> None:
+        self.logger = logger
+        self.prefix = prefix
+        self._body = b""
+
+        exporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(exporter._body)))
+                self.end_headers()
+                self.wfile.write(exporter._body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                exporter.logger.debug(f"metrics endpoint: {format % args}")
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._thread: Optional[threading.Thread] = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+        self.logger.info(f"serving metrics at http://{host or '0.0.0.0'}:{self.server.server_port}/metrics")
+
+    def export(self, snapshot: MetricsSnapshot) -> None:
+        self._body = prometheus_text(snapshot, self.prefix).encode()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
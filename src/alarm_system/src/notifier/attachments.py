@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+"""
+maximum size in bytes of the attachment cache
+"""
+
+DEFAULT_SFTP_LABEL = "default"
+"""
+label of the sftp server attachments are downloaded from, for alarms without a sftp_label field
+"""
+
+
+class SFTPPool():
+    """
+    pool of sftp connections to a single server. Connections are opened when needed, up to pool_size, and reused afterwards
+    """
+
+    def __init__(self, host: str, sftp_user: str, sftp_pass: str, sftp_pk_path: str, logger: logging.Logger, *, pool_size: int = 2) -> None:
+        self.logger = logger
+        self.host = host
+        self.sftp_user = sftp_user
+        self.sftp_pass = sftp_pass
+        self.sftp_pk_path = sftp_pk_path
+
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        """
+        borrow a connection from the pool. Connections that fail are closed instead of being returned to the pool
+        """
+        with self._slots:
+            try:
+                ssh_client, sftp_client = self._idle.get_nowait()
+            except queue.Empty:
+                ssh_client, sftp_client = self._connect()
+
+            try:
+                yield sftp_client
+            except Exception:
+                ssh_client.close()
+                raise
+
+            self._idle.put((ssh_client, sftp_client))
+
+    def close(self) -> None:
+        while True:
+            try:
+                ssh_client, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+
+            ssh_client.close()
+
+    def _connect(self) -> Tuple:
+        # paramiko is only needed when attachments are downloaded by the notifier
+        import paramiko
+
+        self.logger.debug(f"opening sftp connection to {self.host}")
+
+        ssh_client = paramiko.SSHClient()
+        ssh_client.load_system_host_keys()
+        ssh_client.set_missing_host_key_policy(paramiko.WarningPolicy())
+        ssh_client.connect(self.host, username=self.sftp_user, password=self.sftp_pass, key_filename=self.sftp_pk_path or None)
+
+        return ssh_client, ssh_client.open_sftp()
+
+
+class AttachmentCache():
+    """
+    downloads attachments over sftp into a size-bounded local directory. The least recently used files are removed when the cache grows
+    over max_bytes. Downloads can be started ahead of time with prefetch, so files are ready when the notification is sent.
+
+    Files returned by fetch are pinned, and are not removed until released, so a notification being sent never loses its attachments. The
+    cache may grow over max_bytes while pinned files do not leave room for new ones
+    """
+    logger: logging.Logger
+    pools: Dict[str, SFTPPool]
+
+    def __init__(self, cache_dir: str, logger: logging.Logger, *, max_bytes: int = DEFAULT_CACHE_SIZE, workers: int = 4, pool_size: int = 2) -> None:
+        """
+        :param cache_dir: directory where downloaded files are kept
+        :param logger: a logger
+        :param max_bytes: maximum size of the cache directory
+        :param workers: number of files downloaded at the same time
+        :param pool_size: maximum number of connections per sftp server
+        """
+        self.logger = logger
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.pool_size = pool_size
+        self.pools = {}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attachments")
+        self._downloads: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # number of fetches of every pinned file not released yet
+        self._pins: Dict[str, int] = {}
+
+        # cached file names and sizes, from least to most recently used. Files left by previous runs are reused
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        existing_files = [entry for entry in os.scandir(self.cache_dir) if entry.is_file() and not entry.name.endswith(".part")]
+        for entry in sorted(existing_files, key=lambda entry: entry.stat().st_mtime):
+            self._entries[entry.name] = entry.stat().st_size
+
+        self._size = sum(self._entries.values())
+        self.logger.debug(f"attachment cache at {self.cache_dir} holds {len(self._entries)} files, {self._size} bytes")
+
+    def add_server(self, host: str, sftp_user: str, sftp_pass: str, sftp_pk_path: str, label: str = DEFAULT_SFTP_LABEL) -> None:
+        """
+        register the sftp server attachments with the given label are downloaded from
+        """
+        self.logger.debug(f"registered sftp server {host} for {label} attachments")
+        self.pools[label] = SFTPPool(host, sftp_user, sftp_pass, sftp_pk_path, self.logger, pool_size=self.pool_size)
+
+    def prefetch(self, remote_paths: List[str], label: str = DEFAULT_SFTP_LABEL) -> None:
+        """
+        start downloading files in the background, if they are not cached yet
+        :param label: label of the sftp server the files are downloaded from
+        """
+        for remote_path in remote_paths:
+            self._download(remote_path, label)
+
+    def fetch(self, remote_path: str, label: str = DEFAULT_SFTP_LABEL) -> Optional[str]:
+        """
+        get the local path of a remote file, downloading it if needed. The file is pinned until released
+        :param label: label of the sftp server the file is downloaded from
+        :returns: the local path, or None if the file could not be downloaded
+        """
+        file_name = self._file_name(remote_path, label)
+
+        try:
+            while True:
+                local_path = self._download(remote_path, label).result()
+
+                with self._lock:
+                    # the file may have been removed by other downloads before it could be pinned, in which case it is downloaded again
+                    if file_name in self._entries:
+                        self._pins[file_name] = self._pins.get(file_name, 0) + 1
+                        return local_path
+        except Exception as e:
+            self.logger.error(f"could not download attachment {remote_path}. Reason:\n{e}")
+            return None
+
+    def release(self, local_path: str) -> None:
+        """
+        unpin a file returned by fetch, once it is no longer used
+        """
+        file_name = os.path.basename(local_path)
+
+        with self._lock:
+            pins = self._pins.get(file_name, 0) - 1
+
+            if pins > 0:
+                self._pins[file_name] = pins
+                return
+
+            self._pins.pop(file_name, None)
+            self._evict()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+        for pool in self.pools.values():
+            pool.close()
+
+    def _download(self, remote_path: str, label: str) -> Future:
+        file_name = self._file_name(remote_path, label)
+        local_path = os.path.join(self.cache_dir, file_name)
+
+        with self._lock:
+            if file_name in self._entries:
+                self._entries.move_to_end(file_name)
+                done: Future = Future()
+                done.set_result(local_path)
+                return done
+
+            # files being downloaded are shared by every caller asking for them
+            try:
+                return self._downloads[file_name]
+            except KeyError:
+                download = self._executor.submit(self._get, remote_path, label, file_name)
+                self._downloads[file_name] = download
+                return download
+
+    def _get(self, remote_path: str, label: str, file_name: str) -> str:
+        local_path = os.path.join(self.cache_dir, file_name)
+        partial_path = f"{local_path}.part"
+
+        try:
+            try:
+                pool = self.pools[label]
+            except KeyError:
+                raise ValueError(f"no sftp server registered for {label} attachments") from None
+
+            with pool.connection() as sftp_client:
+                self.logger.debug(f"downloading attachment {remote_path}")
+                sftp_client.get(remote_path, partial_path)
+
+            # the file only becomes visible once complete, so an interrupted download is never served
+            os.replace(partial_path, local_path)
+            self._store(file_name, os.path.getsize(local_path))
+        finally:
+            with self._lock:
+                self._downloads.pop(file_name, None)
+
+        return local_path
+
+    def _store(self, file_name: str, size: int) -> None:
+        """
+        register a downloaded file and evict the least recently used ones until the cache fits in max_bytes
+        """
+        with self._lock:
+            self._entries[file_name] = size
+            self._size += size
+            self._evict(keep=file_name)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """
+        remove the least recently used files that are not pinned until the cache fits in max_bytes. Must be called holding the lock
+        :param keep: file that is not removed either, as it was just downloaded
+        """
+        for file_name in list(self._entries):
+            if self._size <= self.max_bytes:
+                return
+
+            if file_name == keep or file_name in self._pins:
+                continue
+
+            self._size -= self._entries.pop(file_name)
+
+            try:
+                os.remove(os.path.join(self.cache_dir, file_name))
+            except FileNotFoundError:
+                continue
+
+    @staticmethod
+    def _file_name(remote_path: str, label: str) -> str:
+        # keeping the extension lets the mailer guess the file type
+        extension = os.path.splitext(remote_path)[1]
+        return f"{hashlib.sha256(f'{label}:{remote_path}'.encode()).hexdigest()}{extension}"
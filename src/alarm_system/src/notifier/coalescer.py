@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+from ..core.types import Alarm
+from .types import Notification
+
+
+CoalescingRuleKey = Tuple[Optional[str], Optional[str], Optional[Union[str, bool]]]
+"""
+(alarm type, plant name, message label) a coalescing window applies to. None matches any value
+"""
+
+
+def window_end(window_start: Any, window: timedelta) -> Any:
+    """
+    end of a coalescing window, for event timestamps given as datetimes or as numbers of seconds, such as unix timestamps
+    """
+    if isinstance(window_start, (int, float)):
+        return window_start + window.total_seconds()
+
+    return window_start + window
+
+
+class NotificationCoalescer():
+    """
+    merge the notifications of an alarm that are triggered within a time window into a single digest. The first notification of a window is
+    sent right away, and the following ones are held and merged into a digest that is sent when the window ends. Windows are measured on event
+    timestamps, which may be datetimes or numbers of seconds
+    """
+    logger: logging.Logger
+    rules: Dict[CoalescingRuleKey, timedelta]
+
+    def __init__(self, logger: logging.Logger, on_merged: Optional[Callable[[Notification], None]] = None) -> None:
+        """
+        :param logger: a logger
+        :param on_merged: called with every held notification whose attachments are left out of its digest
+        """
+        self.logger = logger
+        self.rules = {}
+        self.on_merged = on_merged
+
+        # open windows, indexed by alarm and message label. Each holds the window start and the notifications held back
+        self._windows: Dict[Hashable, Tuple[Any, List[Notification]]] = {}
+        self._lock = threading.Lock()
+
+    def add_rule(self, window: float, *, alarm_type: Optional[str] = None, plant_name: Optional[str] = None, message_label: Optional[Union[str, bool]] = None) -> None:
+        """
+        coalesce notifications matching the given alarm type, plant name and message label within window seconds. Omitted values match any value
+        """
+        self.logger.debug(f"coalescing notifications of alarm type {alarm_type}, plant {plant_name} and label {message_label} within {window} seconds")
+        self.rules[(alarm_type, plant_name, message_label)] = timedelta(seconds=window)
+
+    def window(self, alarm: Alarm, message_label: Union[str, bool]) -> Optional[timedelta]:
+        """
+        the coalescing window of the most specific rule matching an alarm notification. Alarm type takes precedence over plant name, and plant
+        name over message label
+        """
+        for alarm_type in (alarm['type_alarm'], None):
+            for plant_name in (alarm['plant_name'], None):
+                for label in (message_label, None):
+                    try:
+                        return self.rules[(alarm_type, plant_name, label)]
+                    except KeyError:
+                        continue
+
+        return None
+
+    def coalesce(self, alarm: Alarm, message_label: Union[str, bool], notification: Notification) -> List[Notification]:
+        """
+        decide what to send after a new notification, based on its event timestamp
+        :returns: the notifications to send now. Empty if the notification was held to be merged in a digest
+        """
+        window = self.window(alarm, message_label)
+
+        if window is None:
+            return [notification]
+
+        key = (alarm['id_alarm'], message_label)
+        timestamp = notification['timestamp']
+
+        with self._lock:
+            try:
+                window_start, held = self._windows[key]
+            except KeyError:
+                self._windows[key] = (timestamp, [])
+                return [notification]
+
+            if timestamp < window_end(window_start, window):
+                held.append(notification)
+                return []
+
+            # the window is over, its digest is sent and the notification opens a new one
+            self._windows[key] = (timestamp, [])
+
+        return [*self._digests([held]), notification]
+
+    def flush(self) -> List[Notification]:
+        """
+        close every open window
+        :returns: the digests of the notifications held back
+        """
+        with self._lock:
+            windows = list(self._windows.values())
+            self._windows = {}
+
+        return self._digests([held for _, held in windows])
+
+    def _digests(self, held_notifications: List[List[Notification]]) -> List[Notification]:
+        return [self._digest(held) for held in held_notifications if held]
+
+    def _digest(self, held: List[Notification]) -> Notification:
+        """
+        merge several notifications of the same alarm in a single one. Only the attachments of the latest notification are kept
+        """
+        held = sorted(held, key=lambda notification: notification['timestamp'])
+        latest = held[-1]
+
+        header = f"{len(held)} notifications between {held[0]['timestamp']} and {latest['timestamp']}:"
+        body = "\n\n".join([header, *[notification['body'] for notification in held]])
+
+        self.logger.debug(f"merged {len(held)} notifications in a digest")
+
+        if self.on_merged is not None:
+            for notification in held[:-1]:
+                self.on_merged(notification)
+
+        return {
+            "subject": f"{latest['subject']} ({len(held)} times)",
+            "body": body,
+            "attachments": latest['attachments'],
+            "email_contacts": latest['email_contacts'],
+            "phone_contacts": latest['phone_contacts'],
+            "timestamp": latest['timestamp'],
+            "triggers": [trigger for notification in held for trigger in notification.get('triggers', [])],
+        }
+
+
+class RecipientRateLimiter():
+    """
+    limit how many notifications each recipient receives, with a token bucket per recipient. Each recipient can receive up to capacity
+    notifications at once, and regains one every per_seconds / capacity seconds
+    """
+
+    def __init__(self, capacity: int, per_seconds: float) -> None:
+        """
+        :param capacity: maximum number of notifications a recipient can receive in a burst
+        :param per_seconds: seconds needed to refill the whole bucket
+        """
+        self.capacity = capacity
+        self.refill_rate = capacity / per_seconds
+
+        # tokens left and last refill time of each recipient
+        self._buckets: Dict[Hashable, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, recipient: Hashable) -> bool:
+        """
+        consume a token of the recipient, if it has any left
+        :returns: whether the recipient can be notified
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, last_refill = self._buckets.get(recipient, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last_refill) * self.refill_rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self._buckets[recipient] = (tokens, now)
+
+        return allowed
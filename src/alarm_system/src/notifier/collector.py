@@ -0,0 +1,52 @@
+import logging
+import threading
+from typing import Dict, List, Optional, Union
+from ..core.interfaces.notifier import INotifier
+from ..core.types import Alarm, Event, Plant, PlantContacts
+from .types import CollectedNotification, MessageBuilder
+
+
+class CollectingNotifier(INotifier):
+    """
+    Records the notifications it is given instead of sending them, for dry runs such as replays. When given the message builders of a
+    notifier, it also records the message each notification would have been sent with, so new builders can be checked against past events
+    """
+    logger: logging.Logger
+    collected: List[CollectedNotification]
+
+    def __init__(self, logger: logging.Logger, message_builders: Optional[Dict[str, Dict[Union[str, bool], MessageBuilder]]] = None) -> None:
+        """
+        :param logger: a logger
+        :param message_builders: message builders by alarm type and message label, such as the ones of an EventNotifier. Messages are not built if None
+        """
+        self.logger = logger
+        self.message_builders = message_builders
+        self.collected = []
+        self._lock = threading.Lock()
+
+    def notify_trigger(self, alarm: Alarm, plant: Plant, contacts: PlantContacts, event: Event, message_label: Union[str, bool]) -> bool:
+        body = None
+
+        if self.message_builders is not None:
+            # read without indexing, as the builders of an EventNotifier are a defaultdict
+            body_builder = self.message_builders.get(str(alarm['type_alarm']), {}).get(message_label)
+
+            if body_builder is None:
+                self.logger.warning(f"No function registered to create a message for alarm type {alarm['type_alarm']} and label {message_label}")
+            else:
+                body = body_builder(alarm, event, plant, message_label, self.logger)
+
+        notification: CollectedNotification = {
+            "id_alarm": alarm['id_alarm'],
+            "event_name": alarm['event_name'],
+            "plant_name": alarm['plant_name'],
+            "type_alarm": alarm['type_alarm'],
+            "timestamp": event['timestamp'],
+            "message_label": message_label,
+            "body": body,
+        }
+
+        with self._lock:
+            self.collected.append(notification)
+
+        return True
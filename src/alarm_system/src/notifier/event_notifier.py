@@ -1,24 +1,85 @@
 from collections import defaultdict
+from contextlib import contextmanager, nullcontext
 import logging
-from typing import Dict, Union
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Dict, Iterator, List, Literal, Optional, Union
 from ..core.interfaces.notifier import INotifier
+from ..core.metrics import Metrics
 from ..core.types import Alarm, Event, Plant, PlantContacts
-from .types import MessageBuilder, NotifierConfig as Config
-from mailer import EmailAPI
-from .sms_alerter import SMSAlert
+from .types import MessageBuilder, Notification, NotificationStats, NotifierConfig as Config, SMTPSecurity
+from .attachments import DEFAULT_CACHE_SIZE, DEFAULT_SFTP_LABEL, AttachmentCache
+from .coalescer import NotificationCoalescer, RecipientRateLimiter
+
+if TYPE_CHECKING:
+    from .sms_alerter import SMSAlert
 
 
 #TODO sms for phone contacts
 class EventNotifier(INotifier):
     logger: logging.Logger
     message_builder_dispatcher: Dict[str, Dict[Union[str, bool], MessageBuilder]]
+    channel_limits: Dict[str, threading.BoundedSemaphore]
+    stats: NotificationStats
 
-    def __init__(self, config: Config, logger: logging.Logger) -> None:
+    def __init__(self, config: Config, logger: logging.Logger, metrics: Optional[Metrics] = None) -> None:
         self.logger = logger
         self.logger.debug(f"setting up EventNotifier")
-        self.mailer = EmailAPI(sender_addr=config['sender_email'], sender_pass=config['sender_password'], logger=self.logger)
-        self.sms_alerter = SMSAlert(sender=config['sender_sms'], token=config['token_sms'], pemfile=config['pemfile_sms'], logger=self.logger)
+        self.metrics = metrics or Metrics(self.logger)
+        self.config = config
+        # the mailer and the sms alerter are created on first use, so runs that send nothing do not import mailer and requests
+        self._mailer: Any = None
+        self._sms_alerter: Optional["SMSAlert"] = None
+        self._delivery_lock = threading.Lock()
         self.message_builder_dispatcher = defaultdict(dict)
+        self.channel_limits = {}
+        self.retries = 0
+        self.backoff = 1.0
+        self.delivery_callbacks: List[Callable[[Alarm, Event, Union[str, bool]], None]] = []
+
+        self.coalescer = NotificationCoalescer(self.logger, on_merged=self._release_attachments)
+        self.rate_limiter: Optional[RecipientRateLimiter] = None
+        self.attachment_cache: Optional[AttachmentCache] = None
+        self.stats = {"sent": 0, "merged": 0, "suppressed": 0}
+        self._stats_lock = threading.Lock()
+
+
+    @property
+    def mailer(self) -> Any:
+        """
+        mailer sending the emails. An EmailAPI by default, created on first use
+        """
+        with self._delivery_lock:
+            if self._mailer is None:
+                from mailer import EmailAPI
+
+                self._mailer = EmailAPI(sender_addr=self.config['sender_email'], sender_pass=self.config['sender_password'], logger=self.logger)
+
+            return self._mailer
+
+    @mailer.setter
+    def mailer(self, mailer: Any) -> None:
+        self._mailer = mailer
+
+
+    @property
+    def sms_alerter(self) -> "SMSAlert":
+        """
+        sms alerter sending the sms, created on first use
+        """
+        with self._delivery_lock:
+            if self._sms_alerter is None:
+                from .sms_alerter import SMSAlert
+
+                # optional sms settings are only forwarded when present, so the alerter can fall back to its defaults
+                sms_options = {option: self.config[key] for key, option in [("sms_url", "url"), ("sms_timeout", "timeout"), ("sms_batch_size", "batch_size")] if key in self.config}
+                self._sms_alerter = SMSAlert(sender=self.config['sender_sms'], token=self.config['token_sms'], pemfile=self.config['pemfile_sms'], logger=self.logger, **sms_options)
+
+            return self._sms_alerter
+
+    @sms_alerter.setter
+    def sms_alerter(self, sms_alerter: "SMSAlert") -> None:
+        self._sms_alerter = sms_alerter
 
 
     def notify_trigger(self, alarm: Alarm, plant: Plant, contacts: PlantContacts, event: Event, message_label: Union[str, bool]) -> bool:
@@ -46,19 +107,153 @@ class EventNotifier(INotifier):
         except KeyError:
             self.logger.warning(f"No information found about original image")
 
-        email_recipients = contacts['email_contacts']
+        if self.attachment_cache is not None:
+            with self.metrics.timer("attachment_fetch_seconds"):
+                attachments = self._cached_attachments(attachments, alarm.get('sftp_label', DEFAULT_SFTP_LABEL))
+
+        notification: Notification = {
+            "subject": subject,
+            "body": body,
+            "attachments": attachments,
+            "email_contacts": contacts['email_contacts'],
+            "phone_contacts": contacts['phone_contacts'],
+            "timestamp": event['timestamp'],
+            "triggers": [(alarm, event, message_label)],
+        }
+
+        to_send = self.coalescer.coalesce(alarm, message_label, notification)
+
+        if not to_send:
+            self.logger.debug(f"notification of alarm {alarm['event_name']} held to be merged in a digest")
+            self._count("merged")
+
+        for pending_notification in to_send:
+            self._send(pending_notification)
+
+        return True
+
+
+    def flush(self) -> None:
+        for digest in self.coalescer.flush():
+            self._send(digest)
+
+        self.logger.debug(f"notification stats: {self.stats}")
+
+
+    def _send(self, notification: Notification) -> None:
+        """
+        send a notification through every channel. A channel that fails does not stop the others, and its error is raised once they are done.
+        Delivery callbacks are only called once every channel succeeded
+        """
+        try:
+            self._send_channels(notification)
+        finally:
+            self._release_attachments(notification)
+
+        for alarm, event, message_label in notification.get('triggers', []):
+            for callback in self.delivery_callbacks:
+                callback(alarm, event, message_label)
+
+
+    def _send_channels(self, notification: Notification) -> None:
+        error: Optional[Exception] = None
+        email_recipients = self._allowed_recipients(notification['email_contacts'])
 
         if email_recipients:
-            self.mailer.send_email(to=email_recipients, subject=subject, body=body, attachments=attachments)
+            try:
+                self._deliver("email", lambda: self.mailer.send_email(to=email_recipients, subject=notification['subject'], body=notification['body'], attachments=notification['attachments']))
+            except Exception as e:
+                error = e
 
-        phone_recipients = contacts['phone_contacts']
+        phone_recipients = self._allowed_recipients(notification['phone_contacts'])
 
         if phone_recipients:
-            self.sms_alerter.send_sms(message=body, recipients=phone_recipients)
+            try:
+                self._deliver("sms", lambda: self._send_sms(notification['body'], phone_recipients))
+            except Exception as e:
+                error = error or e
+
+        if error is not None:
+            raise error
+
+        self._count("sent")
 
+
+    def _send_sms(self, message: str, recipients: List) -> None:
+        """
+        send an sms, raising an error if the gateway did not accept it, so it is retried and the notification is not reported as delivered
+        """
+        if not self.sms_alerter.send_sms(message=message, recipients=recipients):
+            raise RuntimeError(f"sms gateway did not accept the message for {len(recipients)} recipients")
+
+
+    def _deliver(self, channel: str, send: Callable[[], Any]) -> Any:
+        """
+        send through a channel, retrying with exponential backoff if it raises an error
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self._channel(channel), self._send_metrics(channel):
+                    return send()
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+
+                delay = self.backoff * 2 ** attempt
+                self.metrics.increment("notification_retries_total")
+                self.logger.warning(f"could not send {channel} notification, retrying in {delay} seconds. Reason:\n{e}")
+                time.sleep(delay)
+
+        return None
+
+
+    def retry_deliveries(self, retries: int, backoff: float) -> bool:
+        self.retries = retries
+        self.backoff = backoff
         return True
-    
 
+
+    def on_delivered(self, callback: Callable[[Alarm, Event, Union[str, bool]], None]) -> bool:
+        self.delivery_callbacks.append(callback)
+        return True
+
+
+    @contextmanager
+    def _send_metrics(self, channel: str) -> Iterator[None]:
+        """
+        time a delivery through a channel, counting it as failed if it raises an error
+        """
+        try:
+            with self.metrics.timer("notification_send_seconds", channel=channel):
+                yield
+        except Exception:
+            self.metrics.increment("notifications_failed_total", channel=channel)
+            raise
+
+
+    def _allowed_recipients(self, recipients: List) -> List:
+        """
+        recipients that have not exceeded their rate limit
+        """
+        if self.rate_limiter is None:
+            return recipients
+
+        allowed = [recipient for recipient in recipients if self.rate_limiter.allow(recipient)]
+
+        if len(allowed) < len(recipients):
+            self.logger.warning(f"{len(recipients) - len(allowed)} recipients exceeded their rate limit and will not be notified")
+            self._count("suppressed", len(recipients) - len(allowed))
+
+        return allowed
+
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[stat] += amount
+
+        self.metrics.increment("notifications_total", amount, outcome=stat)
+
+    
     def register_message_builder(self, alarm_type: str, message_builder: MessageBuilder, *, message_label: Union[str, bool]=True) -> None:
         """
         registers a function to build the message of a given alarm type
@@ -69,6 +264,111 @@ class EventNotifier(INotifier):
 
     def enable_sftp(self, host: str, sftp_user: str, sftp_pass: str, sftp_pk_path: str, label: str="default") -> bool:
         """
-        enables sftp connection for the mailer module
+        enables sftp connection for the mailer module, or for the attachment cache if it is enabled
         """
+        if self.attachment_cache is not None:
+            self.attachment_cache.add_server(host, sftp_user, sftp_pass, sftp_pk_path, label=label)
+            return True
+
         return self.mailer.enable_sftp(host, sftp_user, sftp_pass, sftp_pk_path, label=label)
+
+
+    def enable_attachment_cache(self, cache_dir: str, *, max_bytes: int = DEFAULT_CACHE_SIZE, workers: int = 4, pool_size: int = 2) -> None:
+        """
+        download attachments with a pool of sftp connections into a local cache, instead of letting the mailer download them while sending each email.
+        Files are downloaded from the sftp server registered with the sftp_label of the alarm, or "default". They start downloading as soon as a
+        notification is queued when used with a NotificationQueue, and when the notification is sent otherwise. Must be called before enable_sftp
+        :param cache_dir: directory where downloaded files are kept
+        :param max_bytes: maximum size of the cache. Least recently used files are removed first
+        :param workers: number of files downloaded at the same time
+        :param pool_size: maximum number of connections per sftp server
+        """
+        self.logger.debug(f"caching attachments in {cache_dir}")
+        self.attachment_cache = AttachmentCache(cache_dir, self.logger, max_bytes=max_bytes, workers=workers, pool_size=pool_size)
+
+
+    def prefetch(self, alarm: Alarm, event: Event) -> None:
+        if self.attachment_cache is None:
+            return
+
+        self.attachment_cache.prefetch([event[key] for key in ("ftp_inference", "ftp_original") if key in event], alarm.get('sftp_label', DEFAULT_SFTP_LABEL))
+
+
+    def _cached_attachments(self, attachments: Dict[str, str], label: str) -> Dict[str, str]:
+        """
+        replace remote attachment paths with their local copies, pinned until the notification is sent. Attachments that could not be
+        downloaded are skipped
+        """
+        cached_attachments: Dict[str, str] = {}
+
+        for remote_path, file_name in attachments.items():
+            local_path = self.attachment_cache.fetch(remote_path, label)
+
+            if local_path is None:
+                continue
+
+            cached_attachments[local_path] = file_name
+
+        return cached_attachments
+
+
+    def _release_attachments(self, notification: Notification) -> None:
+        """
+        unpin the cached attachments of a notification that was sent, or merged in a digest without them
+        """
+        if self.attachment_cache is None:
+            return
+
+        for local_path in notification['attachments']:
+            self.attachment_cache.release(local_path)
+
+
+    def enable_smtp_pool(self, host: str, port: int = 587, *, security: SMTPSecurity = "starttls", pool_size: int = 2, max_idle: float = 30.0) -> None:
+        """
+        send emails over a pool of persistent smtp connections, logged in with the sender email and password, instead of opening a session per email.
+        Attachments are only sent if the attachment cache is enabled, as the pool does not download them
+        :param host: smtp server
+        :param port: smtp server port. Usually 587 for starttls, 465 for ssl
+        :param security: "starttls", "ssl", or "none" for local test servers
+        :param pool_size: maximum number of open connections. Should be at least the email channel limit, if any
+        :param max_idle: seconds a connection can stay idle before it is checked when reused
+        """
+        self.logger.debug(f"sending emails through a pool of {pool_size} connections to {host}:{port}")
+
+        if self.attachment_cache is None:
+            self.logger.warning(f"attachment cache is not enabled, emails will be sent without remote attachments")
+
+        from .smtp_mailer import SMTPMailer
+
+        self.mailer = SMTPMailer(self.config['sender_email'], self.config['sender_password'], host, self.logger, port=port, security=security, pool_size=pool_size, max_idle=max_idle)
+
+
+    def limit_channel(self, channel: Literal["email", "sms"], max_concurrency: int) -> None:
+        """
+        limits how many notifications can be sent at the same time through a channel, when notifications are sent from several threads
+        """
+        self.logger.debug(f"limiting {channel} channel to {max_concurrency} concurrent notifications")
+        self.channel_limits[channel] = threading.BoundedSemaphore(max_concurrency)
+
+
+    def _channel(self, channel: str) -> ContextManager:
+        try:
+            return self.channel_limits[channel]
+        except KeyError:
+            return nullcontext()
+
+
+    def coalesce_notifications(self, window: float, *, alarm_type: Optional[str] = None, plant_name: Optional[str] = None, message_label: Optional[Union[str, bool]] = None) -> None:
+        """
+        send the first notification of an alarm right away, and merge the ones triggered within the next window seconds into a digest. The rule
+        applies to the given alarm type, plant name and message label. Omitted values match any value
+        """
+        self.coalescer.add_rule(window, alarm_type=alarm_type, plant_name=plant_name, message_label=message_label)
+
+
+    def rate_limit_recipients(self, max_notifications: int, per_seconds: float) -> None:
+        """
+        limit every recipient to max_notifications notifications every per_seconds seconds. Deliveries over the limit are dropped
+        """
+        self.logger.debug(f"limiting recipients to {max_notifications} notifications every {per_seconds} seconds")
+        self.rate_limiter = RecipientRateLimiter(max_notifications, per_seconds)
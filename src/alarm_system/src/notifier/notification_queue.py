@@ -0,0 +1,154 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple, Union
+from ..core.interfaces.notifier import INotifier
+from ..core.metrics import Metrics
+from ..core.types import Alarm, Event, Plant, PlantContacts
+
+
+NotificationJob = Tuple[Alarm, Plant, PlantContacts, Event, Union[str, bool]]
+"""
+arguments of a queued notify_trigger call
+"""
+
+
+class NotificationQueue(INotifier):
+    """
+    Delivers notifications of another notifier in the background. Triggers are put in bounded queues drained by a pool of worker threads,
+    so processing does not wait on slow notification channels. When a queue is full, notify_trigger blocks until there is room for the trigger.
+
+    Every worker has its own queue, and the triggers of an alarm always go to the same one, so they are delivered in the order they were
+    triggered, and a deactivation is never sent before its activation
+    """
+    logger: logging.Logger
+    notifier: INotifier
+
+    def __init__(self, notifier: INotifier, logger: logging.Logger, *, workers: int = 4, max_size: int = 1000, retries: int = 3, backoff: float = 1.0, metrics: Optional[Metrics] = None) -> None:
+        """
+        :param notifier: the notifier that delivers the notifications
+        :param logger: a logger
+        :param workers: number of threads delivering notifications
+        :param max_size: maximum number of pending notifications, split evenly between the workers. Processing blocks while the queue of the
+            worker of an alarm is full
+        :param retries: number of times a notification that raised an error is retried. Notifiers that retry their channels on their own, as
+            EventNotifier does, only retry the channels that failed
+        :param backoff: seconds to wait before the first retry. The wait doubles with every retry
+        :param metrics: registry where queue depth and delivery results are recorded
+        """
+        self.logger = logger
+        self.logger.debug(f"setting up NotificationQueue with {workers} workers")
+        self.metrics = metrics or Metrics(self.logger)
+
+        self.notifier = notifier
+        self.retries = retries
+        self.backoff = backoff
+        self.channel_retries = notifier.retry_deliveries(retries, backoff)
+
+        self.delivered = 0
+        self.failed = 0
+        self._stats_lock = threading.Lock()
+
+        workers = max(workers, 1)
+        self.queues: "List[queue.Queue[Union[NotificationJob, None]]]" = [queue.Queue(maxsize=max(max_size // workers, 1)) for _ in range(workers)]
+        self.workers: List[threading.Thread] = [
+            threading.Thread(target=self._work, args=(worker_queue,), name=f"notifier-{idx}", daemon=True) for idx, worker_queue in enumerate(self.queues)
+        ]
+
+        for worker in self.workers:
+            worker.start()
+
+
+    def notify_trigger(self, alarm: Alarm, plant: Plant, contacts: PlantContacts, event: Event, message_label: Union[str, bool]) -> bool:
+        # attachments start downloading while the notification waits in the queue
+        self.notifier.prefetch(alarm, event)
+
+        worker_queue = self.queues[hash(str(alarm["id_alarm"])) % len(self.queues)]
+
+        if worker_queue.full():
+            self.logger.debug(f"notification queue full, waiting for workers...")
+            self.metrics.increment("notification_queue_full_total")
+
+        worker_queue.put((alarm, plant, contacts, event, message_label))
+        self.metrics.set_gauge("notification_queue_depth", self.depth())
+
+        return True
+
+
+    def on_delivered(self, callback: Callable[[Alarm, Event, Union[str, bool]], None]) -> bool:
+        return self.notifier.on_delivered(callback)
+
+
+    def depth(self) -> int:
+        """
+        number of pending notifications
+        """
+        return sum(worker_queue.qsize() for worker_queue in self.queues)
+
+
+    def flush(self) -> None:
+        for worker_queue in self.queues:
+            worker_queue.join()
+
+        self.notifier.flush()
+
+        self.logger.debug(f"notifications delivered: {self.delivered}, failed: {self.failed}")
+
+
+    def close(self) -> None:
+        """
+        deliver pending notifications and stop the workers
+        """
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+
+        for worker in self.workers:
+            worker.join()
+
+        self.notifier.flush()
+
+
+    def _work(self, worker_queue: "queue.Queue[Union[NotificationJob, None]]") -> None:
+        while True:
+            job = worker_queue.get()
+
+            try:
+                if job is None:
+                    return
+
+                self.metrics.set_gauge("notification_queue_depth", self.depth())
+                delivered = self._deliver(job)
+
+                with self._stats_lock:
+                    if delivered:
+                        self.delivered += 1
+                    else:
+                        self.failed += 1
+
+                self.metrics.increment("notification_queue_jobs_total", result="delivered" if delivered else "failed")
+            finally:
+                worker_queue.task_done()
+
+
+    def _deliver(self, job: NotificationJob) -> bool:
+        """
+        deliver a notification, retrying with exponential backoff if the notifier raises an error and does not retry its channels on its own
+        """
+        alarm = job[0]
+        retries = 0 if self.channel_retries else self.retries
+
+        for attempt in range(retries + 1):
+            try:
+                return self.notifier.notify_trigger(*job)
+            except Exception as e:
+                if attempt == retries:
+                    self.logger.error(f"could not notify alarm {alarm['event_name']} after {attempt + 1} attempts. Reason:\n{e}")
+                    return False
+
+                delay = self.backoff * 2 ** attempt
+                self.metrics.increment("notification_retries_total")
+                self.logger.warning(f"could not notify alarm {alarm['event_name']}, retrying in {delay} seconds. Reason:\n{e}")
+                time.sleep(delay)
+
+        return False
@@ -0,0 +1,155 @@
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Union
+from ..core.interfaces.notifier import INotifier
+from ..core.interfaces.outbox import INotificationOutbox
+from ..core.metrics import Metrics
+from ..core.types import Alarm, Event, OutboxKey, Plant, PlantContacts
+
+
+def outbox_key(alarm: Alarm, event: Event, message_label: Union[str, bool]) -> OutboxKey:
+    """
+    key of the notification of an event that triggered an alarm
+    """
+    return str(alarm["id_alarm"]), event["timestamp"], str(message_label)
+
+
+def _encode_key(key: OutboxKey) -> str:
+    id_alarm, timestamp, message_label = key
+    # datetimes are tagged, so they are read back as datetimes and can be compared with the last event of the alarms
+    encoded_timestamp: Any = {"$date": timestamp.isoformat()} if isinstance(timestamp, datetime) else timestamp
+    return json.dumps([id_alarm, encoded_timestamp, message_label])
+
+
+def _decode_key(line: str) -> OutboxKey:
+    id_alarm, timestamp, message_label = json.loads(line)
+    if isinstance(timestamp, dict):
+        timestamp = datetime.fromisoformat(timestamp["$date"])
+
+    return id_alarm, timestamp, message_label
+
+
+class FileOutbox(INotificationOutbox):
+    """
+    Keeps the delivered notifications in memory and appends them to a local file, one json line each, so they survive a restart.
+    The file is rewritten when pruned, so it only holds the notifications of events not persisted yet
+    """
+
+    def __init__(self, path: str, logger: logging.Logger) -> None:
+        """
+        :param path: file where delivered notifications are recorded. Notifications recorded by a previous run are loaded from it
+        :param logger: a logger
+        """
+        self.path = path
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._delivered: Set[OutboxKey] = set()
+
+        try:
+            with open(self.path) as outbox_file:
+                for line in outbox_file:
+                    try:
+                        self._delivered.add(_decode_key(line))
+                    except ValueError:
+                        # the last line may be cut short if the process was killed while writing it
+                        self.logger.warning(f"ignoring malformed outbox entry: {line!r}")
+        except FileNotFoundError:
+            pass
+
+        self.logger.debug(f"notification outbox {self.path} loaded with {len(self._delivered)} delivered notifications")
+        self._file = open(self.path, "a")
+
+    def contains(self, key: OutboxKey) -> bool:
+        return key in self._delivered
+
+    def add(self, key: OutboxKey) -> None:
+        with self._lock:
+            self._delivered.add(key)
+            self._file.write(_encode_key(key) + "\n")
+            # written to disk right away, so the entry survives the process being killed or the host losing power
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def prune(self, alarms: List[Alarm]) -> None:
+        last_events: Dict[str, Any] = {str(alarm["id_alarm"]): alarm["last_event"] for alarm in alarms}
+
+        with self._lock:
+            pending = {
+                key for key in self._delivered
+                if key[0] not in last_events or not key[1] <= last_events[key[0]]
+            }
+
+            if len(pending) == len(self._delivered):
+                return
+
+            self.logger.debug(f"pruning {len(self._delivered) - len(pending)} notifications from outbox")
+            self._delivered = pending
+
+            # the file is replaced at once, so a crash while pruning leaves either the old or the new outbox
+            self._file.close()
+            with open(self.path + ".part", "w") as outbox_file:
+                outbox_file.writelines(_encode_key(key) + "\n" for key in pending)
+            os.replace(self.path + ".part", self.path)
+            self._file = open(self.path, "a")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class OutboxNotifier(INotifier):
+    """
+    Records the notifications delivered by another notifier in an outbox, and skips the ones already recorded. Events processed again after a
+    crash, because the alarm state was not persisted yet, are not notified twice.
+
+    Notifications are recorded once they are actually sent. Notifiers that tell when they send a notification, as EventNotifier does for the
+    ones it holds to merge in a digest, record it then. Other notifiers are considered to deliver a notification when notify_trigger returns
+    True. When used with a NotificationQueue, the queue should wrap this notifier, so notifications are checked against the outbox when delivered
+    """
+    logger: logging.Logger
+
+    def __init__(self, notifier: INotifier, outbox: INotificationOutbox, logger: logging.Logger, metrics: Optional[Metrics] = None) -> None:
+        """
+        :param notifier: the notifier that delivers the notifications
+        :param outbox: where delivered notifications are recorded
+        :param logger: a logger
+        :param metrics: registry where skipped notifications are counted
+        """
+        self.notifier = notifier
+        self.outbox = outbox
+        self.logger = logger
+        self.metrics = metrics or Metrics(self.logger)
+        self.records_on_delivery = self.notifier.on_delivered(self._record)
+
+    def notify_trigger(self, alarm: Alarm, plant: Plant, contacts: PlantContacts, event: Event, message_label: Union[str, bool]) -> bool:
+        key = outbox_key(alarm, event, message_label)
+
+        if self.outbox.contains(key):
+            self.logger.debug(f"alarm {alarm['event_name']} of plant {plant['plant_name']} already notified for event at {event['timestamp']}, skipping")
+            self.metrics.increment("notifications_skipped_total")
+            return True
+
+        notified = self.notifier.notify_trigger(alarm, plant, contacts, event, message_label)
+
+        if notified and not self.records_on_delivery:
+            self.outbox.add(key)
+
+        return notified
+
+    def _record(self, alarm: Alarm, event: Event, message_label: Union[str, bool]) -> None:
+        self.outbox.add(outbox_key(alarm, event, message_label))
+
+    def flush(self) -> None:
+        self.notifier.flush()
+
+    def prefetch(self, alarm: Alarm, event: Event) -> None:
+        self.notifier.prefetch(alarm, event)
+
+    def retry_deliveries(self, retries: int, backoff: float) -> bool:
+        return self.notifier.retry_deliveries(retries, backoff)
+
+    def on_delivered(self, callback: Callable[[Alarm, Event, Union[str, bool]], None]) -> bool:
+        return self.notifier.on_delivered(callback)
@@ -1,6 +1,20 @@
 import logging
-from typing import List
+from typing import Any, Dict, List, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_SMS_URL = "https://gatewayapi.com/rest/mtsms"
+"""
+gateway api endpoint used to send sms
+"""
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+"""
+gateway responses that are retried, as they signal a temporary failure
+"""
+
 
 class SMSAlert():
     """
@@ -10,25 +24,80 @@ class SMSAlert():
     sender: str
     token: str
     pemfile: str
+    session: requests.Session
 
-    def __init__(self, sender: str, token: str, pemfile: str, logger: logging.Logger) -> None:
+    def __init__(self, sender: str, token: str, pemfile: str, logger: logging.Logger, *, url: str = DEFAULT_SMS_URL, timeout: float = 10.0, retries: int = 3, backoff: float = 0.5, pool_size: int = 10, batch_size: int = 100) -> None:
         """
         :param sender: sender name, like "Cetaqua"
         :param token: token used for the sms api
         :param pemfile: path to the api public certificate (a pem file)
         :param logger: a logger
+        :param url: gateway api endpoint
+        :param timeout: seconds to wait for the gateway to answer
+        :param retries: number of times a request is retried when the gateway is unavailable or rate limits the requests
+        :param backoff: backoff factor between retries, in seconds
+        :param pool_size: maximum number of connections to the gateway kept alive
+        :param batch_size: maximum number of messages sent in a single request by send_sms_batch
         """
         
         self.logger = logger
         self.sender = sender
         self.token = token
         self.pemfile = pemfile
+        self.url = url
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+        # a single session keeps connections to the gateway alive, so the tls handshake is done once per connection
+        self.session = requests.Session()
+        self.session.auth = (self.token, "")
+        self.session.verify = self.pemfile
+
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS_CODES, allowed_methods=frozenset(["POST"]), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
         self.logger.debug(f"SMS service initialized")
 
-    def send_sms(self, message: str, recipients: List[int]):
+    def send_sms(self, message: str, recipients: List[int]) -> bool:
+        """
+        send a message to a list of phone numbers
+        :returns: whether the gateway accepted the message
+        """
+        payload = self._message_payload(message, recipients)
+
+        self.logger.debug(f"sending sms alert: {payload}")
+
+        return self._post(payload)
+
+    def send_sms_batch(self, messages: List[Tuple[str, List[int]]]) -> int:
+        """
+        send several messages, grouping up to batch_size messages in each request to the gateway
+        :param messages: list of (message, recipients) pairs
+        :returns: number of messages accepted by the gateway
+        """
+        payloads = [self._message_payload(message, recipients) for message, recipients in messages]
+
+        sent = 0
+        for start in range(0, len(payloads), self.batch_size):
+            batch = payloads[start:start + self.batch_size]
+
+            self.logger.debug(f"sending batch of {len(batch)} sms alerts")
+
+            if self._post(batch):
+                sent += len(batch)
+
+        return sent
 
-        payload = {
+    def close(self) -> None:
+        """
+        close the connections to the gateway
+        """
+        self.session.close()
+
+    def _message_payload(self, message: str, recipients: List[int]) -> Dict[str, Any]:
+        return {
             "sender": self.sender,
             "message": message,
             "recipients": [
@@ -37,16 +106,14 @@ class SMSAlert():
             ],
         }
 
-        self.logger.debug(f"sending sms alert: {payload}")
-
+    def _post(self, payload: Any) -> bool:
         try:
-            resp = requests.post(
-                "https://gatewayapi.com/rest/mtsms",
-                json=payload,
-                auth=(self.token, ""),
-                verify=self.pemfile
-            )
+            resp = self.session.post(self.url, json=payload, timeout=self.timeout)
 
             resp.raise_for_status()
-        except requests.HTTPError as e:
-            self.logger.error(f"could not send sms alert to recipients. Reason:\n{e}")
\ No newline at end of file
+        except requests.RequestException as e:
+            # connection errors and timeouts are reported as failed deliveries, the same as rejected requests
+            self.logger.error(f"could not send sms alert to recipients. Reason:\n{e}")
+            return False
+
+        return True
@@ -0,0 +1,246 @@
+import base64
+import logging
+import mimetypes
+import queue
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.message import EmailMessage, MIMEPart
+from email.policy import SMTP
+from email.utils import formatdate, make_msgid
+from typing import Dict, Iterator, List, Tuple
+
+from .types import SMTPSecurity
+
+
+DEFAULT_MESSAGE_CACHE_SIZE = 128
+"""
+number of built messages kept to be reused by notifications with the same subject, body and attachments
+"""
+
+
+class SMTPPool():
+    """
+    pool of authenticated smtp connections to a single server. Connections are opened when needed, up to pool_size, and reused afterwards.
+    Connections idle for longer than max_idle seconds are checked with NOOP before being reused, and replaced if the server closed them
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str, logger: logging.Logger, *, security: SMTPSecurity = "starttls",
+                 pool_size: int = 2, max_idle: float = 30.0, timeout: float = 30.0) -> None:
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.security = security
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.connections_opened = 0
+
+        # idle connections along with the time they were returned to the pool
+        self._idle: "queue.LifoQueue[Tuple[smtplib.SMTP, float]]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """
+        borrow a connection from the pool. Connections that fail are closed instead of being returned to the pool
+        """
+        with self._slots:
+            smtp = self._idle_connection() or self._connect()
+
+            try:
+                yield smtp
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError):
+                # a protocol or network error leaves the session in an unknown state, while refused recipients do not
+                self._close(smtp)
+                raise
+
+            self._idle.put((smtp, time.monotonic()))
+
+    def close(self) -> None:
+        while True:
+            try:
+                smtp, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+
+            self._close(smtp)
+
+    def _idle_connection(self):
+        while True:
+            try:
+                smtp, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+
+            if time.monotonic() - idle_since < self.max_idle:
+                return smtp
+
+            # servers drop idle sessions after a while, so long idle ones are checked before use
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+
+            self.logger.debug(f"smtp connection to {self.host} went stale, discarding it")
+            self._close(smtp)
+
+    def _connect(self) -> smtplib.SMTP:
+        self.logger.debug(f"opening smtp connection to {self.host}:{self.port}")
+
+        smtp: smtplib.SMTP
+        if self.security == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        try:
+            if self.security == "starttls":
+                smtp.starttls(context=ssl.create_default_context())
+
+            if self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            self._close(smtp)
+            raise
+
+        self.connections_opened += 1
+        return smtp
+
+    def _close(self, smtp: smtplib.SMTP) -> None:
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+
+class SMTPMailer():
+    """
+    Sends emails over a pool of persistent smtp connections, instead of opening a new session for every email. Every email is sent to all its
+    recipients in a single transaction, and built messages are reused by emails with the same subject, body and attachments.
+    Attachments must be local files, so remote attachments need the attachment cache of the notifier
+    """
+
+    def __init__(self, sender_addr: str, sender_pass: str, host: str, logger: logging.Logger, *, port: int = 587, security: SMTPSecurity = "starttls",
+                 pool_size: int = 2, max_idle: float = 30.0, timeout: float = 30.0, message_cache_size: int = DEFAULT_MESSAGE_CACHE_SIZE) -> None:
+        """
+        :param sender_addr: address the emails are sent from, also used to log in
+        :param sender_pass: password to log in. Login is skipped if empty
+        :param host: smtp server
+        :param port: smtp server port. Usually 587 for starttls, 465 for ssl
+        :param security: "starttls", "ssl", or "none" for local test servers
+        :param pool_size: maximum number of open connections
+        :param max_idle: seconds a connection can stay idle before it is checked with NOOP when reused
+        :param timeout: seconds to wait for the server on every operation
+        :param message_cache_size: number of built messages kept for reuse
+        """
+        self.logger = logger
+        self.sender_addr = sender_addr
+        self.pool = SMTPPool(host, port, sender_addr, sender_pass, logger, security=security, pool_size=pool_size, max_idle=max_idle, timeout=timeout)
+        self.message_cache_size = message_cache_size
+
+        self._messages: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._messages_lock = threading.Lock()
+
+    def send_email(self, to: List[str], subject: str, body: str, attachments: Dict[str, str]) -> None:
+        """
+        send an email to every recipient at once
+        :param attachments: local paths of the files to attach, mapped to the attached file names
+        """
+        # recipient dependent headers are prepended to the shared message, which is a valid place for headers
+        # the domain is given, as finding out the host name on every message may take a dns lookup
+        message_id = make_msgid(domain=self.sender_addr.rpartition("@")[2] or "localhost")
+        headers = f"To: {', '.join(to)}\r\nDate: {formatdate(localtime=True)}\r\nMessage-ID: {message_id}\r\n".encode()
+        message = headers + self._message(subject, body, attachments)
+
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as smtp:
+                    refused = smtp.sendmail(self.sender_addr, to, message)
+                break
+            except smtplib.SMTPServerDisconnected as e:
+                # reused connections may have been closed by the server since they were checked, so sending is retried once over a new one
+                if attempt:
+                    raise
+
+                self.logger.debug(f"smtp connection closed by the server, reconnecting. Reason:\n{e}")
+
+        if refused:
+            self.logger.warning(f"smtp server refused {len(refused)} recipients: {refused}")
+
+    def enable_sftp(self, host: str, sftp_user: str, sftp_pass: str, sftp_pk_path: str, label: str = "default") -> bool:
+        self.logger.error(f"the smtp mailer only attaches local files. Enable the attachment cache to download attachments over sftp")
+        return False
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def _message(self, subject: str, body: str, attachments: Dict[str, str]) -> bytes:
+        """
+        the message without recipient dependent headers, built once for every subject, body and attachments
+        """
+        key = (subject, body, tuple(sorted(attachments.items())))
+
+        with self._messages_lock:
+            try:
+                self._messages.move_to_end(key)
+                return self._messages[key]
+            except KeyError:
+                pass
+
+        message = EmailMessage(policy=SMTP)
+        message["Subject"] = subject
+        message["From"] = self.sender_addr
+
+        parts: List[bytes] = []
+        for local_path, file_name in attachments.items():
+            try:
+                parts.append(self._attachment(local_path, file_name))
+            except OSError as e:
+                self.logger.warning(f"could not attach {local_path}. Reason:\n{e}")
+
+        if not parts:
+            message.set_content(body)
+            message_bytes = message.as_bytes()
+        else:
+            # the multipart body is put together here, as the email generator folds base64 attachments line by line in python,
+            # which takes longer than sending them
+            boundary = f"=_{uuid.uuid4().hex}"
+            message["MIME-Version"] = "1.0"
+            message.add_header("Content-Type", "multipart/mixed", boundary=boundary)
+
+            text = MIMEPart(policy=SMTP)
+            text.set_content(body)
+
+            headers = b"".join(SMTP.fold_binary(name, value) for name, value in message.items())
+            delimiter = f"\r\n--{boundary}\r\n".encode()
+            message_bytes = headers + delimiter + delimiter.join([text.as_bytes()] + parts) + f"\r\n--{boundary}--\r\n".encode()
+
+        with self._messages_lock:
+            self._messages[key] = message_bytes
+            while len(self._messages) > self.message_cache_size:
+                self._messages.popitem(last=False)
+
+        return message_bytes
+
+    def _attachment(self, local_path: str, file_name: str) -> bytes:
+        """
+        a file as a base64 encoded mime part
+        """
+        with open(local_path, "rb") as attachment:
+            content = attachment.read()
+
+        maintype, subtype = (mimetypes.guess_type(file_name)[0] or "application/octet-stream").split("/", 1)
+
+        part = MIMEPart(policy=SMTP)
+        part["Content-Type"] = f"{maintype}/{subtype}"
+        part["Content-Transfer-Encoding"] = "base64"
+        part.add_header("Content-Disposition", "attachment", filename=file_name)
+
+        return part.as_bytes() + base64.encodebytes(content).replace(b"\n", b"\r\n")
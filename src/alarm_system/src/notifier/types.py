@@ -1,16 +1,57 @@
 import logging
-from typing import Callable, Dict, Literal
+from datetime import datetime
+from typing import Callable, Dict, List, Literal, Tuple, Union
 
 
 from ..core.types import Alarm, Event, Plant
 
 
-NotifierConfig = Dict[Literal["sender_email", "sender_password", "sender_sms", "token_sms", "pemfile_sms"], str]
+NotifierConfig = Dict[Literal["sender_email", "sender_password", "sender_sms", "token_sms", "pemfile_sms", "sms_url", "sms_timeout", "sms_batch_size"], Union[str, int, float]]
 """
 configuration object for event notifier
+:key sms_url: optional, sms gateway endpoint
+:key sms_timeout: optional, seconds to wait for the sms gateway to answer
+:key sms_batch_size: optional, maximum number of sms sent in a single gateway request
 """
 
 MessageBuilder = Callable[[Alarm, Event, Plant, str, logging.Logger], str]
 """
 anonymous function for message building, to be used for specific alarm types
 """
+
+Notification = Dict[Literal["subject", "body", "attachments", "email_contacts", "phone_contacts", "timestamp", "triggers"], Union[str, datetime, Dict[str, str], List[str], List[int], List[Tuple[Alarm, Event, Union[str, bool]]]]]
+"""
+a message ready to be sent to the contacts of a plant
+:key subject: the email subject
+:key body: the message body, sent by email and sms
+:key attachments: remote paths of the files to attach, mapped to the attached file names
+:key email_contacts: email addresses to notify
+:key phone_contacts: phone numbers to notify
+:key timestamp: timestamp of the event that triggered the notification
+:key triggers: alarm, event and message label of every trigger the notification accounts for. Digests account for several
+"""
+
+NotificationStats = Dict[Literal["sent", "merged", "suppressed"], int]
+"""
+counters of an event notifier
+:key sent: notifications sent, digests included
+:key merged: notifications merged into a digest instead of being sent on their own
+:key suppressed: deliveries to a recipient dropped because the recipient exceeded its rate limit
+"""
+
+CollectedNotification = Dict[Literal["id_alarm", "event_name", "plant_name", "type_alarm", "timestamp", "message_label", "body"], Union[str, int, datetime, bool, None]]
+"""
+a notification recorded instead of being sent, for dry runs such as replays
+:key id_alarm: id of the triggered alarm
+:key event_name: name of the triggered alarm
+:key plant_name: plant of the triggered alarm
+:key type_alarm: type of the triggered alarm
+:key timestamp: timestamp of the event that triggered the alarm
+:key message_label: label returned by the processor
+:key body: message that would have been sent, or None if messages are not built or no builder is registered for the alarm type and label
+"""
+
+SMTPSecurity = Literal["starttls", "ssl", "none"]
+"""
+how connections to the smtp server are secured: upgraded with STARTTLS, opened over TLS, or left in plain text for local test servers
+"""
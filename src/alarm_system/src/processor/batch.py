@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Sequence, Union
+
+from ..core.types import Alarm, Event
+from .types import EventColumns
+
+# this module is only imported once a batch processor is registered, so numpy is not required otherwise
+import numpy as np
+
+
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def event_columns(events: Sequence[Event], fields: Sequence[str]) -> EventColumns:
+    """
+    build the columnar representation of a list of events, with their timestamps and the given numeric fields
+    """
+    # converting datetimes to integers first is several times faster than letting numpy parse datetime objects
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc) if events and events[0]['timestamp'].tzinfo else datetime(1970, 1, 1)
+    microseconds = np.fromiter(((event['timestamp'] - epoch) // ONE_MICROSECOND for event in events), dtype=np.int64, count=len(events))
+
+    columns: EventColumns = {"timestamp": microseconds.astype("datetime64[us]")}
+
+    for field in fields:
+        columns[field] = np.array([event.get(field, np.nan) for event in events], dtype=float)
+
+    return columns
+
+
+def triggered_indexes(labels: Sequence[Union[str, bool]]) -> List[int]:
+    """
+    positions of the events whose label is truthy, and should be notified
+    """
+    if isinstance(labels, np.ndarray) and labels.dtype == bool:
+        return np.flatnonzero(labels).tolist()
+
+    # labels are kept as objects, as numpy turns a mix of False and strings into strings, and "False" is truthy
+    return np.flatnonzero(np.asarray(labels, dtype=object).astype(bool)).tolist()
+
+
+def alarm_state(initial_alarm: Alarm, events: Sequence[Event], states: Dict[str, Sequence[Any]], index: int) -> Alarm:
+    """
+    rebuild the alarm state right before the event at the given position, from the alarm state before the batch and the state columns
+    returned by a batch processor
+    """
+    alarm = dict(initial_alarm)
+
+    if index == 0:
+        return alarm
+
+    for field, values in states.items():
+        alarm[field] = python_value(values[index - 1])
+
+    # same as processing events one by one, where last_event is updated before the event is processed
+    alarm['last_event'] = max(initial_alarm['last_event'], events[index - 1]['timestamp'])
+
+    return alarm
+
+
+def python_value(value: Any) -> Any:
+    """
+    convert numpy scalars to the equivalent python values, so alarms can be stored and compared as usual
+    """
+    if isinstance(value, np.datetime64):
+        return value.astype("datetime64[us]").astype(datetime)
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
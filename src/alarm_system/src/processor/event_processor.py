@@ -1,21 +1,60 @@
-
 from collections import defaultdict
+import functools
 import logging
-from typing import Dict, List, Union
-from typing_extensions import deprecated
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
 from ..core.interfaces.processor import IProcessor
+from ..core.metrics import Histogram, Metrics
+from ..core.snapshot import WINDOW_STATE_FIELD, CopyOnWriteAlarm, WindowState
 from ..core.types import Alarm, Event, Plant
 
-from .types import AlarmProcessor
+from .types import AlarmProcessor, BatchAlarmProcessor
+from .windows import Window
+
+if TYPE_CHECKING:
+    from typing_extensions import deprecated
+else:
+    def deprecated(message: str):
+        """
+        typing_extensions.deprecated, applied the first time the function is called instead of when the module is imported, as applying it
+        imports asyncio and slows down importing the package
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                try:
+                    deprecated_function = wrapper.__deprecated_function__
+                except AttributeError:
+                    from typing_extensions import deprecated as typing_extensions_deprecated
+
+                    # one more frame than usual stands between the warning and the caller
+                    deprecated_function = wrapper.__deprecated_function__ = typing_extensions_deprecated(message, stacklevel=2)(function)
+
+                return deprecated_function(*args, **kwargs)
+
+            wrapper.__deprecated__ = message
+            return wrapper
+
+        return decorator
+
 
 class EventProcessor(IProcessor):
     logger: logging.Logger
     dispatcher: Dict[str, AlarmProcessor]
+    dispatcher_fields: Dict[str, Optional[List[str]]]
+    dispatcher_windows: Dict[str, List[Window]]
+    batch_dispatcher: Dict[str, Tuple[BatchAlarmProcessor, List[str]]]
 
-    def __init__(self, logger: logging.Logger) -> None:
+    def __init__(self, logger: logging.Logger, metrics: Optional[Metrics] = None) -> None:
         self.logger = logger
         self.logger.debug(f"setting up EventProcessor")
+        self.metrics = metrics or Metrics(self.logger)
+        # latency histogram of each alarm type, looked up once instead of on every event. Its count is the number of processed events
+        self._latency_histograms: Dict[str, Histogram] = {}
         self.dispatcher = {}
+        self.dispatcher_fields = {}
+        self.dispatcher_windows = {}
+        self.batch_dispatcher = {}
 
     @deprecated("This function requires understanding the internal implementation to call correctly. Consider refactoring to use process_event instead.")
     def process_alarms(self, alarms: List[Alarm], plants: Dict[str, Plant], events: Dict[str, List[Event]]) -> Dict[str, List[Union[str, None]]]:
@@ -64,15 +103,134 @@ class EventProcessor(IProcessor):
             self.logger.warning(f"no processor defined for {alarm['type_alarm']} alarms. Skipping...")
             return None
         
+        try:
+            latency = self._latency_histograms[alarm['type_alarm']]
+        except KeyError:
+            latency = self._latency_histograms[alarm['type_alarm']] = self.metrics.histogram("processor_latency_seconds", type_alarm=alarm['type_alarm'])
+
+        windows = self.dispatcher_windows.get(alarm['type_alarm'])
+        if windows:
+            self._update_windows(alarm, windows, event)
+
+        start = time.perf_counter()
         result = processor(alarm, event, self.logger)
+        latency.observe(time.perf_counter() - start)
 
         return result
 
     
-    def register_processor(self, alarm_type: str, processor: AlarmProcessor):
+    def _update_windows(self, alarm: Alarm, windows: List[Window], event: Event) -> None:
+        """
+        add an event to the windows of an alarm, before the processor reads them
+        """
+        state = alarm.get(WINDOW_STATE_FIELD)
+        # copy-on-write alarms share their window states with the underlying alarm, so the updates are tracked to snapshot it if the event
+        # triggers, which costs the same regardless of the size of the windows. Restored states belong to the alarm being processed
+        tracked = alarm if isinstance(alarm, CopyOnWriteAlarm) else None
+
+        if not isinstance(state, WindowState) or len(state) != len(windows):
+            state = alarm[WINDOW_STATE_FIELD] = self._restore_windows(alarm, windows, state)
+            tracked = None
+
+        for window in windows:
+            if window.where is None or window.where(event):
+                window_state = state[window.name]
+                if tracked is not None:
+                    tracked.track_window_update(window.name, window.rollback, window.checkpoint(window_state, event))
+                window.update(window_state, event)
+
+
+    def _restore_windows(self, alarm: Alarm, windows: List[Window], stored: Any) -> WindowState:
+        """
+        window state of an alarm as read from the data source, with an empty state for new windows and without the ones no longer registered
+        """
+        stored = stored if isinstance(stored, dict) else {}
+        state = WindowState()
+
+        for window in windows:
+            window_state = window.restore(stored[window.name]) if window.name in stored else None
+
+            if window_state is None:
+                if window.name in stored:
+                    self.logger.warning(f"state of window {window.name} of alarm {alarm['event_name']} does not fit its definition anymore. Starting it over...")
+                window_state = window.empty()
+
+            state[window.name] = window_state
+
+        return state
+
+
+    def register_processor(self, alarm_type: str, processor: AlarmProcessor, fields: Optional[List[str]] = None, windows: Optional[Sequence[Window]] = None):
         """
         register a function to be used for a given alarm type
+        :param fields: event fields the function reads, besides plant_name, event_name, timestamp, ftp_inference and ftp_original. If every
+        processor declares its fields, connectors may leave the rest out of the events
+        :param windows: windows kept for every alarm of the type and updated with each event before the function is called. The fields they
+        keep are added to fields, but the fields read by their where functions must be declared
         """
-        self.logger.debug(f"registered processor: {processor} for alarm type {alarm_type}")
+        windows = list(windows or [])
+        names = [window.name for window in windows]
+        if len(set(names)) != len(names):
+            raise ValueError(f"windows of alarm type {alarm_type} must have different names, got {names}")
+
+        if fields is not None:
+            fields = list(dict.fromkeys([*fields, *(window.field for window in windows if window.field is not None)]))
+
+        self.logger.debug(f"registered processor: {processor} for alarm type {alarm_type} with windows {windows}")
         self.dispatcher[alarm_type] = processor
-        
\ No newline at end of file
+        self.dispatcher_fields[alarm_type] = fields
+        self.dispatcher_windows[alarm_type] = windows
+
+
+    def register_batch_processor(self, alarm_type: str, processor: BatchAlarmProcessor, fields: List[str]):
+        """
+        register a function that processes all pending events of an alarm at once, for the given alarm type. Takes precedence over processors
+        registered with register_processor
+        :param fields: numeric event fields passed to the function as columns, besides the timestamp
+        """
+        self.logger.debug(f"registered batch processor: {processor} for alarm type {alarm_type} with fields {fields}")
+        self.batch_dispatcher[alarm_type] = (processor, fields)
+
+
+    def event_fields(self) -> Optional[List[str]]:
+        fields: Dict[str, None] = {}
+
+        for alarm_type in [*self.dispatcher, *self.batch_dispatcher]:
+            # batch processors take precedence, so their fields are the ones read
+            if alarm_type in self.batch_dispatcher:
+                alarm_type_fields = self.batch_dispatcher[alarm_type][1]
+            else:
+                alarm_type_fields = self.dispatcher_fields[alarm_type]
+
+            if alarm_type_fields is None:
+                return None
+
+            fields.update(dict.fromkeys(alarm_type_fields))
+
+        return list(fields)
+
+
+    def supports_batch_processing(self, alarm: Alarm) -> bool:
+        return alarm['type_alarm'] in self.batch_dispatcher
+
+
+    def process_event_batch(self, alarm: Alarm, plant: Plant, events: Sequence[Event]) -> List[Tuple[int, Union[str, bool], Alarm]]:
+        from .batch import alarm_state, event_columns, python_value, triggered_indexes
+
+        if not events:
+            return []
+
+        processor, fields = self.batch_dispatcher[alarm['type_alarm']]
+        self.logger.debug(f"processing {len(events)} events of alarm {alarm['event_name']} in batch")
+
+        initial_alarm = dict(alarm)
+        with self.metrics.timer("processor_batch_latency_seconds", type_alarm=alarm['type_alarm']):
+            labels, states = processor(initial_alarm, event_columns(events, fields), self.logger)
+        self.metrics.increment("processor_batch_events_total", len(events), type_alarm=alarm['type_alarm'])
+
+        triggers = [(index, python_value(labels[index]), alarm_state(alarm, events, states, index)) for index in triggered_indexes(labels)]
+
+        # the alarm is left as it would be after processing the events one by one
+        alarm.update(alarm_state(alarm, events, states, len(events)))
+
+        return triggers
@@ -1,5 +1,5 @@
 import logging
-from typing import Callable, Union
+from typing import Any, Callable, Dict, Sequence, Tuple, Union
 
 
 from ..core.types import Alarm, Event
@@ -15,3 +15,24 @@ The logger parameter is used to debug the execution of the function once inside
 
 :return: returns whether the event should be notified
 """
+
+
+EventColumns = Dict[str, Any]
+"""
+The events of an alarm in columnar form: a dictionary of numpy arrays with one entry per event, sorted by timestamp.
+:key timestamp: datetime64 array with the event timestamps. Timezone-aware timestamps are converted to UTC
+The rest of the keys are the numeric event fields requested when registering the batch processor, as float arrays. Missing values are NaN
+"""
+
+
+BatchAlarmProcessor = Callable[[Alarm, EventColumns, logging.Logger], Tuple[Sequence[Union[str, bool]], Dict[str, Sequence[Any]]]]
+"""
+Signature of a batch alarm processor. Must be a function like foo(x: Alarm, y: EventColumns, z: logging.Logger) -> (labels, states)
+
+The alarm parameter holds the alarm state before the first event, and must be treated as read only
+The events parameter holds all the pending events of the alarm as columns
+
+:return: a pair of
+    - labels: one result per event, with the same meaning as the result of an AlarmProcessor
+    - states: for each alarm field the processor changes, an array with the value of the field after each event. Fields not present are left unchanged
+"""
@@ -0,0 +1,400 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from ..core.snapshot import WINDOW_STATE_FIELD
+from ..core.types import Alarm, Event
+
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+WINDOW_NAME_FORBIDDEN = (".", "$")
+"""
+characters window names cannot contain, as they are used as keys of stored alarm documents
+"""
+
+
+class Window(ABC):
+    """
+    History of an alarm kept by the EventProcessor, updated with every event of the alarm before the processor is called. The state of every
+    window is a compact list stored in the alarm, under the "windows" field, so it is persisted along with the alarm and no database reads are
+    needed to evaluate it. Windows hold the definition only, and read the state from the alarm they are given.
+
+    Processors must treat windows as read only. Windows with a where function are only updated with the events it accepts, which must be a
+    module level function for the processor to be used with process workers
+    """
+    name: str
+    where: Optional[Callable[[Event], bool]]
+    # event field the window keeps, if any
+    field: Optional[str] = None
+
+    def __init__(self, name: str, where: Optional[Callable[[Event], bool]] = None) -> None:
+        if not name or any(character in name for character in WINDOW_NAME_FORBIDDEN):
+            raise ValueError(f"window names must not be empty nor contain {WINDOW_NAME_FORBIDDEN}, got {name!r}")
+
+        self.name = name
+        self.where = where
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name!r})"
+
+    @abstractmethod
+    def empty(self) -> List[Any]:
+        """
+        state of the window before any event
+        """
+
+    @abstractmethod
+    def restore(self, state: Any) -> Optional[List[Any]]:
+        """
+        check a state read from the alarm, and fix what can be fixed
+        :returns: the state to keep using, or None if it does not fit the window, as happens when the window definition changed
+        """
+
+    @abstractmethod
+    def update(self, state: List[Any], event: Event) -> None:
+        """
+        add an event to the state of the window, in place
+        """
+
+    def checkpoint(self, state: List[Any], event: Event) -> Any:
+        """
+        what rollback needs to undo the update of the state with an event, taken before the update. A copy of the state by default, which
+        windows should replace with the few values their update changes, as it is taken with every event
+        """
+        return [list(item) if isinstance(item, list) else item for item in state]
+
+    def rollback(self, state: List[Any], checkpoint: Any) -> None:
+        """
+        undo the update of a copy of the state, in place, as the alarm handed to message builders holds the windows before the triggering event
+        """
+        state[:] = checkpoint
+
+    def state(self, alarm: Alarm) -> List[Any]:
+        """
+        state of the window in the alarm, or an empty one if the alarm has not been processed with this window yet
+        """
+        try:
+            return alarm[WINDOW_STATE_FIELD][self.name]
+        except KeyError:
+            return self.empty()
+
+
+class RingBuffer(Window):
+    """
+    The last size values of an event field, or the last size event timestamps if no field is given. Adding a value replaces the oldest one.
+    For example, "N events in 10 minutes" holds when a buffer of N timestamps is full and its oldest one is within 10 minutes of the event.
+
+    State: [position of the oldest value once full, values]
+    """
+
+    def __init__(self, name: str, size: int, field: Optional[str] = None, *, where: Optional[Callable[[Event], bool]] = None) -> None:
+        """
+        :param size: number of values kept
+        :param field: event field kept. Missing values are kept as None
+        """
+        super().__init__(name, where)
+
+        if size < 1:
+            raise ValueError(f"ring buffers must keep at least one value, got {size}")
+
+        self.size = size
+        self.field = field
+
+    def empty(self) -> List[Any]:
+        return [0, []]
+
+    def restore(self, state: Any) -> Optional[List[Any]]:
+        if not isinstance(state, list) or len(state) != 2 or not isinstance(state[1], list):
+            return None
+
+        position, values = state
+        values = values[position:] + values[:position]
+
+        # the buffer may have been resized since the state was stored, in which case the newest values are kept
+        return [0, values[-self.size:]]
+
+    def update(self, state: List[Any], event: Event) -> None:
+        value = event['timestamp'] if self.field is None else event.get(self.field)
+        values: List[Any] = state[1]
+
+        if len(values) < self.size:
+            values.append(value)
+            return
+
+        position = state[0]
+        values[position] = value
+        state[0] = (position + 1) % self.size
+
+    def checkpoint(self, state: List[Any], event: Event) -> Tuple[int, int, Any]:
+        position, values = state
+        # until the buffer is full values are appended, then the oldest one is replaced
+        return position, len(values), values[position] if len(values) == self.size else None
+
+    def rollback(self, state: List[Any], checkpoint: Tuple[int, int, Any]) -> None:
+        position, length, replaced = checkpoint
+        values: List[Any] = state[1]
+
+        if length < self.size:
+            del values[length:]
+        else:
+            values[position] = replaced
+
+        state[0] = position
+
+    def values(self, alarm: Alarm) -> List[Any]:
+        """
+        kept values, from oldest to newest
+        """
+        position, values = self.state(alarm)
+        return values[position:] + values[:position]
+
+    def newest(self, alarm: Alarm, default: Any = None) -> Any:
+        position, values = self.state(alarm)
+        return values[position - 1] if values else default
+
+    def oldest(self, alarm: Alarm, default: Any = None) -> Any:
+        position, values = self.state(alarm)
+        return values[position] if values else default
+
+    def full(self, alarm: Alarm) -> bool:
+        return len(self.state(alarm)[1]) == self.size
+
+
+class SlidingCounter(Window):
+    """
+    Number of events within a time window before a given time. The window is split into buckets of equal length, and events are counted in
+    the bucket of their timestamp, so the oldest bucket is counted or dropped as a whole: counts are exact up to the length of one bucket at the
+    start of the window. Adding an event and counting at the time of the last event take constant time, regardless of the number of events.
+
+    Events older than the window, compared to the newest event seen, are ignored.
+
+    State: [bucket length in microseconds, number of the newest bucket since the epoch, total count, count of every bucket]
+    """
+
+    def __init__(self, name: str, window: timedelta, *, buckets: int = 60, where: Optional[Callable[[Event], bool]] = None) -> None:
+        """
+        :param window: length of the window
+        :param buckets: number of buckets the window is split into. More buckets make counts more precise, and states larger
+        """
+        super().__init__(name, where)
+
+        if buckets < 1 or window <= timedelta(0):
+            raise ValueError(f"sliding windows need a positive length and at least one bucket, got {window} and {buckets}")
+
+        self.window = window
+        self.buckets = buckets
+        self.bucket_length = window / buckets
+        self._bucket_microseconds = self.bucket_length // timedelta(microseconds=1)
+
+        if self._bucket_microseconds < 1:
+            raise ValueError(f"buckets of sliding windows must last at least a microsecond, got {self.bucket_length}")
+
+    def empty(self) -> List[Any]:
+        return [self._bucket_microseconds, 0, 0, [0] * self.buckets]
+
+    def restore(self, state: Any) -> Optional[List[Any]]:
+        if not self._fits(state):
+            return None
+
+        # totals are kept up to date by subtracting expired buckets, and recomputed once loaded so float errors do not build up across runs
+        state[2] = sum(state[3])
+        return state
+
+    def _fits(self, state: Any) -> bool:
+        return isinstance(state, list) and len(state) == len(self.empty()) and state[0] == self._bucket_microseconds and len(state[3]) == self.buckets
+
+    def bucket(self, timestamp: datetime) -> int:
+        """
+        number of the bucket a timestamp falls in, counted from the epoch
+        """
+        epoch = EPOCH_UTC if timestamp.tzinfo is not None else EPOCH
+        return (timestamp - epoch) // self.bucket_length
+
+    def update(self, state: List[Any], event: Event) -> None:
+        bucket = self.bucket(event['timestamp'])
+        newest = state[1]
+
+        if bucket > newest:
+            self._expire(state, min(bucket - newest, self.buckets))
+            state[1] = bucket
+        elif bucket <= newest - self.buckets:
+            return
+
+        self._add(state, bucket % self.buckets, event)
+
+    def checkpoint(self, state: List[Any], event: Event) -> List[Any]:
+        buckets = self._updated_buckets(state, event)
+        # totals are kept whole, and the values of every bucket only for the buckets the update changes
+        return [{bucket: item[bucket] for bucket in buckets} if isinstance(item, list) else item for item in state]
+
+    def rollback(self, state: List[Any], checkpoint: List[Any]) -> None:
+        for position, saved in enumerate(checkpoint):
+            if isinstance(saved, dict):
+                for bucket, value in saved.items():
+                    state[position][bucket] = value
+            else:
+                state[position] = saved
+
+    def _updated_buckets(self, state: List[Any], event: Event) -> Sequence[int]:
+        """
+        positions of the buckets an update with the event changes: the expired ones and the one the event is counted in
+        """
+        bucket = self.bucket(event['timestamp'])
+        newest = state[1]
+
+        if bucket <= newest - self.buckets:
+            return []
+
+        if bucket - newest >= self.buckets:
+            return range(self.buckets)
+
+        return [*((newest + offset) % self.buckets for offset in range(1, bucket - newest + 1)), bucket % self.buckets]
+
+    def _expire(self, state: List[Any], amount: int) -> None:
+        """
+        empty the amount buckets after the newest one, which are the oldest ones and fall out of the window when it moves forward
+        """
+        counts: List[int] = state[3]
+
+        if amount == self.buckets:
+            # the whole window expired, as happens with sparse events
+            state[2] = 0
+            counts[:] = [0] * self.buckets
+            return
+
+        for offset in range(1, amount + 1):
+            index = (state[1] + offset) % self.buckets
+            state[2] -= counts[index]
+            counts[index] = 0
+
+    def _add(self, state: List[Any], index: int, event: Event) -> None:
+        state[2] += 1
+        state[3][index] += 1
+
+    def _live_buckets(self, state: List[Any], now: datetime) -> Optional[List[int]]:
+        """
+        positions of the buckets within the window ending at now, or None if they are all the buckets of the state
+        """
+        elapsed = self.bucket(now) - state[1]
+
+        if elapsed <= 0:
+            return None
+
+        return [(state[1] + offset) % self.buckets for offset in range(elapsed + 1, self.buckets + 1)]
+
+    def count(self, alarm: Alarm, now: datetime) -> int:
+        """
+        number of events within the window ending at now, usually the timestamp of the event being processed
+        """
+        state = self.state(alarm)
+        live = self._live_buckets(state, now)
+
+        if live is None:
+            return state[2]
+
+        return sum(state[3][index] for index in live)
+
+
+class SlidingAggregate(SlidingCounter):
+    """
+    Count, sum, mean, minimum and maximum of a numeric event field within a time window before a given time, kept in buckets the same way as
+    SlidingCounter. Events without a value for the field are ignored. Count, sum and mean at the time of the last event take constant time,
+    while minimum and maximum go through every bucket.
+
+    State: [bucket length in microseconds, number of the newest bucket since the epoch, total count, count of every bucket, total sum, sum of
+    every bucket, minimum of every bucket, maximum of every bucket]
+    """
+
+    def __init__(self, name: str, field: str, window: timedelta, *, buckets: int = 60, where: Optional[Callable[[Event], bool]] = None) -> None:
+        """
+        :param field: numeric event field aggregated
+        :param window: length of the window
+        :param buckets: number of buckets the window is split into
+        """
+        super().__init__(name, window, buckets=buckets, where=where)
+        self.field = field
+
+    def empty(self) -> List[Any]:
+        return [self._bucket_microseconds, 0, 0, [0] * self.buckets, 0.0, [0.0] * self.buckets, [None] * self.buckets, [None] * self.buckets]
+
+    def restore(self, state: Any) -> Optional[List[Any]]:
+        if not self._fits(state):
+            return None
+
+        state[2] = sum(state[3])
+        state[4] = sum(state[5])
+        return state
+
+    def update(self, state: List[Any], event: Event) -> None:
+        if event.get(self.field) is None:
+            return
+
+        super().update(state, event)
+
+    def _updated_buckets(self, state: List[Any], event: Event) -> Sequence[int]:
+        if event.get(self.field) is None:
+            return []
+
+        return super()._updated_buckets(state, event)
+
+    def _expire(self, state: List[Any], amount: int) -> None:
+        sums: List[float] = state[5]
+
+        if amount == self.buckets:
+            state[4] = 0.0
+            sums[:] = [0.0] * self.buckets
+            state[6][:] = [None] * self.buckets
+            state[7][:] = [None] * self.buckets
+        else:
+            for offset in range(1, amount + 1):
+                index = (state[1] + offset) % self.buckets
+                state[4] -= sums[index]
+                sums[index] = 0.0
+                state[6][index] = None
+                state[7][index] = None
+
+        super()._expire(state, amount)
+
+    def _add(self, state: List[Any], index: int, event: Event) -> None:
+        value = float(event[self.field])
+        super()._add(state, index, event)
+
+        state[4] += value
+        state[5][index] += value
+
+        minimum, maximum = state[6][index], state[7][index]
+        if minimum is None or value < minimum:
+            state[6][index] = value
+        if maximum is None or value > maximum:
+            state[7][index] = value
+
+    def sum(self, alarm: Alarm, now: datetime) -> float:
+        state = self.state(alarm)
+        live = self._live_buckets(state, now)
+
+        if live is None:
+            return state[4]
+
+        return sum(state[5][index] for index in live)
+
+    def mean(self, alarm: Alarm, now: datetime) -> Optional[float]:
+        """
+        mean of the values within the window ending at now, None if there are none
+        """
+        count = self.count(alarm, now)
+        return self.sum(alarm, now) / count if count else None
+
+    def min(self, alarm: Alarm, now: datetime) -> Optional[float]:
+        return self._extreme(alarm, now, 6, min)
+
+    def max(self, alarm: Alarm, now: datetime) -> Optional[float]:
+        return self._extreme(alarm, now, 7, max)
+
+    def _extreme(self, alarm: Alarm, now: datetime, position: int, function: Callable[..., float]) -> Optional[float]:
+        state = self.state(alarm)
+        live = self._live_buckets(state, now)
+        values = [value for value in (state[position] if live is None else [state[position][index] for index in live]) if value is not None]
+
+        return function(values) if values else None
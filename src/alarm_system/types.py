@@ -1,3 +1,3 @@
-from .src.core.types import Alarm, Event, Plant, PlantContacts
-from .src.processor.types import AlarmProcessor
-from .src.notifier.types import MessageBuilder
\ No newline at end of file
+from .src.core.types import Alarm, AlarmUpdateResult, Event, MetricsSnapshot, OutboxKey, Plant, PlantContacts
+from .src.processor.types import AlarmProcessor, BatchAlarmProcessor, EventColumns
+from .src.notifier.types import CollectedNotification, MessageBuilder, NotificationStats
\ No newline at end of file
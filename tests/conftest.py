@@ -0,0 +1,34 @@
+import logging
+
+import pytest
+
+
+@pytest.fixture
+def logger() -> logging.Logger:
+    return logging.getLogger("alarm_system.tests")
+
+
+@pytest.fixture
+def mongo_database():
+    """
+    a database of the mongod at ALARM_SYSTEM_TEST_MONGO_URL, localhost by default, dropped after the test. Skips the test if there is none
+    """
+    import os
+    import uuid
+
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    client: MongoClient = MongoClient(os.environ.get("ALARM_SYSTEM_TEST_MONGO_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=1000)
+
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"no mongod to test against: {e}")
+
+    database = client[f"alarm_system_test_{uuid.uuid4().hex[:8]}"]
+    yield database
+
+    client.drop_database(database.name)
+    client.close()
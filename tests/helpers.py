@@ -0,0 +1,105 @@
+"""
+builders of the system types shared by the tests
+"""
+import logging
+import queue
+from datetime import datetime, timedelta
+from typing import List
+
+from alarm_system.interfaces import IWatchingConnector
+from alarm_system.types import Alarm, Event, Plant, PlantContacts
+
+
+START = datetime(2024, 1, 1)
+
+
+def make_alarm(id_alarm: int = 1, plant_name: str = "plant", event_name: str = "event", type_alarm: str = "threshold", **fields) -> Alarm:
+    alarm: Alarm = {
+        "plant_name": plant_name,
+        "event_name": event_name,
+        "id_alarm": id_alarm,
+        "last_alarm": START - timedelta(days=1),
+        "last_event": START - timedelta(days=1),
+        "flag_alarm": False,
+        "type_alarm": type_alarm,
+    }
+    alarm.update(fields)
+    return alarm
+
+
+def make_plant(plant_name: str = "plant") -> Plant:
+    return {"plant_name": plant_name, "plant_name_proper": plant_name.title(), "events": []}
+
+
+def make_contacts(plant_name: str = "plant") -> PlantContacts:
+    return {"plant_name": plant_name, "email_contacts": [f"{plant_name}@example.com"], "phone_contacts": [34600000000]}
+
+
+def make_events(values: List[float], plant_name: str = "plant", event_name: str = "event", start: datetime = START,
+                step: timedelta = timedelta(minutes=1)) -> List[Event]:
+    return [
+        {"plant_name": plant_name, "event_name": event_name, "timestamp": start + idx * step, "value": value}
+        for idx, value in enumerate(values)
+    ]
+
+
+def threshold_processor(alarm: Alarm, event: Event, logger: logging.Logger):
+    """
+    notifies "activation" when the value goes over 0.5, and "deactivation" when it goes back under
+    """
+    triggered = event["value"] > 0.5
+    was_active = alarm["flag_alarm"]
+    alarm["flag_alarm"] = triggered
+
+    if triggered and not was_active:
+        return "activation"
+
+    if was_active and not triggered:
+        return "deactivation"
+
+    return False
+
+
+class MemoryWatchingConnector(IWatchingConnector):
+    """
+    keeps alarms, plants, contacts and events in memory. Events added with record are handed to the watchers
+    """
+
+    def __init__(self, logger, alarms, events) -> None:
+        self.logger = logger
+        self.alarms = alarms
+        self.plants = [make_plant()]
+        self.contacts = [make_contacts()]
+        self.events = list(events)
+        self.recorded: "queue.Queue" = queue.Queue()
+        self.sessions = 0
+
+    def load_system_data(self):
+        alarms, plants, contacts = self.load_system_metadata()
+        return alarms, plants, contacts, list(self.events)
+
+    def load_system_metadata(self):
+        return [dict(alarm) for alarm in self.alarms], list(self.plants), list(self.contacts)
+
+    def stream_alarm_events(self, alarm):
+        return [
+            event for event in self.events
+            if (event["event_name"], event["plant_name"]) == (alarm["event_name"], alarm["plant_name"]) and event["timestamp"] > alarm["last_event"]
+        ]
+
+    def watch_events(self, alarms, stop):
+        self.sessions += 1
+        while not stop.is_set():
+            try:
+                yield self.recorded.get(timeout=0.01)
+            except queue.Empty:
+                yield None
+
+    def update_system_alarms(self, alarms):
+        updated = {alarm["id_alarm"]: dict(alarm) for alarm in alarms}
+        self.alarms = [updated.get(alarm["id_alarm"], alarm) for alarm in self.alarms]
+        return {"updated": len(alarms), "unchanged": 0, "failed": 0}
+
+    def record(self, event) -> None:
+        self.events.append(event)
+        self.recorded.put(event)
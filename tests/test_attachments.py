@@ -0,0 +1,77 @@
+import os
+from typing import Dict, List
+
+from alarm_system import EventNotifier, NotificationQueue
+from alarm_system.src.notifier.attachments import AttachmentCache
+
+from benchmarks.standins import LocalSFTPPool
+from helpers import make_alarm, make_contacts, make_events, make_plant
+
+
+FILE_SIZE = 100
+
+
+def attachment_cache(tmp_path, logger, max_bytes: int = 2 * FILE_SIZE) -> AttachmentCache:
+    cache = AttachmentCache(str(tmp_path), logger, max_bytes=max_bytes)
+    cache.pools["default"] = LocalSFTPPool(file_size=FILE_SIZE)
+    cache.pools["backup"] = LocalSFTPPool(file_size=FILE_SIZE)
+    return cache
+
+
+def test_files_are_downloaded_from_the_server_of_their_label(tmp_path, logger):
+    cache = attachment_cache(tmp_path, logger)
+
+    cache.prefetch(["a.png"], label="backup")
+    local_path = cache.fetch("a.png", label="backup")
+
+    assert local_path is not None and os.path.exists(local_path)
+    assert (cache.pools["default"].downloads, cache.pools["backup"].downloads) == (0, 1)
+    assert cache.fetch("a.png", label="unknown") is None
+
+
+def test_pinned_files_are_not_evicted_until_released(tmp_path, logger):
+    cache = attachment_cache(tmp_path, logger)
+
+    pinned = cache.fetch("pinned.png")
+    for name in ["b.png", "c.png", "d.png"]:
+        cache.release(cache.fetch(name))
+
+    assert os.path.exists(pinned)
+
+    cache.release(pinned)
+    cache.release(cache.fetch("e.png"))
+
+    assert not os.path.exists(pinned)
+    assert len(os.listdir(tmp_path)) == 2
+
+
+class AttachmentsMailer():
+    """
+    records the attachments of every email, checking they exist when it is sent
+    """
+
+    def __init__(self) -> None:
+        self.attachments: List[Dict[str, str]] = []
+
+    def send_email(self, to, subject, body, attachments) -> None:
+        assert all(os.path.exists(local_path) for local_path in attachments)
+        self.attachments.append(attachments)
+
+
+def test_queued_notifications_send_the_files_of_the_alarm_label_while_the_cache_is_full(tmp_path, logger):
+    notifier = EventNotifier({"sender_email": "", "sender_password": "", "sender_sms": "", "token_sms": "", "pemfile_sms": ""}, logger)
+    notifier.register_message_builder("threshold", lambda *args: "body", message_label="activation")
+    notifier.enable_attachment_cache(str(tmp_path), max_bytes=FILE_SIZE)
+    notifier.attachment_cache.pools["backup"] = LocalSFTPPool(file_size=FILE_SIZE)
+    notifier.mailer = AttachmentsMailer()
+    contacts = {**make_contacts(), "phone_contacts": []}
+    notification_queue = NotificationQueue(notifier, logger, workers=2, backoff=0)
+
+    for id_alarm in range(4):
+        event = {**make_events([0.9])[0], "ftp_inference": f"inference_{id_alarm}.png", "ftp_original": f"original_{id_alarm}.png"}
+        notification_queue.notify_trigger(make_alarm(id_alarm, sftp_label="backup"), make_plant(), contacts, event, "activation")
+    notification_queue.close()
+
+    # prefetched files may be evicted by other downloads before they are sent, but not while they are sent
+    assert notifier.attachment_cache.pools["backup"].downloads >= 8
+    assert [sorted(attachments.values()) for attachments in notifier.mailer.attachments] == [["inference.png", "original.png"]] * 4
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from alarm_system.interfaces import IProcessor
+from alarm_system.src.processor.batch import triggered_indexes
+
+from helpers import START, make_alarm, make_events, make_plant, threshold_processor
+
+
+@pytest.mark.parametrize("labels", [
+    [False, "activation", False, "deactivation"],
+    np.array([False, "activation", False, "deactivation"], dtype=object),
+    [0, True, None, "deactivation"],
+    np.array([False, True, False, True]),
+])
+def test_only_truthy_labels_are_triggered(labels):
+    assert triggered_indexes(labels) == [1, 3]
+
+
+def test_no_labels_trigger_nothing():
+    assert triggered_indexes([]) == []
+
+
+class EventByEventProcessor(IProcessor):
+    """
+    processor without batch support, relying on the default process_event_batch
+    """
+
+    def __init__(self, logger) -> None:
+        self.logger = logger
+
+    def process_event(self, alarm, plant, event):
+        alarm["last_event"] = event["timestamp"]
+        return threshold_processor(alarm, event, self.logger)
+
+
+def test_events_are_processed_one_at_a_time_by_default(logger):
+    alarm = make_alarm()
+    events = make_events([0.9, 0.8, 0.1, 0.2])
+
+    triggers = EventByEventProcessor(logger).process_event_batch(alarm, make_plant(), events)
+
+    assert [(index, label, alarm_before_event["flag_alarm"], alarm_before_event["last_event"]) for index, label, alarm_before_event in triggers] == [
+        (0, "activation", False, START - timedelta(days=1)), (2, "deactivation", True, events[1]["timestamp"]),
+    ]
+    assert (alarm["flag_alarm"], alarm["last_event"]) == (False, events[-1]["timestamp"])
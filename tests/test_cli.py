@@ -0,0 +1,88 @@
+from typing import List
+
+import pytest
+
+from alarm_system import cli
+
+
+class RecordingAlarmSystem():
+    """
+    stands in for the AlarmSystem created by the command, recording what it is asked to do
+    """
+    instances: List["RecordingAlarmSystem"] = []
+
+    def __init__(self, config, logger) -> None:
+        self.config = config
+        self.calls: List[str] = []
+        self.new_events = True
+        self.fail = False
+        RecordingAlarmSystem.instances.append(self)
+
+    def has_new_events(self) -> bool:
+        self.calls.append("has_new_events")
+        return self.new_events
+
+    def execute(self, streaming: bool = False, profile=None) -> None:
+        self.calls.append("execute")
+        if self.fail:
+            raise ConnectionError("mongodb is down")
+
+    def leave(self) -> None:
+        self.calls.append("leave")
+
+
+@pytest.fixture
+def alarm_system_class(monkeypatch):
+    RecordingAlarmSystem.instances = []
+    monkeypatch.setattr(cli, "AlarmSystem", RecordingAlarmSystem)
+    return RecordingAlarmSystem
+
+
+def failing(alarm_system: RecordingAlarmSystem) -> None:
+    alarm_system.fail = True
+
+
+def test_runs_give_up_their_alarms_once_done(alarm_system_class, monkeypatch):
+    monkeypatch.setattr(cli, "load_setup", lambda reference: failing)
+
+    assert cli.main(["--force"]) == 0
+    with pytest.raises(ConnectionError):
+        cli.main(["--force", "--setup", "tests:failing"])
+
+    assert [alarm_system.calls for alarm_system in alarm_system_class.instances] == [["execute", "leave"], ["execute", "leave"]]
+
+
+def test_config_files_are_read_and_overridden_by_the_environment(tmp_path):
+    json_path, toml_path = tmp_path / "config.json", tmp_path / "config.toml"
+    json_path.write_text('{"url": "mongodb://json", "db_name": "alarms", "metadata_ttl": 60}')
+    toml_path.write_text('url = "mongodb://toml"\nevent_fields = ["value"]\n')
+    environ = {
+        "ALARM_SYSTEM_URL": "mongodb://env", "ALARM_SYSTEM_STREAM_BATCH_SIZE": "500", "ALARM_SYSTEM_POLL_INTERVAL": "2.5",
+        "ALARM_SYSTEM_COMPACT_EVENTS": "Yes", "ALARM_SYSTEM_EVENT_FIELDS": "value, level,", "ALARM_SYSTEM_UNKNOWN": "ignored",
+    }
+
+    assert cli.load_config(str(json_path), {}) == {"url": "mongodb://json", "db_name": "alarms", "metadata_ttl": 60}
+    assert cli.load_config(str(toml_path), {}) == {"url": "mongodb://toml", "event_fields": ["value"]}
+    assert cli.load_config(str(json_path), environ) == {
+        "url": "mongodb://env", "db_name": "alarms", "metadata_ttl": 60, "stream_batch_size": 500, "poll_interval": 2.5,
+        "compact_events": True, "event_fields": ["value", "level"],
+    }
+    assert cli.load_config(None, {"ALARM_SYSTEM_COMPACT_EVENTS": "0"}) == {"compact_events": False}
+
+
+def test_setup_functions_are_found_by_module_and_name():
+    assert cli.load_setup("helpers:make_plant")("plant")["plant_name"] == "plant"
+
+    with pytest.raises(ValueError, match="module:function"):
+        cli.load_setup("helpers.make_plant")
+    with pytest.raises(AttributeError):
+        cli.load_setup("helpers:missing")
+
+
+def test_runs_stop_early_without_new_events_unless_forced(alarm_system_class, monkeypatch):
+    monkeypatch.setattr(cli, "load_setup", lambda reference: lambda alarm_system: setattr(alarm_system, "new_events", False))
+
+    assert cli.main(["--setup", "tests:no_new_events"]) == 0
+    assert cli.main(["--setup", "tests:no_new_events", "--force"]) == 0
+
+    assert [alarm_system.calls for alarm_system in alarm_system_class.instances] == [["has_new_events"], ["execute", "leave"]]
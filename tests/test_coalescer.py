@@ -0,0 +1,121 @@
+from datetime import timedelta
+from typing import List
+
+import pytest
+
+from alarm_system.src.notifier import coalescer
+from alarm_system.src.notifier.coalescer import NotificationCoalescer, RecipientRateLimiter
+from alarm_system.src.notifier.types import Notification
+
+from helpers import START, make_alarm
+
+
+def make_notification(timestamp, body: str = "body", id_alarm: int = 1) -> Notification:
+    return {
+        "subject": "Alarm event triggered in Plant",
+        "body": body,
+        "attachments": {f"/cache/{body}.png": "inference.png"},
+        "email_contacts": ["plant@example.com"],
+        "phone_contacts": [],
+        "timestamp": timestamp,
+        "triggers": [(make_alarm(id_alarm), {"timestamp": timestamp}, "activation")],
+    }
+
+
+def test_the_most_specific_rule_applies(logger):
+    notification_coalescer = NotificationCoalescer(logger)
+    notification_coalescer.add_rule(40)
+    notification_coalescer.add_rule(30, message_label="activation")
+    notification_coalescer.add_rule(20, plant_name="plant", message_label="activation")
+    notification_coalescer.add_rule(10, alarm_type="threshold")
+
+    def window(message_label="activation", **fields):
+        return notification_coalescer.window(make_alarm(**fields), message_label).total_seconds()
+
+    # alarm type takes precedence over plant name, and plant name over message label
+    assert window(type_alarm="threshold", plant_name="other", message_label="deactivation") == 10
+    assert window(type_alarm="counter") == 20
+    assert window(type_alarm="counter", plant_name="other") == 30
+    assert window(type_alarm="counter", plant_name="other", message_label="deactivation") == 40
+    assert NotificationCoalescer(logger).window(make_alarm(), "activation") is None
+
+
+def test_notifications_within_the_window_are_merged_in_a_digest_on_flush(logger):
+    merged: List[Notification] = []
+    notification_coalescer = NotificationCoalescer(logger, on_merged=merged.append)
+    notification_coalescer.add_rule(600)
+    alarm = make_alarm()
+    first, second, third = [make_notification(START + timedelta(minutes=idx), body=f"body {idx}") for idx in range(3)]
+
+    sent = [notification_coalescer.coalesce(alarm, "activation", notification) for notification in (first, second, third)]
+    [digest] = notification_coalescer.flush()
+
+    assert sent == [[first], [], []]
+    assert digest["subject"] == "Alarm event triggered in Plant (2 times)"
+    assert digest["body"] == f"2 notifications between {second['timestamp']} and {third['timestamp']}:\n\nbody 1\n\nbody 2"
+    assert (digest["attachments"], digest["timestamp"]) == (third["attachments"], third["timestamp"])
+    assert digest["triggers"] == second["triggers"] + third["triggers"]
+    # only the attachments of the latest notification are sent
+    assert merged == [second]
+    assert notification_coalescer.flush() == []
+
+
+@pytest.mark.parametrize("timestamps", [
+    [START, START + timedelta(minutes=5), START + timedelta(minutes=10), START + timedelta(minutes=11)],
+    [0, 300.0, 600, 660.5],
+], ids=["datetime", "seconds"])
+def test_the_digest_is_sent_when_a_notification_falls_after_the_window(logger, timestamps):
+    notification_coalescer = NotificationCoalescer(logger)
+    notification_coalescer.add_rule(600)
+    alarm = make_alarm()
+    notifications = [make_notification(timestamp, body=f"body {idx}") for idx, timestamp in enumerate(timestamps)]
+
+    sent = [notification_coalescer.coalesce(alarm, "activation", notification) for notification in notifications]
+
+    assert sent[:2] == [[notifications[0]], []]
+    # the notification past the window is sent after the digest of the held ones, and opens a new window
+    [digest, rolled_over] = sent[2]
+    assert (digest["body"].split("\n\n")[1:], rolled_over) == (["body 1"], notifications[2])
+    assert sent[3] == []
+
+
+def test_windows_are_kept_per_alarm_and_message_label(logger):
+    notification_coalescer = NotificationCoalescer(logger)
+    notification_coalescer.add_rule(600)
+
+    sent = [
+        notification_coalescer.coalesce(make_alarm(1), "activation", make_notification(START)),
+        notification_coalescer.coalesce(make_alarm(2), "activation", make_notification(START, id_alarm=2)),
+        notification_coalescer.coalesce(make_alarm(1), "deactivation", make_notification(START)),
+        notification_coalescer.coalesce(make_alarm(1), "activation", make_notification(START)),
+    ]
+
+    assert [len(notifications) for notifications in sent] == [1, 1, 1, 0]
+    assert len(notification_coalescer.flush()) == 1
+
+
+class Clock():
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_recipients_regain_notifications_as_their_bucket_refills(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(coalescer.time, "monotonic", clock)
+    rate_limiter = RecipientRateLimiter(2, per_seconds=10)
+
+    burst = [rate_limiter.allow("a@example.com") for _ in range(3)]
+    other_recipient = rate_limiter.allow("b@example.com")
+    clock.now += 5
+    refilled = [rate_limiter.allow("a@example.com") for _ in range(2)]
+    # idle recipients do not gain more than capacity notifications
+    clock.now += 3600
+    after_idle = [rate_limiter.allow("a@example.com") for _ in range(3)]
+
+    assert burst == [True, True, False]
+    assert other_recipient
+    assert refilled == [True, False]
+    assert after_idle == [True, True, False]
@@ -0,0 +1,37 @@
+import pickle
+
+import pytest
+
+from alarm_system.src.connector.compact_event import MISSING, CompactEvent, EventSchema
+
+from helpers import START
+
+
+@pytest.fixture
+def event() -> CompactEvent:
+    schema = EventSchema(["plant_name", "timestamp", "value", "ftp_inference"])
+    return schema.record({"plant_name": "plant", "timestamp": START, "value": 0.9, "dropped": "not in the schema"})
+
+
+def test_compact_events_are_read_as_mappings(event):
+    assert (event["plant_name"], event["timestamp"], event["value"]) == ("plant", START, 0.9)
+    assert (event.get("value"), event.get("ftp_inference"), event.get("dropped", "default")) == (0.9, None, "default")
+    assert ("value" in event, "ftp_inference" in event, "dropped" in event, 1 in event) == (True, False, False, False)
+    assert dict(event) == {"plant_name": "plant", "timestamp": START, "value": 0.9}
+    assert (list(event), len(event)) == (["plant_name", "timestamp", "value"], 3)
+
+
+@pytest.mark.parametrize("field", ["ftp_inference", "dropped"])
+def test_fields_missing_from_the_document_or_the_schema_raise_key_error(event, field):
+    with pytest.raises(KeyError, match=field):
+        event[field]
+
+
+def test_pickled_events_keep_their_values_and_share_their_schema(event):
+    other = event._schema.record({"plant_name": "other", "timestamp": START})
+
+    unpickled, unpickled_other = pickle.loads(pickle.dumps([event, other]))
+
+    assert (dict(unpickled), dict(unpickled_other)) == (dict(event), dict(other))
+    assert unpickled._schema is unpickled_other._schema
+    assert unpickled._values[-1] is MISSING and "ftp_inference" not in unpickled
@@ -0,0 +1,19 @@
+import pytest
+
+from alarm_system import EventProcessor
+
+from helpers import make_alarm, make_events, make_plant, threshold_processor
+
+
+def test_process_alarms_warns_that_it_is_deprecated(logger):
+    processor = EventProcessor(logger)
+    processor.register_processor("threshold", threshold_processor)
+    alarm = make_alarm()
+
+    with pytest.warns(DeprecationWarning, match="process_event instead") as warnings:
+        result = processor.process_alarms([alarm], {"plant": make_plant()}, {"event": make_events([0.9, 0.1])})
+
+    assert result == {"event": ["activation", "deactivation"]}
+    # the warning points at the caller
+    assert warnings[0].filename == __file__
+    assert EventProcessor.process_alarms.__deprecated__.startswith("This function requires")
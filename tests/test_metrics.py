@@ -0,0 +1,174 @@
+import json
+import logging
+import pickle
+import pstats
+import urllib.request
+
+import pytest
+
+from alarm_system import JSONLinesExporter, Metrics, PrometheusFileExporter, PrometheusHTTPExporter
+from alarm_system.interfaces import IMetricsExporter
+from alarm_system.src.core.profiling import profiled
+from alarm_system.src.exporter.prometheus_exporter import prometheus_text
+
+
+BUCKETS = (0.1, 1.0, 10.0)
+
+
+@pytest.fixture
+def metrics(logger) -> Metrics:
+    return Metrics(logger, buckets=BUCKETS)
+
+
+def test_counters_and_gauges_are_kept_per_name_and_labels(metrics):
+    metrics.increment("events_total")
+    metrics.increment("events_total", 2)
+    metrics.increment("triggers_total", type_alarm="threshold")
+    metrics.increment("triggers_total", 3, type_alarm="counter")
+    metrics.set_gauge("queue_depth", 5)
+    metrics.set_gauge("queue_depth", 2)
+
+    assert metrics.counter("events_total").value == 3
+    assert metrics.counter("triggers_total", type_alarm="threshold").value == 1
+    assert metrics.counter("triggers_total", type_alarm="counter").value == 3
+    # labels are matched regardless of their order
+    assert metrics.counter("labelled", a=1, b=2) is metrics.counter("labelled", b="2", a="1")
+    assert metrics.gauge("queue_depth").value == 2
+
+
+def test_histograms_count_observations_per_bucket_and_estimate_quantiles(metrics):
+    for value in [0.05, 0.5, 0.5, 5.0, 50.0]:
+        metrics.observe("latency_seconds", value)
+    with metrics.timer("timed_seconds"):
+        pass
+
+    histogram = metrics.histogram("latency_seconds")
+
+    assert (histogram.counts, histogram.count, histogram.sum) == ([1, 2, 1, 1], 5, 56.05)
+    assert [metrics.quantile("latency_seconds", q) for q in (0.2, 0.5, 0.8)] == [0.1, 1.0, 10.0]
+    # quantiles over the largest bucket cannot be estimated
+    assert metrics.quantile("latency_seconds", 1.0) == float("inf")
+    assert metrics.quantile("empty_seconds", 0.5) == 0.0
+    assert metrics.histogram("timed_seconds").count == 1
+
+
+def test_merge_adds_counters_and_histograms_and_takes_gauges(logger, metrics):
+    metrics.increment("events_total", 2)
+    metrics.observe("latency_seconds", 0.5)
+    metrics.set_gauge("queue_depth", 1)
+    # worker processes send their registry back pickled
+    worker_metrics = pickle.loads(pickle.dumps(Metrics(logger, buckets=BUCKETS)))
+    worker_metrics.increment("events_total", 3)
+    worker_metrics.increment("triggers_total")
+    worker_metrics.observe("latency_seconds", 5.0)
+    worker_metrics.set_gauge("queue_depth", 4)
+
+    metrics.merge(worker_metrics)
+
+    assert (metrics.counter("events_total").value, metrics.counter("triggers_total").value) == (5, 1)
+    assert metrics.histogram("latency_seconds").counts == [0, 1, 1, 0]
+    assert metrics.gauge("queue_depth").value == 4
+
+
+def test_reset_clears_counters_and_histograms_but_not_gauges(metrics):
+    metrics.increment("events_total", 2)
+    metrics.observe("latency_seconds", 0.5)
+    metrics.set_gauge("queue_depth", 3)
+
+    metrics.reset()
+
+    assert metrics.counter("events_total").value == 0
+    assert (metrics.histogram("latency_seconds").count, metrics.histogram("latency_seconds").sum) == (0, 0)
+    assert metrics.gauge("queue_depth").value == 3
+
+
+def recorded_snapshot(metrics):
+    metrics.increment("events_total", 3)
+    metrics.increment("triggers_total", type_alarm='say "hi"\n')
+    metrics.set_gauge("queue_depth", 2)
+    metrics.observe("latency_seconds", 0.5, stage="process")
+    metrics.observe("latency_seconds", 50.0, stage="process")
+    return metrics.snapshot()
+
+
+def test_snapshots_are_formatted_as_prometheus_text(metrics):
+    text = prometheus_text(recorded_snapshot(metrics), prefix="test_")
+
+    assert text.splitlines() == [
+        "# TYPE test_events_total counter",
+        "test_events_total 3.0",
+        "# TYPE test_triggers_total counter",
+        'test_triggers_total{type_alarm="say \\"hi\\"\\n"} 1.0',
+        "# TYPE test_queue_depth gauge",
+        "test_queue_depth 2",
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{stage="process",le="0.1"} 0',
+        'test_latency_seconds_bucket{stage="process",le="1.0"} 1',
+        'test_latency_seconds_bucket{stage="process",le="10.0"} 1',
+        'test_latency_seconds_bucket{stage="process",le="+Inf"} 2',
+        'test_latency_seconds_sum{stage="process"} 50.5',
+        'test_latency_seconds_count{stage="process"} 2',
+    ]
+
+
+def test_prometheus_exporters_publish_the_last_snapshot(tmp_path, logger, metrics):
+    path = tmp_path / "alarm_system.prom"
+    http_exporter = PrometheusHTTPExporter(0, logger, host="127.0.0.1")
+    metrics.add_exporter(PrometheusFileExporter(str(path)))
+    metrics.add_exporter(http_exporter)
+
+    try:
+        recorded_snapshot(metrics)
+        metrics.export()
+        with urllib.request.urlopen(f"http://127.0.0.1:{http_exporter.server.server_port}/metrics", timeout=5) as response:
+            served = response.read().decode()
+    finally:
+        http_exporter.close()
+
+    assert "alarm_system_events_total 3.0" in served
+    assert path.read_text() == served
+
+
+def test_snapshots_are_appended_as_json_lines_with_percentiles(tmp_path, metrics):
+    path = tmp_path / "metrics.jsonl"
+    metrics.add_exporter(JSONLinesExporter(str(path), percentiles=(0.5, 0.99)))
+
+    recorded_snapshot(metrics)
+    metrics.export()
+    metrics.increment("events_total")
+    metrics.export()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    [histogram] = records[0]["histograms"]
+
+    assert [record["counters"][0]["value"] for record in records] == [3, 4]
+    assert (histogram["name"], histogram["labels"], histogram["count"]) == ("latency_seconds", {"stage": "process"}, 2)
+    assert (histogram["p50"], histogram["p99"]) == (1.0, None)
+
+
+class FailingExporter(IMetricsExporter):
+    def export(self, snapshot) -> None:
+        raise OSError("disk full")
+
+
+def test_failing_exporters_do_not_stop_the_others(tmp_path, metrics):
+    path = tmp_path / "metrics.jsonl"
+    metrics.add_exporter(FailingExporter())
+    metrics.add_exporter(JSONLinesExporter(str(path)))
+
+    metrics.export()
+
+    assert len(path.read_text().splitlines()) == 1
+
+
+def test_profiled_blocks_save_their_stats(tmp_path, logger, caplog):
+    path = tmp_path / "run.prof"
+
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        with profiled(str(path), logger):
+            sorted(range(1000), key=lambda value: -value)
+        with profiled(None, logger):
+            pass
+
+    assert any("sorted" in str(function) for function in pstats.Stats(str(path)).stats)
+    assert [record.message for record in caplog.records if record.levelno == logging.INFO] == [f"profile saved to {path}"]
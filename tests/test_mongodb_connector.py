@@ -0,0 +1,272 @@
+import queue
+import threading
+import time
+from datetime import timedelta
+from typing import List
+
+import pytest
+from pymongo.errors import OperationFailure, PyMongoError
+
+from alarm_system import MongoDBConnector
+
+from helpers import START, make_alarm, make_contacts, make_events, make_plant
+
+mongomock = pytest.importorskip("mongomock")
+
+
+CONFIG = {
+    "url": "mongodb://localhost:27017",
+    "db_name": "alarm_system",
+    "alarm_collection": "alarms",
+    "plant_collection": "plants",
+    "event_collection": "events",
+    "contacts_collection": "contacts",
+    "stream_batch_size": 2,
+    "poll_interval": 0.01,
+}
+
+
+@pytest.fixture
+def connector(logger) -> MongoDBConnector:
+    connector = MongoDBConnector(CONFIG, logger)
+    connector._client = mongomock.MongoClient()
+    return connector
+
+
+@pytest.fixture
+def events_collection(connector):
+    return connector.client[CONFIG["db_name"]][CONFIG["event_collection"]]
+
+
+def read_until_idle(watched) -> List:
+    """
+    events yielded until the watcher has nothing new to return
+    """
+    events = []
+    for event in watched:
+        if event is None:
+            return events
+        events.append(event)
+    return events
+
+
+def test_polling_reads_every_event_sharing_a_timestamp_past_the_page_size(connector, events_collection):
+    events_collection.insert_many(make_events([0.1] * 5, step=timedelta(0)))
+    alarm = make_alarm()
+
+    watched = connector._poll_events(events_collection, [alarm], threading.Event())
+
+    assert len({event["_id"] for event in read_until_idle(watched)}) == 5
+
+
+def test_polling_reads_events_recorded_later_with_the_last_timestamp_read(connector, events_collection):
+    events_collection.insert_many(make_events([0.1, 0.2, 0.3]))
+    alarm = make_alarm()
+    watched = connector._poll_events(events_collection, [alarm], threading.Event())
+
+    first = read_until_idle(watched)
+    events_collection.insert_one({**make_events([0.4])[0], "timestamp": first[-1]["timestamp"]})
+    events_collection.insert_one({**make_events([0.5])[0], "timestamp": first[-1]["timestamp"] + timedelta(minutes=1)})
+    second = read_until_idle(watched)
+
+    assert [event["value"] for event in first] == [0.1, 0.2, 0.3]
+    assert [event["value"] for event in second] == [0.4, 0.5]
+
+
+class FailingChangeStream():
+    """
+    change stream that returns some changes, then fails as when the connection to the replica set is lost
+    """
+
+    def __init__(self, documents) -> None:
+        self.changes = [{"operationType": "insert", "fullDocument": document} for document in documents]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def try_next(self):
+        if not self.changes:
+            raise PyMongoError("connection lost")
+        return self.changes.pop(0)
+
+
+def test_failed_change_stream_resumes_by_polling_from_the_last_processed_event(connector, events_collection):
+    events = make_events([0.1, 0.2, 0.3])
+    events_collection.insert_many(events)
+    alarm = make_alarm()
+
+    watched = connector._watch_changes(FailingChangeStream(events[:1]), events_collection, [alarm], threading.Event())
+
+    streamed = next(watched)
+    # the caller updates the alarm as it processes events
+    alarm["last_event"] = streamed["timestamp"]
+
+    assert streamed["value"] == 0.1
+    assert [event["value"] for event in read_until_idle(watched)] == [0.2, 0.3]
+
+
+def test_events_are_polled_when_change_streams_are_not_available(connector, events_collection, monkeypatch):
+    def watch(*args, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets")
+
+    monkeypatch.setattr(type(events_collection), "watch", watch, raising=False)
+    events_collection.insert_many(make_events([0.1, 0.2]))
+    alarm = make_alarm(last_event=START)
+
+    watched = connector.watch_events([alarm], threading.Event())
+
+    assert [event["value"] for event in read_until_idle(watched)] == [0.2]
+
+
+def test_streamed_events_are_the_loaded_events_of_the_alarm_in_timestamp_order(connector, events_collection):
+    events_collection.insert_many(make_events([0.3, 0.4], start=START + timedelta(hours=1)) + make_events([0.1, 0.2]) + make_events([0.5], event_name="other"))
+    connector.client[CONFIG["db_name"]][CONFIG["alarm_collection"]].insert_one(make_alarm(last_event=START))
+
+    [alarm], _, _, loaded = connector.load_system_data()
+    streamed = connector.stream_alarm_events(alarm)
+
+    # events are read from the cursor in batches of stream_batch_size as they are consumed, not loaded up front
+    assert not isinstance(streamed, list)
+    assert [event["value"] for event in streamed] == [0.2, 0.3, 0.4]
+    assert sorted(event["value"] for event in loaded if event["event_name"] == "event") == [0.2, 0.3, 0.4]
+
+
+@pytest.fixture
+def database(connector):
+    database = connector.client[CONFIG["db_name"]]
+    database[CONFIG["plant_collection"]].insert_one(make_plant())
+    database[CONFIG["contacts_collection"]].insert_one(make_contacts())
+    return database
+
+
+def test_plants_and_contacts_are_cached_for_metadata_ttl(logger, database):
+    connector = MongoDBConnector({**CONFIG, "metadata_ttl": 60}, logger)
+    connector._client = database.client
+
+    first = connector.load_system_metadata()[1:]
+    database[CONFIG["plant_collection"]].insert_one(make_plant("other"))
+    cached = connector.load_system_metadata()[1:]
+    # the cache expires once metadata_ttl seconds passed since it was loaded
+    connector._metadata_loaded_at -= 60
+    reloaded_plants, _ = connector.load_system_metadata()[1:]
+
+    assert cached == first
+    assert connector.metrics.counter("metadata_cache_hits_total").value == 1
+    assert [plant["plant_name"] for plant in reloaded_plants] == ["plant", "other"]
+
+
+def test_plants_and_contacts_are_reloaded_on_every_run_by_default(connector, database):
+    connector.load_system_metadata()
+    database[CONFIG["contacts_collection"]].insert_one(make_contacts("other"))
+
+    _, _, contacts = connector.load_system_metadata()
+
+    assert len(contacts) == 2
+    assert connector.metrics.counter("metadata_cache_hits_total").value == 0
+
+
+class QueueChangeStream():
+    """
+    change stream of the changes put in its queue
+    """
+
+    def __init__(self) -> None:
+        self.changes: "queue.Queue" = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def try_next(self):
+        try:
+            return self.changes.get(timeout=0.01)
+        except queue.Empty:
+            return None
+
+
+def test_watched_metadata_changes_invalidate_the_cache(connector, database, monkeypatch):
+    change_stream = QueueChangeStream()
+    monkeypatch.setattr(type(database), "watch", lambda *args, **kwargs: change_stream, raising=False)
+
+    assert connector.watch_metadata()
+    try:
+        connector.load_system_metadata()
+        database[CONFIG["plant_collection"]].insert_one(make_plant("other"))
+        # while watching, the cache is kept regardless of metadata_ttl
+        cached_plants = connector.load_system_metadata()[1]
+
+        change_stream.changes.put({"ns": {"coll": CONFIG["plant_collection"]}})
+        deadline = time.monotonic() + 5
+        while connector._metadata_cache is not None:
+            assert time.monotonic() < deadline, "timed out"
+            time.sleep(0.01)
+        plants = connector.load_system_metadata()[1]
+    finally:
+        connector.stop_watching_metadata()
+
+    assert len(cached_plants) == 1
+    assert [plant["plant_name"] for plant in plants] == ["plant", "other"]
+
+
+def test_new_events_are_queried_once_per_event_and_plant_from_the_oldest_last_event(logger):
+    connector = MongoDBConnector({**CONFIG, "event_query_batch_size": 2}, logger)
+    alarms = [
+        make_alarm(1, last_event=START),
+        make_alarm(2, last_event=START + timedelta(hours=1)),
+        make_alarm(3, plant_name="other", last_event=START),
+        make_alarm(4, event_name="other", last_event=START + timedelta(hours=2)),
+    ]
+
+    queries = connector._new_events_queries(alarms)
+
+    assert queries == [
+        {"$or": [{"timestamp": {"$gt": START}, "$or": [{"event_name": "event", "plant_name": "plant"}, {"event_name": "event", "plant_name": "other"}]}]},
+        {"$or": [{"timestamp": {"$gt": START + timedelta(hours=2)}, "$or": [{"event_name": "other", "plant_name": "plant"}]}]},
+    ]
+
+
+def test_loaded_events_cover_every_alarm(connector, database, events_collection):
+    database[CONFIG["alarm_collection"]].insert_many([make_alarm(1, last_event=START), make_alarm(2, last_event=START + timedelta(minutes=1)), make_alarm(3, event_name="other")])
+    events_collection.insert_many(make_events([0.1, 0.2, 0.3]) + make_events([0.4], event_name="other") + make_events([0.5], event_name="unwatched"))
+
+    events = connector.load_system_data()[3]
+
+    assert sorted(event["value"] for event in events) == [0.2, 0.3, 0.4]
+
+
+def test_compact_events_hold_the_configured_and_processor_fields(logger, database):
+    connector = MongoDBConnector({**CONFIG, "compact_events": True, "event_fields": ["value"]}, logger)
+    connector._client = database.client
+    database[CONFIG["alarm_collection"]].insert_one(make_alarm())
+    database[CONFIG["event_collection"]].insert_many([{**event, "extra": 1, "unread": 2} for event in make_events([0.1])])
+
+    configured = connector.load_system_data()[3]
+    connector.set_event_fields(["extra"])
+    [streamed] = connector.stream_alarm_events(make_alarm())
+
+    assert connector._event_projection() == {field: 1 for field in ["plant_name", "event_name", "timestamp", "ftp_inference", "ftp_original", "value", "extra"]}
+    assert [type(event).__name__ for event in configured] == ["CompactEvent"]
+    assert set(configured[0]) == {"plant_name", "event_name", "timestamp", "value"}
+    assert (streamed["extra"], "unread" in streamed, "_id" in streamed) == (1, False, False)
+
+
+def test_compact_events_need_the_processor_fields_without_configured_ones(logger, database):
+    connector = MongoDBConnector({**CONFIG, "compact_events": True}, logger)
+    connector._client = database.client
+    database[CONFIG["event_collection"]].insert_one({**make_events([0.1])[0], "extra": 1})
+
+    # processors that do not declare their fields read whole events
+    connector.set_event_fields(None)
+    whole_projection = connector._event_projection()
+    [whole] = connector.stream_alarm_events(make_alarm())
+    connector.set_event_fields(["value"])
+    [compact] = connector.stream_alarm_events(make_alarm())
+
+    assert (whole_projection, type(whole)) == (None, dict)
+    assert whole["extra"] == 1
+    assert set(compact) == {"plant_name", "event_name", "timestamp", "value"}
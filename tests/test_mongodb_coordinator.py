@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+from alarm_system import MongoDBCoordinator
+
+from helpers import make_alarm
+
+pytestmark = pytest.mark.integration
+
+
+PARTITIONS = 8
+
+
+def coordinator(collection, logger, instance_id: str, lease_ttl: float = 30.0) -> MongoDBCoordinator:
+    # heartbeats are run by the tests, so the background thread never gets to run one
+    return MongoDBCoordinator(collection, logger, instance_id=instance_id, partitions=PARTITIONS, lease_ttl=lease_ttl, heartbeat_interval=3600)
+
+
+@pytest.fixture
+def leases(mongo_database):
+    return mongo_database["leases"]
+
+
+def test_a_single_instance_claims_every_partition(leases, logger):
+    first = coordinator(leases, logger, "first")
+
+    first.join()
+
+    assert first.owned == frozenset(range(PARTITIONS))
+    assert first.ownership_changed()
+    assert all(first.owns(make_alarm(plant_name=f"plant_{idx}")) for idx in range(20))
+
+    first.leave()
+
+    assert leases.count_documents({"kind": "partition", "owner": {"$ne": None}}) == 0
+    assert leases.count_documents({"kind": "member"}) == 0
+
+
+def test_partitions_are_split_once_a_second_instance_joins(leases, logger):
+    first, second = coordinator(leases, logger, "first"), coordinator(leases, logger, "second")
+    first.join()
+    first.rebalance()
+
+    second.join()
+    # every partition is leased by the first instance until it gives them up
+    assert second.owned == frozenset()
+
+    first._heartbeat()
+    assert first.ownership_changed() and len(first.releasing) == PARTITIONS // 2
+    # partitions waiting to be given up still belong to the first instance until its alarms are persisted
+    assert first.owned == frozenset(range(PARTITIONS))
+
+    first.rebalance()
+    second._heartbeat()
+
+    assert len(first.owned) == len(second.owned) == PARTITIONS // 2
+    assert first.owned | second.owned == frozenset(range(PARTITIONS))
+    assert second.ownership_changed()
+
+    first.leave()
+    second._heartbeat()
+
+    assert second.owned == frozenset(range(PARTITIONS))
+    second.leave()
+
+
+def test_renewed_leases_are_kept_and_expired_ones_are_claimed(leases, logger):
+    first, second = coordinator(leases, logger, "first", lease_ttl=1.0), coordinator(leases, logger, "second", lease_ttl=1.0)
+    first.join()
+    first.rebalance()
+
+    time.sleep(0.6)
+    first._heartbeat()
+    time.sleep(0.6)
+
+    # renewed less than a lease ago
+    assert first.owns(make_alarm())
+    assert leases.count_documents({"kind": "partition", "owner": "first", "$expr": {"$gt": ["$expires_at", "$$NOW"]}}) == PARTITIONS
+
+    time.sleep(0.6)
+    assert not first.owns(make_alarm())
+
+    second.join()
+    assert second.owned == frozenset(range(PARTITIONS))
+
+    first._heartbeat()
+
+    assert first.owned == frozenset()
+    assert first.ownership_changed()
+
+    first.leave()
+    second.leave()
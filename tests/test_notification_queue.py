@@ -0,0 +1,91 @@
+import threading
+import time
+from typing import List
+
+from alarm_system import EventNotifier, NotificationQueue
+from alarm_system.interfaces import INotifier
+
+from helpers import make_alarm, make_contacts, make_events, make_plant
+
+
+class SlowFirstNotifier(INotifier):
+    """
+    records notifications, taking longer to deliver the first one
+    """
+
+    def __init__(self, logger) -> None:
+        self.logger = logger
+        self.notified: List = []
+        self._lock = threading.Lock()
+
+    def notify_trigger(self, alarm, plant, contacts, event, message_label) -> bool:
+        if message_label == "activation":
+            time.sleep(0.05)
+
+        with self._lock:
+            self.notified.append((alarm["id_alarm"], message_label))
+        return True
+
+
+def test_notifications_of_an_alarm_are_delivered_in_order(logger):
+    notifier = SlowFirstNotifier(logger)
+    notification_queue = NotificationQueue(notifier, logger, workers=4, backoff=0)
+
+    for id_alarm in range(8):
+        alarm = make_alarm(id_alarm)
+        for label, event in zip(["activation", "deactivation"], make_events([0.9, 0.1])):
+            notification_queue.notify_trigger(alarm, make_plant(), make_contacts(), event, label)
+    notification_queue.close()
+
+    for id_alarm in range(8):
+        assert [label for notified_alarm, label in notifier.notified if notified_alarm == id_alarm] == ["activation", "deactivation"]
+
+
+class FlakyMailer():
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.attempts = 0
+
+    def send_email(self, **kwargs) -> None:
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("connection reset")
+
+
+class CountingSMSAlert():
+    def __init__(self) -> None:
+        self.sent = 0
+
+    def send_sms(self, message, recipients) -> bool:
+        self.sent += 1
+        return True
+
+
+def event_notifier(logger, mailer, sms_alerter) -> EventNotifier:
+    notifier = EventNotifier({"sender_email": "", "sender_password": "", "sender_sms": "", "token_sms": "", "pemfile_sms": ""}, logger)
+    notifier.register_message_builder("threshold", lambda *args: "body", message_label="activation")
+    notifier.mailer = mailer
+    notifier.sms_alerter = sms_alerter
+    return notifier
+
+
+def test_only_failed_channels_are_retried(logger):
+    mailer, sms_alerter = FlakyMailer(failures=2), CountingSMSAlert()
+    notification_queue = NotificationQueue(event_notifier(logger, mailer, sms_alerter), logger, workers=1, retries=3, backoff=0)
+
+    notification_queue.notify_trigger(make_alarm(), make_plant(), make_contacts(), make_events([0.9])[0], "activation")
+    notification_queue.flush()
+
+    assert (mailer.attempts, sms_alerter.sent) == (3, 1)
+    assert (notification_queue.delivered, notification_queue.failed) == (1, 0)
+
+
+def test_other_channels_are_sent_when_a_channel_keeps_failing(logger):
+    mailer, sms_alerter = FlakyMailer(failures=10), CountingSMSAlert()
+    notification_queue = NotificationQueue(event_notifier(logger, mailer, sms_alerter), logger, workers=1, retries=1, backoff=0)
+
+    notification_queue.notify_trigger(make_alarm(), make_plant(), make_contacts(), make_events([0.9])[0], "activation")
+    notification_queue.flush()
+
+    assert (mailer.attempts, sms_alerter.sent) == (2, 1)
+    assert (notification_queue.delivered, notification_queue.failed) == (0, 1)
@@ -0,0 +1,282 @@
+import threading
+import time
+from datetime import timedelta
+from typing import List, Tuple
+
+import pytest
+
+from alarm_system import EventProcessor, Orchestrator
+from alarm_system.interfaces import IConnector, ICoordinator, INotifier, IProcessor
+from alarm_system.src.notifier.collector import CollectingNotifier
+
+from helpers import START, MemoryWatchingConnector, make_alarm, make_contacts, make_events, make_plant, threshold_processor
+
+
+class BoolConnector(IConnector):
+    """
+    connector written before update results existed, which tells whether every alarm was updated
+    """
+
+    def __init__(self, logger, updated: bool) -> None:
+        self.logger = logger
+        self.updated = updated
+        self.alarms = [make_alarm()]
+        self.events = make_events([0.9, 0.1])
+        self.written: List = []
+
+    def load_system_data(self):
+        return self.alarms, [make_plant()], [make_contacts()], self.events
+
+    def update_system_alarms(self, alarms) -> bool:
+        self.written.extend(alarms)
+        return self.updated
+
+
+def orchestrator_for(connector, logger):
+    processor = EventProcessor(logger)
+    processor.register_processor("threshold", threshold_processor)
+    notifier = CollectingNotifier(logger)
+    return Orchestrator(connector, processor, notifier, logger), notifier
+
+
+@pytest.mark.parametrize("updated, outcome", [(True, "updated"), (False, "failed")])
+def test_connectors_returning_bool_are_supported(logger, updated, outcome):
+    connector = BoolConnector(logger, updated)
+    orchestrator, notifier = orchestrator_for(connector, logger)
+
+    orchestrator.execute()
+
+    assert [notification["message_label"] for notification in notifier.collected] == ["activation", "deactivation"]
+    assert connector.written == connector.alarms
+    assert orchestrator.metrics.counter("alarm_updates_total", result=outcome).value == 1
+
+
+class RecordingNotifier(INotifier):
+    def __init__(self, logger) -> None:
+        self.logger = logger
+        self.notified: List[Tuple[str, str, List[str]]] = []
+
+    def notify_trigger(self, alarm, plant, contacts, event, message_label) -> bool:
+        self.notified.append((alarm["event_name"], message_label, contacts["email_contacts"]))
+        return True
+
+
+def run_in_background(orchestrator, **kwargs):
+    stop = threading.Event()
+    thread = threading.Thread(target=orchestrator.run_forever, kwargs={"stop": stop, **kwargs}, daemon=True)
+    thread.start()
+    return stop, thread
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_run_forever_catches_up_then_processes_watched_events(logger):
+    connector = MemoryWatchingConnector(logger, [make_alarm()], make_events([0.9]))
+    notifier = RecordingNotifier(logger)
+    orchestrator, _ = orchestrator_for(connector, logger)
+    orchestrator.notifier = notifier
+
+    stop, thread = run_in_background(orchestrator, flush_interval=0)
+    wait_for(lambda: len(notifier.notified) == 1)
+    for event in make_events([0.1, 0.8], start=START + timedelta(hours=1)):
+        connector.record(event)
+    wait_for(lambda: len(notifier.notified) == 3)
+    stop.set()
+    thread.join(timeout=5)
+
+    assert [label for _, label, _ in notifier.notified] == ["activation", "deactivation", "activation"]
+
+
+def test_run_forever_reloads_alarms_plants_and_contacts(logger):
+    connector = MemoryWatchingConnector(logger, [make_alarm()], [])
+    notifier = RecordingNotifier(logger)
+    orchestrator, _ = orchestrator_for(connector, logger)
+    orchestrator.notifier = notifier
+
+    stop, thread = run_in_background(orchestrator, flush_interval=0, metadata_interval=0.01)
+    wait_for(lambda: connector.sessions == 1)
+
+    # contact changes apply to the next notification without a new session
+    connector.contacts = [{**make_contacts(), "email_contacts": ["new@example.com"]}]
+    time.sleep(0.1)
+    connector.record(make_events([0.9], start=START + timedelta(hours=1))[0])
+    wait_for(lambda: len(notifier.notified) == 1)
+    sessions = connector.sessions
+
+    # new alarms start a new session, which catches up with their pending events
+    connector.alarms = connector.alarms + [make_alarm(2, event_name="other")]
+    connector.events.extend(make_events([0.9], event_name="other"))
+    wait_for(lambda: len(notifier.notified) == 2)
+    stop.set()
+    thread.join(timeout=5)
+
+    assert notifier.notified == [("event", "activation", ["new@example.com"]), ("other", "activation", ["new@example.com"])]
+    assert sessions == 1 and connector.sessions == 2
+
+
+class PlainProcessor(IProcessor):
+    """
+    processor that records no metrics
+    """
+
+    def __init__(self, logger) -> None:
+        self.logger = logger
+
+    def process_event(self, alarm, plant, event):
+        return threshold_processor(alarm, event, self.logger)
+
+
+@pytest.mark.parametrize("processor_type", [EventProcessor, PlainProcessor])
+def test_process_workers_merge_processor_metrics_when_recorded(logger, processor_type):
+    connector = BoolConnector(logger, True)
+    connector.alarms = [make_alarm(id_alarm, plant_name=f"plant_{id_alarm}") for id_alarm in range(2)]
+    connector.events = [event for id_alarm in range(2) for event in make_events([0.9, 0.1], plant_name=f"plant_{id_alarm}")]
+    connector.load_system_data = lambda: (
+        connector.alarms, [make_plant(f"plant_{id_alarm}") for id_alarm in range(2)], [make_contacts(f"plant_{id_alarm}") for id_alarm in range(2)], connector.events
+    )
+    processor = processor_type(logger)
+    if isinstance(processor, EventProcessor):
+        processor.register_processor("threshold", threshold_processor)
+    notifier = CollectingNotifier(logger)
+    orchestrator = Orchestrator(connector, processor, notifier, logger)
+    orchestrator.enable_parallel_processing(2, executor="process")
+
+    orchestrator.execute()
+
+    assert len(notifier.collected) == 4
+    if processor.metrics is not None:
+        assert processor.metrics.histogram("processor_latency_seconds", type_alarm="threshold").count == 4
+
+
+def test_streamed_events_processed_in_parallel_are_checkpointed(logger):
+    plants = ["plant_a", "plant_b"]
+    connector = MemoryWatchingConnector(
+        logger, [make_alarm(idx, plant_name=plant) for idx, plant in enumerate(plants)],
+        [event for plant in plants for event in make_events([0.9, 0.1, 0.9, 0.1], plant_name=plant)],
+    )
+    connector.plants, connector.contacts = [make_plant(plant) for plant in plants], [make_contacts(plant) for plant in plants]
+    streamed = connector.stream_alarm_events
+    # events are handed over lazily, as database cursors do
+    connector.stream_alarm_events = lambda alarm: iter(streamed(alarm))
+    orchestrator, notifier = orchestrator_for(connector, logger)
+    orchestrator.enable_parallel_processing(2)
+    orchestrator.enable_checkpoints(every_events=4)
+
+    orchestrator.execute(streaming=True)
+
+    assert len(notifier.collected) == 8
+    assert orchestrator.metrics.counter("checkpoints_total").value == 2
+
+
+class LazyConnector(MemoryWatchingConnector):
+    """
+    streams the events of every alarm lazily, as database cursors do, counting the events handed over
+    """
+
+    def __init__(self, logger, alarms, events) -> None:
+        super().__init__(logger, alarms, events)
+        self.pulled = 0
+
+    def stream_alarm_events(self, alarm):
+        for event in super().stream_alarm_events(alarm):
+            self.pulled += 1
+            yield event
+
+
+def streaming_setup(logger):
+    event_names = ["event_0", "event_1", "event_2"]
+    connector = LazyConnector(
+        logger, [make_alarm(idx, event_name=event_name) for idx, event_name in enumerate(event_names)],
+        [event for event_name in event_names for event in make_events([0.9, 0.1, 0.2, 0.9, 0.1], event_name=event_name)],
+    )
+    orchestrator, notifier = orchestrator_for(connector, logger)
+
+    # events handed over by the connector and not processed yet, every time an event is processed
+    pending: List[int] = []
+    processed: List[int] = []
+
+    def counting_processor(alarm, event, logger):
+        pending.append(connector.pulled - len(processed))
+        processed.append(1)
+        return threshold_processor(alarm, event, logger)
+
+    orchestrator.processor.register_processor("threshold", counting_processor)
+    return connector, orchestrator, notifier, pending
+
+
+def test_streaming_execution_notifies_and_persists_the_same_as_batch_execution(logger):
+    connector, orchestrator, notifier = streaming_setup(logger)[:3]
+    streamed_connector, streamed_orchestrator, streamed_notifier = streaming_setup(logger)[:3]
+
+    orchestrator.execute()
+    streamed_orchestrator.execute(streaming=True)
+
+    assert len(streamed_notifier.collected) == 12
+    assert streamed_notifier.collected == notifier.collected
+    assert streamed_connector.alarms == connector.alarms
+
+
+def test_streaming_execution_holds_a_single_event_at_a_time(logger):
+    connector, orchestrator, _, pending = streaming_setup(logger)
+
+    orchestrator.execute(streaming=True)
+
+    assert connector.pulled == len(pending) == 15
+    assert set(pending) == {1}
+
+
+def test_alarms_sharing_events_only_process_the_ones_after_their_own_last_event(logger):
+    # connectors load the events of both alarms from the oldest last event
+    connector = MemoryWatchingConnector(
+        logger, [make_alarm(1, type_alarm="threshold"), make_alarm(2, type_alarm="threshold", last_event=START + timedelta(minutes=2))],
+        make_events([0.9, 0.1, 0.2, 0.9]),
+    )
+    orchestrator, notifier = orchestrator_for(connector, logger)
+
+    orchestrator.execute()
+
+    assert [(notification["id_alarm"], notification["timestamp"]) for notification in notifier.collected] == [
+        (1, START), (1, START + timedelta(minutes=1)), (1, START + timedelta(minutes=3)), (2, START + timedelta(minutes=3)),
+    ]
+
+
+class RecordingCoordinator(ICoordinator):
+    def __init__(self, logger) -> None:
+        self.logger = logger
+        self.calls: List[str] = []
+
+    def join(self) -> None:
+        self.calls.append("join")
+
+    def leave(self) -> None:
+        self.calls.append("leave")
+
+    def owns(self, alarm) -> bool:
+        return True
+
+    def ownership_changed(self) -> bool:
+        return False
+
+    def rebalance(self) -> None:
+        self.calls.append("rebalance")
+
+
+def test_failed_runs_give_up_the_alarms_of_the_coordinator(logger):
+    connector = BoolConnector(logger, True)
+    orchestrator, _ = orchestrator_for(connector, logger)
+    coordinator = RecordingCoordinator(logger)
+    orchestrator.enable_coordination(coordinator)
+
+    orchestrator.execute()
+    succeeded = list(coordinator.calls)
+    connector.load_system_data = lambda: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        orchestrator.execute()
+
+    assert succeeded == ["join", "rebalance", "rebalance"]
+    assert coordinator.calls[len(succeeded):] == ["join", "rebalance", "leave"]
@@ -0,0 +1,87 @@
+import os
+from typing import List
+
+import pytest
+
+from alarm_system import EventNotifier, FileOutbox, OutboxNotifier
+from alarm_system.src.notifier.outbox import outbox_key
+
+from helpers import START, make_alarm, make_contacts, make_events, make_plant
+
+
+def test_entries_are_synced_to_disk_and_loaded_back(tmp_path, logger, monkeypatch):
+    synced: List[int] = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+    path = str(tmp_path / "outbox.jsonl")
+    key = ("1", START, "activation")
+
+    outbox = FileOutbox(path, logger)
+    outbox.add(key)
+    outbox.close()
+
+    assert len(synced) == 1
+    assert FileOutbox(path, logger).contains(key)
+
+
+class RecordingMailer():
+    def __init__(self) -> None:
+        self.subjects: List[str] = []
+
+    def send_email(self, to, subject, body, attachments) -> None:
+        self.subjects.append(subject)
+
+
+def test_notifications_held_for_a_digest_are_recorded_once_sent(tmp_path, logger):
+    notifier = EventNotifier({"sender_email": "", "sender_password": "", "sender_sms": "", "token_sms": "", "pemfile_sms": ""}, logger)
+    notifier.register_message_builder("threshold", lambda *args: "body", message_label="activation")
+    notifier.coalesce_notifications(3600)
+    notifier.mailer = RecordingMailer()
+    outbox = FileOutbox(str(tmp_path / "outbox.jsonl"), logger)
+    outbox_notifier = OutboxNotifier(notifier, outbox, logger)
+    alarm, contacts = make_alarm(), {**make_contacts(), "phone_contacts": []}
+    keys = [outbox_key(alarm, event, "activation") for event in make_events([0.9, 0.9, 0.9])]
+
+    for event in make_events([0.9, 0.9, 0.9]):
+        outbox_notifier.notify_trigger(alarm, make_plant(), contacts, event, "activation")
+
+    assert [outbox.contains(key) for key in keys] == [True, False, False]
+
+    outbox_notifier.flush()
+
+    assert [outbox.contains(key) for key in keys] == [True, True, True]
+    assert len(notifier.mailer.subjects) == 2
+
+
+class RejectingSMSAlert():
+    """
+    sms alerter whose gateway rejects the first messages
+    """
+
+    def __init__(self, rejections: int) -> None:
+        self.rejections = rejections
+        self.attempts = 0
+
+    def send_sms(self, message, recipients) -> bool:
+        self.attempts += 1
+        return self.attempts > self.rejections
+
+
+def test_notifications_whose_sms_is_rejected_are_retried_and_not_recorded(tmp_path, logger):
+    notifier = EventNotifier({"sender_email": "", "sender_password": "", "sender_sms": "", "token_sms": "", "pemfile_sms": ""}, logger)
+    notifier.register_message_builder("threshold", lambda *args: "body", message_label="activation")
+    notifier.mailer = RecordingMailer()
+    notifier.sms_alerter = RejectingSMSAlert(rejections=3)
+    notifier.retry_deliveries(1, 0)
+    outbox = FileOutbox(str(tmp_path / "outbox.jsonl"), logger)
+    outbox_notifier = OutboxNotifier(notifier, outbox, logger)
+    alarm = make_alarm()
+    rejected, accepted = make_events([0.9, 0.9])
+
+    with pytest.raises(RuntimeError):
+        outbox_notifier.notify_trigger(alarm, make_plant(), make_contacts(), rejected, "activation")
+    outbox_notifier.notify_trigger(alarm, make_plant(), make_contacts(), accepted, "activation")
+
+    assert notifier.sms_alerter.attempts == 4
+    assert not outbox.contains(outbox_key(alarm, rejected, "activation"))
+    assert outbox.contains(outbox_key(alarm, accepted, "activation"))
+    assert notifier.metrics.counter("notifications_failed_total", channel="sms").value == 3
@@ -0,0 +1,105 @@
+from datetime import timedelta
+from typing import List
+
+import pytest
+
+from alarm_system import EventProcessor, Orchestrator
+from alarm_system.src.notifier.collector import CollectingNotifier
+
+from helpers import START, MemoryWatchingConnector, make_alarm, make_events, threshold_processor
+
+
+END = START + timedelta(hours=2)
+
+
+class ReplayedConnector(MemoryWatchingConnector):
+    """
+    records the alarms it is asked to persist, which replays must never do
+    """
+
+    def __init__(self, logger, alarms, events) -> None:
+        super().__init__(logger, alarms, events)
+        self.written: List = []
+
+    def update_system_alarms(self, alarms):
+        self.written.extend(alarms)
+        return super().update_system_alarms(alarms)
+
+
+def replay(logger, alarms, events, **kwargs):
+    connector = ReplayedConnector(logger, alarms, events)
+    processor = EventProcessor(logger)
+    processor.register_processor("threshold", threshold_processor)
+    sink = CollectingNotifier(logger)
+    orchestrator = Orchestrator(connector, processor, CollectingNotifier(logger), logger)
+
+    orchestrator.replay(START, END, sink, **kwargs)
+
+    return [(notification["id_alarm"], notification["timestamp"] - START, notification["message_label"]) for notification in sink.collected], connector
+
+
+def minutes(value: int) -> timedelta:
+    return timedelta(minutes=value)
+
+
+# active from 10 to 70 minutes, every 10 minutes
+EVENTS = make_events([0.9] * 7 + [0.1] * 5, start=START + minutes(10), step=minutes(10))
+
+
+def test_replaying_whole_alarms_gives_the_triggers_of_a_sequential_run(logger):
+    replayed, _ = replay(logger, [make_alarm()], EVENTS + make_events([0.9], start=END + minutes(1)), workers=1)
+
+    assert replayed == [(1, minutes(10), "activation"), (1, minutes(80), "deactivation")]
+
+
+@pytest.mark.parametrize("warmup, expected", [
+    # the second chunk starts from the current alarm state, and activates again
+    (timedelta(0), [(1, minutes(10), "activation"), (1, minutes(70), "activation"), (1, minutes(80), "deactivation")]),
+    # triggers of the warmup before the second chunk are not reported, but bring its state up to date
+    (minutes(30), [(1, minutes(10), "activation"), (1, minutes(80), "deactivation")]),
+])
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_chunks_are_replayed_from_the_state_reached_in_their_warmup(logger, warmup, expected, executor):
+    replayed, _ = replay(logger, [make_alarm()], EVENTS, chunk=timedelta(hours=1), warmup=warmup, workers=2, executor=executor)
+
+    assert replayed == expected
+
+
+def test_initial_state_is_set_before_every_chunk(logger):
+    active_alarm = make_alarm(flag_alarm=True)
+
+    replayed, _ = replay(logger, [active_alarm], EVENTS, workers=1)
+    replayed_from_initial_state, _ = replay(logger, [active_alarm], EVENTS, initial_state={"flag_alarm": False}, workers=1)
+
+    assert replayed == [(1, minutes(80), "deactivation")]
+    assert replayed_from_initial_state == [(1, minutes(10), "activation"), (1, minutes(80), "deactivation")]
+
+
+def test_only_alarms_passing_the_filter_are_replayed(logger):
+    alarms = [make_alarm(1), make_alarm(2, event_name="other")]
+    events = EVENTS + make_events([0.9], event_name="other", start=START + minutes(5))
+
+    replayed, _ = replay(logger, alarms, events, alarm_filter=lambda alarm: alarm["id_alarm"] == 2, workers=1)
+
+    assert replayed == [(2, minutes(5), "activation")]
+
+
+def test_notifications_are_collected_in_alarm_order_then_timestamp_order(logger):
+    event_names = [f"event_{idx}" for idx in range(5)]
+    alarms = [make_alarm(idx, event_name=event_name) for idx, event_name in enumerate(event_names)]
+    events = [event for event_name in reversed(event_names) for event in make_events([0.9, 0.1] * 6, event_name=event_name, start=START + minutes(1), step=minutes(10))]
+
+    replayed, _ = replay(logger, alarms, events, chunk=minutes(20), workers=4)
+
+    assert len(replayed) == 5 * 12
+    assert replayed == sorted(replayed, key=lambda notification: (notification[0], notification[1]))
+
+
+def test_replays_never_persist_alarm_state(logger):
+    alarm = make_alarm()
+
+    replayed, connector = replay(logger, [alarm], EVENTS, chunk=timedelta(hours=1), initial_state={"flag_alarm": True}, workers=2)
+
+    assert replayed
+    assert connector.written == []
+    assert connector.alarms == [make_alarm()]
@@ -0,0 +1,48 @@
+import pytest
+
+from alarm_system.src.notifier.sms_alerter import SMSAlert
+
+from benchmarks.standins import LocalSMSGateway
+
+
+def sms_alerter(logger, gateway: LocalSMSGateway, **options) -> SMSAlert:
+    return SMSAlert(sender="alarms", token="token", pemfile="", logger=logger, url=gateway.url, **{"backoff": 0, **options})
+
+
+def test_messages_are_sent_in_batches(logger):
+    with LocalSMSGateway() as gateway:
+        alerter = sms_alerter(logger, gateway, batch_size=2)
+        sent = alerter.send_sms_batch([(f"message {idx}", [34600000000 + idx]) for idx in range(5)])
+        alerter.close()
+
+    assert sent == 5
+    assert [len(payload) for payload in gateway.payloads] == [2, 2, 1]
+    assert gateway.payloads[0][1] == {"sender": "alarms", "message": "message 1", "recipients": [{"msisdn": 34600000001}]}
+
+
+@pytest.mark.parametrize("statuses, sent, requests", [([503, 429], True, 3), ([503] * 4, False, 4), ([400], False, 1)])
+def test_unavailable_gateways_are_retried(logger, statuses, sent, requests):
+    with LocalSMSGateway(statuses=statuses) as gateway:
+        alerter = sms_alerter(logger, gateway, retries=3)
+        result = alerter.send_sms("message", [34600000000])
+        alerter.close()
+
+    assert (result, gateway.requests) == (sent, requests)
+
+
+def test_timeouts_are_reported_as_failed_deliveries(logger):
+    with LocalSMSGateway(latency=0.5) as gateway:
+        alerter = sms_alerter(logger, gateway, timeout=0.05, retries=0)
+        result = alerter.send_sms("message", [34600000000])
+        alerter.close()
+
+    assert result is False
+
+
+def test_unreachable_gateways_are_reported_as_failed_deliveries(logger):
+    with LocalSMSGateway() as gateway:
+        url = gateway.url
+
+    alerter = SMSAlert(sender="alarms", token="token", pemfile="", logger=logger, url=url, retries=0)
+
+    assert alerter.send_sms("message", [34600000000]) is False
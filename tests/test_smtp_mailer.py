@@ -0,0 +1,59 @@
+import threading
+from email import message_from_bytes, policy
+
+from alarm_system.src.notifier.smtp_mailer import SMTPMailer
+
+from benchmarks.standins import LocalSMTPServer
+
+
+def smtp_mailer(logger, server: LocalSMTPServer, **options) -> SMTPMailer:
+    return SMTPMailer("alarms@example.com", "", "127.0.0.1", logger, port=server.port, security="none", timeout=5, **options)
+
+
+def test_connections_are_reused(logger):
+    with LocalSMTPServer() as server:
+        mailer = smtp_mailer(logger, server, pool_size=2)
+        for idx in range(5):
+            mailer.send_email(to=["a@example.com", "b@example.com"], subject=f"alarm {idx}", body="body", attachments={})
+
+        threads = [threading.Thread(target=mailer.send_email, args=(["a@example.com"], "alarm", "body", {})) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        mailer.close()
+
+    assert (server.messages, server.recipients) == (13, 18)
+    assert server.sessions == mailer.pool.connections_opened <= 2
+
+
+def test_emails_are_sent_again_over_a_new_connection_when_the_server_closed_it(logger):
+    with LocalSMTPServer() as server:
+        mailer = smtp_mailer(logger, server, pool_size=1)
+        mailer.send_email(to=["a@example.com"], subject="first", body="body", attachments={})
+
+        server.disconnect()
+        mailer.send_email(to=["a@example.com"], subject="second", body="body", attachments={})
+        mailer.close()
+
+    assert (server.sessions, server.messages) == (2, 2)
+    assert message_from_bytes(server.received[-1], policy=policy.default)["Subject"] == "second"
+
+
+def test_messages_hold_the_body_and_attachments(logger, tmp_path):
+    image = tmp_path / "cached.png"
+    image.write_bytes(bytes(range(256)) * 10)
+
+    with LocalSMTPServer() as server:
+        mailer = smtp_mailer(logger, server)
+        mailer.send_email(to=["a@example.com", "b@example.com"], subject="Alarm event triggered", body=".starts with a dot\nsecond line",
+                          attachments={str(image): "inference.png", str(tmp_path / "missing.png"): "original.png"})
+        mailer.close()
+
+    message = message_from_bytes(server.received[-1], policy=policy.default)
+    attachments = list(message.iter_attachments())
+
+    assert (message["Subject"], message["From"], message["To"]) == ("Alarm event triggered", "alarms@example.com", "a@example.com, b@example.com")
+    assert message.get_body(("plain",)).get_content().splitlines() == [".starts with a dot", "second line"]
+    assert [(attachment.get_filename(), attachment.get_content_type()) for attachment in attachments] == [("inference.png", "image/png")]
+    assert attachments[0].get_content() == image.read_bytes()
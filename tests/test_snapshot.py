@@ -0,0 +1,111 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+from alarm_system import EventProcessor, RingBuffer, SlidingAggregate, SlidingCounter, Window
+from alarm_system.src.core.parallel import alarm_triggers
+from alarm_system.src.core.snapshot import CopyOnWriteAlarm, WindowState
+
+from helpers import START, make_alarm, make_events, make_plant
+
+
+def test_changes_reach_the_alarm_only_once_committed():
+    alarm = make_alarm(tags=["a"], limits={"high": 1})
+    working_alarm = CopyOnWriteAlarm(alarm)
+
+    working_alarm["tags"].append("b")
+    working_alarm.get("limits")["high"] = 2
+    working_alarm["flag_alarm"] = True
+    del working_alarm["last_alarm"]
+
+    assert isinstance(working_alarm, dict)
+    assert json.loads(json.dumps(working_alarm, default=str))["tags"] == ["a", "b"]
+    assert (alarm["tags"], alarm["limits"], alarm["flag_alarm"], "last_alarm" in alarm) == (["a"], {"high": 1}, False, True)
+
+    before_commit = dict(alarm)
+    working_alarm.commit()
+
+    assert (alarm["tags"], alarm["limits"], alarm["flag_alarm"], "last_alarm" in alarm) == (["a", "b"], {"high": 2}, True, False)
+    assert before_commit["tags"] == ["a"]
+
+
+recent = RingBuffer("recent", 3, "value")
+per_hour = SlidingCounter("per_hour", timedelta(hours=1))
+
+
+def burst_processor(alarm, event, logger):
+    """
+    notifies when three events arrive within an hour
+    """
+    return "burst" if per_hour.count(alarm, event["timestamp"]) >= 3 else False
+
+
+def test_triggers_hold_the_alarm_windows_before_the_event(logger):
+    processor = EventProcessor(logger)
+    processor.register_processor("burst", burst_processor, windows=[recent, per_hour])
+    alarm = make_alarm(type_alarm="burst")
+
+    triggers = list(alarm_triggers(processor, alarm, make_plant(), make_events([0.1, 0.2, 0.3, 0.4], start=START)))
+
+    assert [(recent.values(alarm_before_event), per_hour.count(alarm_before_event, event["timestamp"])) for alarm_before_event, event, _ in triggers] == [
+        ([0.1, 0.2], 2),
+        ([0.1, 0.2, 0.3], 3),
+    ]
+    assert recent.values(alarm) == [0.2, 0.3, 0.4]
+
+
+class LatestValue(Window):
+    """
+    window relying on the default checkpoint and rollback
+    """
+
+    def empty(self):
+        return [None]
+
+    def restore(self, state):
+        return state
+
+    def update(self, state, event):
+        state[0] = event["value"]
+
+
+@pytest.mark.parametrize("window", [
+    RingBuffer("recent", 2, "value"),
+    SlidingCounter("counter", timedelta(hours=1), buckets=4),
+    SlidingAggregate("aggregate", "value", timedelta(hours=1), buckets=4),
+    LatestValue("latest"),
+], ids=repr)
+def test_rolled_back_updates_leave_the_window_state_as_it_was(window):
+    # events in the same bucket, in later buckets, past the whole window, too old to count and without value
+    offsets = [0, 5, 20, 40, 200, 60, 210, 215, 400]
+    events = [{"timestamp": START + timedelta(minutes=offset), "value": None if offset == 215 else offset} for offset in offsets]
+    state = window.empty()
+
+    for event in events:
+        before = WindowState(state=state).copy()["state"]
+        checkpoint = window.checkpoint(state, event)
+        window.update(state, event)
+        rolled_back = WindowState(state=state).copy()["state"]
+        window.rollback(rolled_back, checkpoint)
+
+        assert rolled_back == before
+
+
+@pytest.mark.parametrize("size", [10, 10_000])
+def test_window_states_are_only_copied_for_triggering_events(logger, monkeypatch, size):
+    copies = []
+    copy = WindowState.copy
+    monkeypatch.setattr(WindowState, "copy", lambda state: copies.append(state) or copy(state))
+    large = RingBuffer("recent", size, "value")
+    processor = EventProcessor(logger)
+    processor.register_processor("threshold", lambda alarm, event, logger: "high" if event["value"] > 0.5 else False, windows=[large])
+    alarm = make_alarm()
+    values = [0.1] * 200 + [0.9] + [0.1] * 200
+
+    triggers = list(alarm_triggers(processor, alarm, make_plant(), make_events(values)))
+
+    # processing costs the same regardless of the size of the windows, which are only copied for the snapshot of a trigger
+    assert len(copies) == len(triggers) == 1
+    assert large.values(triggers[0][0]) == values[:200][-size:]
+    assert large.values(alarm) == values[-size:]